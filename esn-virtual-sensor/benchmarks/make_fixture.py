@@ -0,0 +1,42 @@
+import os
+import sys
+import numpy as np
+from config import SEQ_LENGTH, LABELS
+
+# Builds the small .tflite model bundled as a benchmark fixture. Only needed
+# to regenerate benchmarks/fixtures/tiny_model.tflite, requires tensorflow.
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "tiny_model.tflite")
+N_CHANNELS = 6
+
+
+def build_tiny_model():
+    # plain tf ops rather than a Keras model, so the converter does not depend
+    # on the installed Keras version. The batch dimension is dynamic, so the
+    # model also serves TFModelManager.predict_batch
+    import tensorflow as tf
+
+    rng = np.random.default_rng(0)
+    n_inputs, n_hidden = SEQ_LENGTH * N_CHANNELS, 16
+    w1 = tf.constant(rng.normal(0, 0.1, (n_inputs, n_hidden)).astype("float32"))
+    b1 = tf.constant(np.zeros(n_hidden, dtype="float32"))
+    w2 = tf.constant(rng.normal(0, 0.1, (n_hidden, len(LABELS))).astype("float32"))
+    b2 = tf.constant(np.zeros(len(LABELS), dtype="float32"))
+
+    class TinyModel(tf.Module):
+        @tf.function(input_signature=[tf.TensorSpec([None, SEQ_LENGTH, N_CHANNELS], tf.float32)])
+        def __call__(self, x):
+            hidden = tf.nn.relu(tf.matmul(tf.reshape(x, [-1, n_inputs]), w1) + b1)
+            return tf.nn.softmax(tf.matmul(hidden, w2) + b2)
+
+    model = TinyModel()
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([model.__call__.get_concrete_function()], model)
+    return converter.convert()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else FIXTURE_PATH
+    tflite_model = build_tiny_model()
+    with open(path, "wb") as f:
+        f.write(tflite_model)
+    print(f"Wrote {len(tflite_model)} bytes to {path}")
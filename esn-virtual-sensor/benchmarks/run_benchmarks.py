@@ -0,0 +1,321 @@
+import os
+import io
+import sys
+import gzip
+import json
+import time
+import base64
+import random
+import argparse
+import platform
+import statistics
+import contextlib
+import numpy as np
+
+# Micro- and macro-benchmarks of the device hot paths. No broker or network
+# is needed. Run from the esn-virtual-sensor directory:
+#
+#   python -m benchmarks.run_benchmarks results.json
+#   python -m benchmarks.run_benchmarks results.json --baseline baseline.json --threshold 0.1
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "tiny_model.tflite")
+DEFAULT_THRESHOLD = 0.10
+
+
+class NullMQTTClient:
+    """
+    Stands in for MQTTClient, published messages are only counted.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.messages = 0
+        self.bytes = 0
+
+    def publish(self, topic, payload, qos=1):
+        self.messages += 1
+        self.bytes += len(topic) + len(payload)
+
+
+def encoded_fixture_model(path=FIXTURE_PATH):
+    with open(path, "rb") as f:
+        model = f.read()
+    return base64.b64encode(gzip.compress(model)).decode(), len(model)
+
+
+def _time(func, repeats, number):
+    """
+    Runs func number times per repeat, returns the per-call times in us.
+    """
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    return samples
+
+
+def _summary(samples, number):
+    return {
+        "median_us": statistics.median(samples),
+        "mean_us": statistics.fmean(samples),
+        "min_us": min(samples),
+        "max_us": max(samples),
+        "repeats": len(samples),
+        "number": number,
+    }
+
+
+def _working_device(name="ESP32_BENCH", sensor_config=None, model=None):
+    """
+    A working device, configured and given the (tf_model_b64, tf_model_bytesize)
+    model while it is still unlocked, as a provisioning would.
+    """
+    from virtual_device import EdgeSensor
+
+    device = EdgeSensor(name=name)
+    device.trigger_startup_event()
+    if sensor_config is not None:
+        device.set_sensor_config(sensor_config)
+    if model is not None:
+        device.update_model(*model)
+    device.trigger_settings_locked_event()
+    device.trigger_sensor_started_event()
+    return device
+
+
+# --- Benchmarks --- each one returns (setup-free callable, repeats, number) or None if skipped
+
+
+def bench_measurement_handler_startup():
+    from dataset import MeasurementHandler, load_sequences
+    # the dataset is cached per process, time the uncached load
+    return lambda: MeasurementHandler(load_sequences()), 3, 1
+
+
+def bench_measure():
+    device = _working_device()
+    return device.measure, 5, 200
+
+
+def bench_synthetic_block():
+    from dataset.synthetic import SyntheticGenerator
+    generator = SyntheticGenerator(seed=0)
+    return generator.block, 5, 20
+
+
+def bench_tf_predict():
+    try:
+        from inference.tf_model_manager import TFModelManager
+        model_manager = TFModelManager()
+        model_manager.update_model(*encoded_fixture_model())
+    except ImportError as e:
+        print(f"Skipping tf_predict: {e}")
+        return None
+    measurement = _working_device().measure()
+    return lambda: model_manager.predict(measurement), 5, 200
+
+
+def bench_device_mqtt_payload():
+    from main import device_mqtt_payload, device_offload
+    device = _working_device()
+    measurement = device.measure()
+    descriptor = device_offload(device, 1)
+    return lambda: device_mqtt_payload(device, measurement, descriptor), 5, 200
+
+
+def bench_feature_extraction():
+    device = _working_device()
+    device.set_feature_set(["mean", "std", "rms", "ptp", "fft_bands"], False, 4)
+    measurement = device.measure()
+    return lambda: device.extract_features(measurement), 5, 200
+
+
+def bench_device_mqtt_payload_features():
+    from main import device_mqtt_payload, device_offload
+    device = _working_device()
+    device.set_feature_set(["mean", "std", "rms", "ptp", "fft_bands"], False, 4)
+    measurement = device.measure()
+    descriptor = device_offload(device, 1)
+    return lambda: device_mqtt_payload(device, measurement, descriptor, device.extract_features(measurement)), 5, 200
+
+
+def bench_command_handling():
+    from mqtt_client.command import CommandFactory
+    device = _working_device()
+    commands = [
+        ("get", "sensor-state", {"sensor-state": None}),
+        ("get", "inference-layer", {"inference-layer": None}),
+        ("get", "sensor-config", {"sensor-config": None}),
+        ("set", "inference-layer", {"inference-layer": 0}),
+        ("set", "sensor-state", {"sensor-state": "working"}),
+    ]
+
+    def handle_all():
+        for method, resource_name, payload in commands:
+            CommandFactory.create_command(method, resource_name, payload).handle(device=device, uuid="bench")
+
+    return handle_all, 5, 200
+
+
+def _provisioning_operations():
+    # unlocked -> working with a config, a layer and a model
+    try:
+        import tensorflow  # noqa: F401
+        tf_model_b64, tf_model_bytesize = encoded_fixture_model()
+        model = [("sensor-model", "set", {"tf_model_b64": tf_model_b64, "tf_model_bytesize": tf_model_bytesize})]
+    except ImportError as e:
+        print(f"Provisioning without a model: {e}")
+        model = []
+    return [
+        ("sensor-config", "set", {"sleep_interval_ms": 1000}),
+        ("inference-layer", "set", 0),
+        *model,
+        ("sensor-state", "set", "locked"),
+        ("sensor-state", "set", "working"),
+        ("sensor-state", "get", None),
+    ]
+
+
+def bench_provision_sequential():
+    from virtual_device import EdgeSensor
+    from mqtt_client.command import CommandFactory
+    operations = _provisioning_operations()
+
+    def provision():
+        device = EdgeSensor(name="ESP32_BENCH")
+        device.trigger_startup_event()
+        for resource_name, method, value in operations:
+            CommandFactory.create_command(method, resource_name, {resource_name: value}).handle(device=device, uuid="bench")
+
+    return provision, 5, 20
+
+
+def bench_provision_batch():
+    from virtual_device import EdgeSensor
+    from mqtt_client.command import CommandFactory
+    payload = {"batch": [{"resource": r, "method": m, "value": v} for r, m, v in _provisioning_operations()]}
+
+    def provision():
+        device = EdgeSensor(name="ESP32_BENCH")
+        device.trigger_startup_event()
+        CommandFactory.create_command("set", "batch", payload).handle(device=device, uuid="bench")
+
+    return provision, 5, 20
+
+
+def bench_full_cycle():
+    from main import device_predict, device_offload, device_mqtt_payload
+    from config import SENSOR_INFERENCE_LAYER
+    sensor_config = {"sleep_interval_ms": 0}
+    try:
+        device = _working_device(sensor_config=sensor_config, model=encoded_fixture_model())
+    except ImportError as e:
+        print(f"Full cycle without on-device inference: {e}")
+        device = _working_device(sensor_config=sensor_config)
+    mqtt_client = NullMQTTClient(device)
+    model_loaded = device.get_model_bytes() is not None
+
+    def cycle():
+        # working branch of main.py, without deep sleep or network
+        measurement = device.measure()
+        inference_layer = device.get_inference_layer()
+        if inference_layer == SENSOR_INFERENCE_LAYER and model_loaded:
+            inference_descriptor = device_predict(device, measurement)
+        else:
+            inference_descriptor = device_offload(device, inference_layer)
+        payload = device_mqtt_payload(device, measurement, inference_descriptor)
+        mqtt_client.publish(f"export/{device.name}/sensor-data", payload, qos=0)
+        device.update_cycle_counter()
+
+    return cycle, 5, 100
+
+
+BENCHMARKS = {
+    "measurement_handler_startup": bench_measurement_handler_startup,
+    "measure": bench_measure,
+    "synthetic_block": bench_synthetic_block,
+    "tf_predict": bench_tf_predict,
+    "device_mqtt_payload": bench_device_mqtt_payload,
+    "feature_extraction": bench_feature_extraction,
+    "device_mqtt_payload_features": bench_device_mqtt_payload_features,
+    "command_handling": bench_command_handling,
+    "provision_sequential": bench_provision_sequential,
+    "provision_batch": bench_provision_batch,
+    "full_cycle": bench_full_cycle,
+}
+
+
+def run(selected=None):
+    random.seed(0)
+    np.random.seed(0)
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if selected and name not in selected:
+            continue
+        # the device code prints on every call, keep it out of the timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            prepared = bench()
+            if prepared is None:
+                continue
+            func, repeats, number = prepared
+            func()  # warm-up
+            samples = _time(func, repeats, number)
+        results[name] = _summary(samples, number)
+        print(f"{name:<30} median {results[name]['median_us']:>12.1f} us")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns the benchmarks whose median got slower than the baseline by more
+    than threshold (relative).
+    """
+    regressions = []
+    for name, current in results["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        change = current["median_us"] / previous["median_us"] - 1
+        status = "REGRESSION" if change > threshold else "ok"
+        print(f"{name:<30} {previous['median_us']:>12.1f} -> {current['median_us']:>12.1f} us ({change:+.1%}) {status}")
+        if change > threshold:
+            regressions.append({"name": name, "baseline_us": previous["median_us"], "current_us": current["median_us"], "change": change})
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Device hot path benchmarks")
+    parser.add_argument("output", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown of the median flagged as a regression")
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS), help="run only this benchmark (repeatable)")
+    args = parser.parse_args(argv)
+
+    results = run(args.only)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results["regressions"] = compare(results, baseline, args.threshold)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if results.get("regressions"):
+        print(f"{len(results['regressions'])} regression(s) beyond {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
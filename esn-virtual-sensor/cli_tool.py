@@ -1,10 +1,15 @@
 import sys
 import os
+import gc
+import zlib
 import random
 import json
+import select
+import argparse
 import subprocess
 import signal
 import time
+import numpy as np
 
 def generate_device_names(n):
     # case 1: devices.json exists
@@ -25,6 +30,138 @@ def generate_device_names(n):
         json.dump(device_names, f)
     return device_names
 
+class ForkedProcess:
+    """
+    A device worker forked by the fork server, with the Popen methods the launcher uses.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def send_signal(self, sig):
+        try:
+            os.kill(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def wait(self):
+        try:
+            os.waitpid(self.pid, 0)
+        except ChildProcessError:
+            pass
+
+
+def _run_forked_device(device_name, model_bytes, ready_fd):
+    # only the device-specific parts are set up after the fork, everything
+    # else was prepared by the fork server and is shared copy-on-write
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    seed = zlib.crc32(device_name.encode())
+    random.seed(seed)
+    np.random.seed(seed)
+
+    from main import run_device
+    from mqtt_client import MQTTClient, ready_notifier
+    from virtual_device import EdgeSensor
+
+    device = EdgeSensor(name=device_name)
+    if model_bytes is not None:
+        # tensorflow is imported here, after the fork: its threads and
+        # runtime state do not survive a fork of an initialised parent
+        device.load_model_bytes(model_bytes)
+    mqtt_client = MQTTClient(device=device)
+    if ready_fd is not None:
+        mqtt_client.on_first_connect = ready_notifier(ready_fd)
+    try:
+        run_device(mqtt_client)
+    except KeyboardInterrupt:
+        pass
+
+
+def fork_server(device_names, workers, model_path=None, ready_fd=None):
+    """
+    Does the imports, the dataset preparation and the model file reading once,
+    then forks one worker per device that inherits them. Every worker is
+    appended to workers as soon as it is forked, so an interrupted startup
+    can still signal the ones already running. The model itself is loaded by
+    each worker, tensorflow is never imported before a fork.
+    """
+    import main  # imports pandas, pydantic, paho and transitions
+    from dataset import shared_sequences
+    shared_sequences()
+
+    model_bytes = None
+    if model_path is not None:
+        with open(model_path, "rb") as f:
+            model_bytes = f.read()
+
+    # keep the garbage collector from touching, and so copying, the shared objects
+    gc.collect()
+    gc.freeze()
+
+    for device_name in device_names:
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                _run_forked_device(device_name, model_bytes, ready_fd)
+            except Exception as e:
+                print(f"Device {device_name} failed: {e}")
+                status = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        workers.append(ForkedProcess(pid))
+    return workers
+
+
+def _memory_kb(pid):
+    """
+    (RSS, PSS) of a process in kB. PSS splits the shared pages between the
+    processes sharing them, so it sums to the real footprint of a fleet.
+    """
+    rss = pss = 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    rss = int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def measure_startup(ready_fd, n, started_at, pids, timeout_s):
+    """
+    Waits until the n devices reported their first connection on the pipe,
+    returns the time it took and the memory of the launched processes.
+    """
+    connected, buffer = 0, b""
+    deadline = started_at + timeout_s
+    while connected < n:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 or not select.select([ready_fd], [], [], remaining)[0]:
+            break
+        chunk = os.read(ready_fd, 4096)
+        if not chunk:
+            break
+        buffer += chunk
+        connected = buffer.count(b"\n")
+    elapsed = time.perf_counter() - started_at
+
+    memory = [_memory_kb(pid) for pid in pids]
+    return {
+        "devices": n,
+        "connected": connected,
+        "time_to_all_connected_s": elapsed if connected == n else None,
+        "elapsed_s": elapsed,
+        "total_rss_mb": sum(rss for rss, _ in memory) / 1024,
+        "total_pss_mb": sum(pss for _, pss in memory) / 1024,
+    }
+
+
 def signal_handler(signal, frame):
     print("\nCtrl+C detected, terminating subprocesses...")
     for proc in processes:
@@ -33,15 +170,16 @@ def signal_handler(signal, frame):
     sys.exit(0)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 cli_tool.py <n>")
-        sys.exit(1)
-
-    try:
-        n = int(sys.argv[1])
-    except ValueError:
-        print("Please provide a valid integer for the number of subprocesses.")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Launches one process per device")
+    parser.add_argument("n", type=int, help="number of devices")
+    parser.add_argument("--mode", choices=["subprocess", "fork"], default="subprocess",
+                        help="subprocess: one python main.py per device, fork: fork warm workers from one prepared server")
+    parser.add_argument("--model", help="fork mode: .tflite model read by the server and loaded by every device")
+    parser.add_argument("--measure", action="store_true", help="report time-to-all-connected and memory of the fleet")
+    parser.add_argument("--measure-timeout", type=float, default=600)
+    parser.add_argument("--report", help="JSON file for the --measure report")
+    args = parser.parse_args(sys.argv[1:])
+    n = args.n
 
     if n <= 0:
         print("The number of subprocesses must be greater than 0.")
@@ -49,13 +187,40 @@ if __name__ == "__main__":
 
     device_names = generate_device_names(n)
     processes = []
+    ready_read_fd = ready_write_fd = None
+    if args.measure:
+        ready_read_fd, ready_write_fd = os.pipe()
 
     signal.signal(signal.SIGINT, signal_handler)
 
     try:
-        for device_name in device_names:
-            proc = subprocess.Popen([sys.executable, "main.py", device_name])
-            processes.append(proc)
+        started_at = time.perf_counter()
+        if args.mode == "fork":
+            fork_server(device_names, processes, args.model, ready_write_fd)
+        else:
+            env = os.environ.copy()
+            if ready_write_fd is not None:
+                env["LAUNCHER_READY_FD"] = str(ready_write_fd)
+            for device_name in device_names:
+                proc = subprocess.Popen(
+                    [sys.executable, "main.py", device_name],
+                    pass_fds=() if ready_write_fd is None else (ready_write_fd,),
+                    env=env,
+                )
+                processes.append(proc)
+
+        if args.measure:
+            os.close(ready_write_fd)
+            pids = [proc.pid for proc in processes]
+            if args.mode == "fork":
+                # the server holds the shared state
+                pids.append(os.getpid())
+            report = {"mode": args.mode, **measure_startup(ready_read_fd, n, started_at, pids, args.measure_timeout)}
+            print(json.dumps(report, indent=2))
+            if args.report:
+                with open(args.report, "w") as f:
+                    json.dump(report, f, indent=2)
+
         for proc in processes:
             proc.wait()
     except Exception as e:
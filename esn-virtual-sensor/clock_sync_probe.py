@@ -0,0 +1,103 @@
+import sys
+import json
+import time
+import uuid
+import threading
+import paho.mqtt.client as mqtt
+from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT
+from virtual_device.clock import now_us
+
+# Backend side of the clock-sync resource. Every probe carries the
+# timestamps of the previous completed exchange, so the device can fit its
+# clock offset from them:
+#
+#   backend --- command/<device>/clock-sync/set/<uuid> {t1, previous sample} ---> device
+#   backend <-- response/<device>/clock-sync/set/<uuid> {t1, t2, t3} ----------- device
+
+PROBE_INTERVAL_S = 0.5
+RESPONSE_TIMEOUT_S = 5
+
+
+class ClockSyncProber:
+    def __init__(self, client):
+        self.client = client
+        self._responses = {}
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def on_response(self, probe_uuid, data):
+        t4 = now_us()
+        with self._lock:
+            event = self._events.get(probe_uuid)
+            if event is None:
+                return
+            self._responses[probe_uuid] = {
+                "t1": data["origin_timestamp"],
+                "t2": data["receive_timestamp"],
+                "t3": data["transmit_timestamp"],
+                "t4": t4,
+            }
+        event.set()
+
+    def _probe(self, device_name, sample):
+        probe_uuid = str(uuid.uuid4())
+        event = threading.Event()
+        with self._lock:
+            self._events[probe_uuid] = event
+        payload = {"clock-sync": {"origin_timestamp": now_us(), "sample": sample}}
+        self.client.publish(f"command/{device_name}/clock-sync/set/{probe_uuid}", json.dumps(payload), qos=1)
+        event.wait(RESPONSE_TIMEOUT_S)
+        with self._lock:
+            del self._events[probe_uuid]
+            return self._responses.pop(probe_uuid, None)
+
+    def synchronize(self, device_name, rounds):
+        sample = None
+        for _ in range(rounds):
+            response = self._probe(device_name, sample)
+            if response is not None:
+                sample = response
+                theta = ((sample["t2"] - sample["t1"]) + (sample["t3"] - sample["t4"])) / 2
+                delta = (sample["t4"] - sample["t1"]) - (sample["t3"] - sample["t2"])
+                print(f"{device_name}: offset {theta:.0f} us, round trip {delta} us")
+            time.sleep(PROBE_INTERVAL_S)
+        # deliver the last completed exchange
+        if sample is not None:
+            self._probe(device_name, sample)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 clock_sync_probe.py <device_name> [<device_name> ...] [--rounds N]")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    rounds = 16
+    if "--rounds" in args:
+        index = args.index("--rounds")
+        rounds = int(args[index + 1])
+        args = args[:index] + args[index + 2:]
+
+    client = mqtt.Client(client_id=f"clock-sync-{uuid.uuid4().hex[:8]}")
+    prober = ClockSyncProber(client)
+
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe("response/+/clock-sync/set/#", qos=1)
+
+    def on_message(client, userdata, msg):
+        probe_uuid = msg.topic.split("/")[-1]
+        prober.on_response(probe_uuid, json.loads(msg.payload)["clock-sync"])
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+    client.loop_start()
+
+    threads = [threading.Thread(target=prober.synchronize, args=(name, rounds)) for name in args]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    client.loop_stop()
+    client.disconnect()
@@ -36,7 +36,49 @@ ABNORMAL_PREDICTION_THRESHOLD: int = min(
     PREDICTION_HISTORY_LENGTH,
 )
 
+# latency-aware adaptive inference
+LATENCY_AWARE_INFERENCE = bool(int(os.getenv("LATENCY_AWARE_INFERENCE", 0)))
+LATENCY_SLO_US = int(os.getenv("LATENCY_SLO_US", 200000))
+LATENCY_EWMA_ALPHA = float(os.getenv("LATENCY_EWMA_ALPHA", 0.2))
+LATENCY_SLO_MARGIN = float(os.getenv("LATENCY_SLO_MARGIN", 0.1))
+LATENCY_POLICY_HYSTERESIS = int(os.getenv("LATENCY_POLICY_HYSTERESIS", 3))
+# decisions between two probes of the non-active layers, 0 disables probing
+LATENCY_PROBE_INTERVAL = int(os.getenv("LATENCY_PROBE_INTERVAL", 20))
+# relative energy cost of one cycle at each layer: [sensor, gateway, cloud]
+LAYER_ENERGY_COST = json.loads(os.getenv("LAYER_ENERGY_COST", "[1.0, 0.6, 0.8]"))
+
+# instrumentation
+LOCK_INSTRUMENTATION = bool(int(os.getenv("LOCK_INSTRUMENTATION", 0)))
+STAGE_TIMING = bool(int(os.getenv("STAGE_TIMING", 0)))
+STAGE_TIMING_EXPORT_CYCLES = int(os.getenv("STAGE_TIMING_EXPORT_CYCLES", 10))
+
+# gateway-tier micro-batching service
+GATEWAY_MAX_BATCH_SIZE = int(os.getenv("GATEWAY_MAX_BATCH_SIZE", 16))
+GATEWAY_MAX_WAIT_MS = float(os.getenv("GATEWAY_MAX_WAIT_MS", 10))
+
+# working cycles after which a device exits, 0 runs forever
+MAX_CYCLES = int(os.getenv("MAX_CYCLES", 0))
+
+# durable device checkpoint, disabled without a directory; with an interval
+# of 0 the device only checkpoints when it shuts down
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR") or None
+CHECKPOINT_INTERVAL_CYCLES = int(os.getenv("CHECKPOINT_INTERVAL_CYCLES", 10))
+
+# launcher, write end of the pipe the devices report their first connection to
+LAUNCHER_READY_FD = int(os.getenv("LAUNCHER_READY_FD")) if os.getenv("LAUNCHER_READY_FD") else None
+
 
 # dataset consumption
 PATH_TO_DATASET = "dataset/"
 SEQ_LENGTH = 50
+
+# synthetic readings augmented from the dataset, see dataset/synthetic.py
+SYNTHETIC_DATASET = bool(int(os.getenv("SYNTHETIC_DATASET", 0)))
+SYNTHETIC_SEED = int(os.getenv("SYNTHETIC_SEED", 0)) # combined with the device name
+SYNTHETIC_BLOCK_SIZE = int(os.getenv("SYNTHETIC_BLOCK_SIZE", 64)) # windows generated at once
+SYNTHETIC_PREFETCH_BLOCKS = int(os.getenv("SYNTHETIC_PREFETCH_BLOCKS", 2))
+SYNTHETIC_JITTER = float(os.getenv("SYNTHETIC_JITTER", 0.05)) # noise std, relative to the channel std
+SYNTHETIC_SCALING = float(os.getenv("SYNTHETIC_SCALING", 0.1)) # std of the channel gains
+SYNTHETIC_TIME_WARP = float(os.getenv("SYNTHETIC_TIME_WARP", 0.2)) # std of the local speed
+SYNTHETIC_ROTATION_DEG = float(os.getenv("SYNTHETIC_ROTATION_DEG", 10)) # max rotation angle
+SYNTHETIC_MIX_PROBABILITY = float(os.getenv("SYNTHETIC_MIX_PROBABILITY", 0.2))
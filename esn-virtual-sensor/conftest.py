@@ -0,0 +1 @@
+# makes the esn-virtual-sensor modules importable from tests/, like the scripts run from this directory
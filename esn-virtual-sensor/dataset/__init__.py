@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import json
 import os
+import threading
 from config import SEQ_LENGTH, PATH_TO_DATASET, LABELS
 
 # --- Accelerometer Constants ---
@@ -19,84 +20,108 @@ GYR_RAW_TO_RADS = (PI / 180.0) / MAX_INT_VALUE_SENSOR
 convert_raw_acc_to_ms2 = lambda raw: (pow(2, SENSOR_ACC_RANGE + 1) * ACC_RAW_TO_MS2) * raw
 convert_raw_gyr_to_rads = lambda raw: SENSOR_GYR_RANGE * GYR_RAW_TO_RADS * raw
 
+# --- Experiment ---
+EXPERIMENT_SEQUENCE = [
+    {"label": 0, "quantity": 24},   # sensor
+    {"label": 3, "quantity": 10},   # sensor
+    {"label": 0, "quantity": 24},   # gateway
+    {"label": 0, "quantity": 24},   # sensor
+    {"label": 3, "quantity": 10},   # sensor
+    {"label": 3, "quantity": 16},   # gateway
+    {"label": 0, "quantity": 24},   # cloud
+    {"label": 0, "quantity": 16},   # gateway
+    {"label": 0, "quantity": 32},   # sensor
+]
+
+
+def load_sequences():
+    """
+    Loads the dataset and splits it into sequences of SEQ_LENGTH rows per label.
+    """
+    with open(PATH_TO_DATASET + 'column_names.json') as f:
+        column_names = json.load(f)
+
+    labeled_data_frames = {l: [] for l in LABELS.values()}
+    for filename in os.listdir(PATH_TO_DATASET):
+        for label in LABELS.values():
+            if filename.startswith(str(label)) and filename.endswith('.csv'):
+                df = pd.read_csv(PATH_TO_DATASET + filename, names=column_names, sep=';')
+                
+                # Convert the timestamp column to a datetime object
+                df['timestamp'] = pd.to_datetime(df['timestamp'])
+                
+                # Create a mask for rows where acc_x, acc_y, and acc_z are all 0
+                mask_acc_zero = (df['acc_x'] == 0) & (df['acc_y'] == 0) & (df['acc_z'] == 0)
+
+                # Create a mask for rows where gyro_x, gyro_y, and gyro_z are all 0
+                mask_gyro_zero = (df['gyro_x'] == 0) & (df['gyro_y'] == 0) & (df['gyro_z'] == 0)
+
+                # Combine the masks to identify rows where either condition is true
+                mask_either_zero = mask_acc_zero | mask_gyro_zero
+
+                # Filter out the rows from the DataFrame
+                df = df[~mask_either_zero]
+
+                # Convert the raw accelerometer data to m/s^2
+                df['acc_x'] = df['acc_x'].apply(convert_raw_acc_to_ms2).astype("float32")
+                df['acc_y'] = df['acc_y'].apply(convert_raw_acc_to_ms2).astype("float32")
+                df['acc_z'] = df['acc_z'].apply(convert_raw_acc_to_ms2).astype("float32")
+
+                # Convert the raw gyroscope data to rad/s
+                df['gyro_x'] = df['gyro_x'].apply(convert_raw_gyr_to_rads).astype("float32")
+                df['gyro_y'] = df['gyro_y'].apply(convert_raw_gyr_to_rads).astype("float32")
+                df['gyro_z'] = df['gyro_z'].apply(convert_raw_gyr_to_rads).astype("float32")
+                
+                labeled_data_frames[label].append(df)
+
+    dataframes = {label: pd.concat(data_frames) for label, data_frames in labeled_data_frames.items()}
+
+    # crop dataframes to a number of rows that is a multiple of SEQ_LENGTH
+    for label, data in dataframes.items():
+        dataframes[label] = data.iloc[:len(data) - len(data) % SEQ_LENGTH]
+
+    sequences = {}
+    # Create sequences and labels
+    for l, data in dataframes.items():
+        sequences[l] = []
+        for i in range(0, len(data), SEQ_LENGTH):
+            seq = data.iloc[i:i + SEQ_LENGTH]
+            sequences[l].append(seq[['acc_x', 'acc_y', 'acc_z', 'gyro_x', 'gyro_y', 'gyro_z']].values)
+    
+    return sequences
+
+
+_shared_sequences = None
+_shared_sequences_lock = threading.Lock()
+
+
+def shared_sequences():
+    """
+    The sequences of the dataset, loaded once per process and shared, read-only,
+    by every MeasurementHandler.
+    """
+    global _shared_sequences
+    with _shared_sequences_lock:
+        if _shared_sequences is None:
+            _shared_sequences = load_sequences()
+        return _shared_sequences
 
-class MeasurementHandler:
-    def _init_sequences_and_labels(self):
-        with open(PATH_TO_DATASET + 'column_names.json') as f:
-            column_names = json.load(f)
-
-        labeled_data_frames = {l: [] for l in LABELS.values()}
-        for filename in os.listdir(PATH_TO_DATASET):
-            for label in LABELS.values():
-                if filename.startswith(str(label)) and filename.endswith('.csv'):
-                    df = pd.read_csv(PATH_TO_DATASET + filename, names=column_names, sep=';')
-                    
-                    # Convert the timestamp column to a datetime object
-                    df['timestamp'] = pd.to_datetime(df['timestamp'])
-                    
-                    # Create a mask for rows where acc_x, acc_y, and acc_z are all 0
-                    mask_acc_zero = (df['acc_x'] == 0) & (df['acc_y'] == 0) & (df['acc_z'] == 0)
-
-                    # Create a mask for rows where gyro_x, gyro_y, and gyro_z are all 0
-                    mask_gyro_zero = (df['gyro_x'] == 0) & (df['gyro_y'] == 0) & (df['gyro_z'] == 0)
-
-                    # Combine the masks to identify rows where either condition is true
-                    mask_either_zero = mask_acc_zero | mask_gyro_zero
-
-                    # Filter out the rows from the DataFrame
-                    df = df[~mask_either_zero]
-
-                    # Convert the raw accelerometer data to m/s^2
-                    df['acc_x'] = df['acc_x'].apply(convert_raw_acc_to_ms2).astype("float32")
-                    df['acc_y'] = df['acc_y'].apply(convert_raw_acc_to_ms2).astype("float32")
-                    df['acc_z'] = df['acc_z'].apply(convert_raw_acc_to_ms2).astype("float32")
-
-                    # Convert the raw gyroscope data to rad/s
-                    df['gyro_x'] = df['gyro_x'].apply(convert_raw_gyr_to_rads).astype("float32")
-                    df['gyro_y'] = df['gyro_y'].apply(convert_raw_gyr_to_rads).astype("float32")
-                    df['gyro_z'] = df['gyro_z'].apply(convert_raw_gyr_to_rads).astype("float32")
-                    
-                    labeled_data_frames[label].append(df)
-
-        dataframes = {label: pd.concat(data_frames) for label, data_frames in labeled_data_frames.items()}
-
-        # crop dataframes to a number of rows that is a multiple of SEQ_LENGTH
-        for label, data in dataframes.items():
-            dataframes[label] = data.iloc[:len(data) - len(data) % SEQ_LENGTH]
-
-        sequences = {}
-        # Create sequences and labels
-        for l, data in dataframes.items():
-            sequences[l] = []
-            for i in range(0, len(data), SEQ_LENGTH):
-                seq = data.iloc[i:i + SEQ_LENGTH]
-                sequences[l].append(seq[['acc_x', 'acc_y', 'acc_z', 'gyro_x', 'gyro_y', 'gyro_z']].values)
-        
-        self.sequences = sequences
 
+class MeasurementHandler:
     def _consume_sequence(self, label):
         seq = self.sequences[label][self.counter[label]]
         self.counter[label] = (self.counter[label] + 1) % len(self.sequences[label])
         print(f"Consumed sequence with label {label}")
         return label, seq
 
-    def __init__(self) -> None:
-        self._init_sequences_and_labels()
+    def __init__(self, sequences=None) -> None:
+        # the sequences are shared, the counters belong to each handler
+        self.sequences = shared_sequences() if sequences is None else sequences
         self.counter = [0, 0, 0, 0]
 
         # experiment
         self._exp_seq_counter = 0
-        self._exp_seq = [
-            {"label": 0, "quantity": 24},   # sensor
-            {"label": 3, "quantity": 10},   # sensor
-            {"label": 0, "quantity": 24},   # gateway
-            {"label": 0, "quantity": 24},   # sensor
-            {"label": 3, "quantity": 10},   # sensor
-            {"label": 3, "quantity": 16},   # gateway
-            {"label": 0, "quantity": 24},   # cloud
-            {"label": 0, "quantity": 16},   # gateway
-            {"label": 0, "quantity": 32},   # sensor
-        ]
+        self._exp_seq = [dict(exp) for exp in EXPERIMENT_SEQUENCE]
 
     def sequence(self):
         # first we check where we are in the experiment
@@ -107,5 +132,8 @@ class MeasurementHandler:
             return self._consume_sequence(exp["label"])
         else:
             self._exp_seq_counter = (self._exp_seq_counter + 1) % len(self._exp_seq)
+            if self._exp_seq_counter == 0:
+                # the experiment is over, start it again
+                self._exp_seq = [dict(exp) for exp in EXPERIMENT_SEQUENCE]
             return self.sequence()
         
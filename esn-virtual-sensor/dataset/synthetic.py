@@ -0,0 +1,181 @@
+import threading
+from collections import deque
+import numpy as np
+from dataset import EXPERIMENT_SEQUENCE, shared_sequences
+from config import (
+    SEQ_LENGTH,
+    SYNTHETIC_BLOCK_SIZE,
+    SYNTHETIC_PREFETCH_BLOCKS,
+    SYNTHETIC_JITTER,
+    SYNTHETIC_SCALING,
+    SYNTHETIC_TIME_WARP,
+    SYNTHETIC_ROTATION_DEG,
+    SYNTHETIC_MIX_PROBABILITY,
+)
+
+# Unlimited labeled windows for scale tests. Every window starts from a real
+# sequence of its label and is augmented, one block of windows at a time:
+#   mixing:    blended with a window of another label, the own label dominates
+#   time-warp: resampled along a smooth random time axis
+#   rotation:  the same random small rotation of the acc and gyro axes
+#   scaling:   one random gain per channel
+#   jitter:    gaussian noise relative to the channel std of the dataset
+# The labels follow EXPERIMENT_SEQUENCE, like MeasurementHandler.
+
+# control points of the time-warp curve
+TIME_WARP_KNOTS = 4
+ACC_CHANNELS = slice(0, 3)
+GYR_CHANNELS = slice(3, 6)
+
+_shared_windows = None
+_shared_windows_lock = threading.Lock()
+
+
+def shared_windows():
+    """
+    The sequences of the dataset stacked into one (n, SEQ_LENGTH, channels)
+    float32 array per label, and the std of every channel. Built once per process.
+    """
+    global _shared_windows
+    with _shared_windows_lock:
+        if _shared_windows is None:
+            windows = {label: np.stack(seqs).astype(np.float32) for label, seqs in shared_sequences().items()}
+            channel_std = np.concatenate(list(windows.values())).std(axis=(0, 1))
+            _shared_windows = windows, channel_std
+        return _shared_windows
+
+
+def experiment_labels():
+    # the label of every reading, forever
+    while True:
+        for exp in EXPERIMENT_SEQUENCE:
+            for _ in range(exp["quantity"]):
+                yield exp["label"]
+
+
+def _rotation_matrices(rng, n, max_angle_rad):
+    # Rodrigues' formula for n random axes and angles
+    axes = rng.normal(size=(n, 3))
+    axes /= np.linalg.norm(axes, axis=1, keepdims=True)
+    angles = rng.uniform(-max_angle_rad, max_angle_rad, size=(n, 1, 1))
+    k = np.zeros((n, 3, 3))
+    k[:, 0, 1], k[:, 0, 2], k[:, 1, 2] = -axes[:, 2], axes[:, 1], -axes[:, 0]
+    k -= k.transpose(0, 2, 1)
+    return np.eye(3) + np.sin(angles) * k + (1 - np.cos(angles)) * (k @ k)
+
+
+def _time_warp(rng, windows, sigma):
+    n, length, _ = windows.shape
+    # smooth positive speeds, integrated into a monotonic time axis over [0, length - 1]
+    knots = np.clip(rng.normal(1.0, sigma, size=(n, TIME_WARP_KNOTS)), 0.1, None)
+    # linear interpolation of the knots at every time step
+    t = np.linspace(0, TIME_WARP_KNOTS - 1, length)
+    left = np.minimum(t.astype(np.int64), TIME_WARP_KNOTS - 2)
+    speeds = knots[:, left] + (t - left) * (knots[:, left + 1] - knots[:, left])
+    positions = np.cumsum(speeds, axis=1) - speeds[:, :1]
+    positions *= (length - 1) / positions[:, -1:]
+    lower = np.minimum(positions.astype(np.int64), length - 2)
+    weight = (positions - lower)[:, :, None]
+    before = np.take_along_axis(windows, lower[:, :, None], axis=1)
+    after = np.take_along_axis(windows, lower[:, :, None] + 1, axis=1)
+    return before + weight * (after - before)
+
+
+class SyntheticGenerator:
+    def __init__(self, seed, block_size=SYNTHETIC_BLOCK_SIZE):
+        self.windows, self.channel_std = shared_windows()
+        self.block_size = block_size
+        self._rng = np.random.default_rng(seed)
+        self._labels = experiment_labels()
+
+    def _sample(self, labels):
+        # one random real sequence of each label
+        windows = np.empty((len(labels), SEQ_LENGTH, self.channel_std.size))
+        for label in np.unique(labels):
+            rows = labels == label
+            windows[rows] = self.windows[label][self._rng.integers(0, len(self.windows[label]), rows.sum())]
+        return windows
+
+    def block(self):
+        """
+        Returns the labels (block_size,) and windows (block_size, SEQ_LENGTH,
+        channels) of the next block_size readings.
+        """
+        rng, n = self._rng, self.block_size
+        labels = np.fromiter(self._labels, dtype=np.int64, count=n)
+        all_labels = np.array(sorted(self.windows))
+
+        block = self._sample(labels)
+
+        # mixing with another label, lam >= 0.5 keeps the own label dominant
+        mixed = np.flatnonzero(rng.random(n) < SYNTHETIC_MIX_PROBABILITY)
+        if mixed.size:
+            others = all_labels[(np.searchsorted(all_labels, labels[mixed]) + rng.integers(1, len(all_labels), mixed.size)) % len(all_labels)]
+            partners = self._sample(others)
+            lam = rng.beta(0.4, 0.4, size=(mixed.size, 1, 1))
+            lam = np.maximum(lam, 1 - lam)
+            block[mixed] = lam * block[mixed] + (1 - lam) * partners
+
+        if SYNTHETIC_TIME_WARP > 0:
+            block = _time_warp(rng, block, SYNTHETIC_TIME_WARP)
+
+        if SYNTHETIC_ROTATION_DEG > 0:
+            rotations = _rotation_matrices(rng, n, np.deg2rad(SYNTHETIC_ROTATION_DEG))
+            block[:, :, ACC_CHANNELS] = np.einsum("nij,ntj->nti", rotations, block[:, :, ACC_CHANNELS])
+            block[:, :, GYR_CHANNELS] = np.einsum("nij,ntj->nti", rotations, block[:, :, GYR_CHANNELS])
+
+        block *= rng.normal(1.0, SYNTHETIC_SCALING, size=(n, 1, block.shape[2]))
+        block += rng.normal(0.0, 1.0, size=block.shape) * (SYNTHETIC_JITTER * self.channel_std)
+        return labels, block.astype(np.float32)
+
+
+class SyntheticMeasurementHandler:
+    """
+    Drop-in replacement for MeasurementHandler. A background thread generates
+    the blocks ahead of time and keeps at most prefetch_blocks of them, so
+    memory stays flat however long the device runs. The same seed always
+    produces the same readings.
+    """
+
+    def __init__(self, seed, block_size=SYNTHETIC_BLOCK_SIZE, prefetch_blocks=SYNTHETIC_PREFETCH_BLOCKS):
+        self.seed = seed
+        self.block_size = block_size
+        self.prefetch_blocks = max(1, prefetch_blocks)
+        self._generator = None
+        self._blocks = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._labels, self._windows, self._position = None, None, 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while len(self._blocks) >= self.prefetch_blocks:
+                    self._condition.wait()
+            # generated outside the lock, the consumer keeps reading meanwhile
+            block = self._generator.block()
+            with self._condition:
+                self._blocks.append(block)
+                self._condition.notify_all()
+
+    def _next_block(self):
+        if self._thread is None:
+            # started on the first reading, handlers that are never used cost nothing
+            self._generator = SyntheticGenerator(self.seed, self.block_size)
+            self._thread = threading.Thread(target=self._run, name="synthetic-prefetch", daemon=True)
+            self._thread.start()
+        with self._condition:
+            while not self._blocks:
+                self._condition.wait()
+            block = self._blocks.popleft()
+            self._condition.notify_all()
+        return block
+
+    def sequence(self):
+        if self._labels is None or self._position == len(self._labels):
+            self._labels, self._windows = self._next_block()
+            self._position = 0
+        label, window = int(self._labels[self._position]), self._windows[self._position]
+        self._position += 1
+        print(f"Generated sequence with label {label}")
+        return label, window
@@ -0,0 +1,116 @@
+import sys
+import json
+import uuid
+import argparse
+import threading
+import paho.mqtt.client as mqtt
+from mqtt_client.command import command_topic
+from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT
+
+# Group and broadcast commands. One message reaches every device of a group
+# (or the whole fleet) instead of one message per device, the optional
+# target list restricts it to some of the receivers. Devices join groups
+# through the groups resource.
+#
+#   python3 fanout.py set groups '["line-1"]' --target ESP32_1,ESP32_2
+#   python3 fanout.py set sensor-config '{"sleep_interval_ms": 5000}' --group line-1
+#   python3 fanout.py get sensor-state --expect 20
+#
+# Responses keep the command uuid, response/<device>/<resource>/<method>/<uuid>,
+# so the responses of all devices are collected with a single subscription.
+
+DEFAULT_TIMEOUT_S = 10
+
+
+class ResponseAggregator:
+    """
+    Collects the responses of the devices to one command, by device name.
+    """
+
+    def __init__(self, client, resource_name, method, command_uuid, expected=None):
+        self.client = client
+        self.topic = f"response/+/{resource_name}/{method}/{command_uuid}"
+        self.expected = expected
+        self.responses = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self):
+        self.client.message_callback_add(self.topic, self._on_response)
+        self.client.subscribe(self.topic, qos=1)
+
+    def _on_response(self, client, userdata, msg):
+        device_name = msg.topic.split("/")[1]
+        with self._lock:
+            self.responses[device_name] = json.loads(msg.payload)
+            if self.expected is not None and len(self.responses) >= self.expected:
+                self._done.set()
+
+    def wait(self, timeout_s=DEFAULT_TIMEOUT_S):
+        """
+        Waits for the expected number of responses, or for the whole timeout
+        without one. Returns the responses received.
+        """
+        self._done.wait(timeout_s)
+        self.client.unsubscribe(self.topic)
+        self.client.message_callback_remove(self.topic)
+        with self._lock:
+            return dict(self.responses)
+
+
+def send_command(client, resource_name, method, value=None, group=None, target=None, device_name=None, command_uuid=None):
+    """
+    Publishes one command to a device, a group or, without both, to every
+    device. Returns the topic and the payload size in bytes.
+    """
+    payload = {resource_name: value}
+    if target:
+        payload["target"] = list(target)
+    encoded = json.dumps(payload)
+    topic = command_topic(resource_name, method, command_uuid or str(uuid.uuid4()), device_name, group)
+    client.publish(topic, encoded, qos=1).wait_for_publish()
+    return topic, len(encoded)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Group and broadcast commands with aggregated responses")
+    parser.add_argument("method", choices=["get", "set"])
+    parser.add_argument("resource_name")
+    parser.add_argument("value", nargs="?", type=json.loads, help="JSON resource value of a set")
+    destination = parser.add_mutually_exclusive_group()
+    destination.add_argument("--group", help="send to the devices of this group, default every device")
+    destination.add_argument("--device", help="send to this device only")
+    parser.add_argument("--target", type=lambda v: v.split(","), help="comma-separated device names meant to handle it")
+    parser.add_argument("--expect", type=int, help="responses to wait for, default the size of --target")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_S)
+    args = parser.parse_args(argv)
+
+    client = mqtt.Client(client_id=f"fanout-{uuid.uuid4().hex[:8]}")
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+    client.loop_start()
+
+    # the uuid is chosen before publishing, so the response subscription is in place first
+    command_uuid = str(uuid.uuid4())
+    expected = args.expect if args.expect is not None else (len(args.target) if args.target else None)
+    aggregator = ResponseAggregator(client, args.resource_name, args.method, command_uuid, expected)
+    if args.method == "get":
+        aggregator.start()
+
+    topic, size = send_command(
+        client, args.resource_name, args.method, args.value, args.group, args.target, args.device, command_uuid
+    )
+    print(f"Published 1 message of {size} bytes to {topic}")
+
+    if args.method == "get":
+        responses = aggregator.wait(args.timeout)
+        for device_name, response in sorted(responses.items()):
+            print(f"{device_name}: {response}")
+        missing = sorted(set(args.target or []) - set(responses))
+        print(f"{len(responses)} responses" + (f", missing {', '.join(missing)}" if missing else ""))
+
+    client.loop_stop()
+    client.disconnect()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
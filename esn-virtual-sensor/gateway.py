@@ -0,0 +1,301 @@
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import deque
+import numpy as np
+import paho.mqtt.client as mqtt
+from inference.tf_model_manager import TFModelManager
+from virtual_device.clock import now_us
+from config import (
+    MQTT_BROKER_HOST,
+    MQTT_BROKER_PORT,
+    GATEWAY_INFERENCE_LAYER,
+    GATEWAY_MAX_BATCH_SIZE,
+    GATEWAY_MAX_WAIT_MS,
+    SEQ_LENGTH,
+)
+
+# Gateway-tier inference service. Offloaded readings of every device are
+# collected into micro-batches, inferred together and answered through the
+# inf-latency-bench command of each device:
+#
+#   device  --- export/<device>/sensor-data ----------------------------> gateway
+#   device  <-- command/<device>/inf-latency-bench/set/<reading_uuid> --- gateway
+#
+# A batch is dispatched when it holds max_batch_size readings or when its
+# oldest reading has waited max_wait_ms, whichever comes first. The model
+# takes the raw window, feature-only readings are answered right away
+# without a prediction, so their latency is still reported to the device.
+
+STATS_INTERVAL_S = 10
+
+
+class MicroBatcher:
+    """
+    Collects items from any thread and hands them to handler(batch) from a
+    single worker thread, in batches of at most max_batch_size items, at most
+    max_wait_s after the first item of the batch arrived.
+    """
+
+    def __init__(self, handler, max_batch_size, max_wait_s):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_s
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def submit(self, item):
+        with self._condition:
+            self._items.append((time.perf_counter(), item))
+            if len(self._items) == 1 or len(self._items) >= self.max_batch_size:
+                self._condition.notify()
+
+    def _next_batch(self):
+        with self._condition:
+            while self._running and not self._items:
+                self._condition.wait()
+            if not self._items:
+                return None
+            deadline = self._items[0][0] + self.max_wait_s
+            while self._running and len(self._items) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            n = min(len(self._items), self.max_batch_size)
+            return [self._items.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self.handler(batch)
+            except Exception as e:
+                # one bad batch must not stop the worker, its items are dropped
+                print(f"Dropping batch of {len(batch)} items: {e!r}")
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # pending items are still dispatched before the worker exits
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+
+class BatchStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.batches = 0
+            self.readings = 0
+            self.started_at = time.perf_counter()
+            self.latencies_us = []
+            self.batch_sizes = []
+            self.inference_us = []
+
+    def add_batch(self, latencies_us, inference_us):
+        with self._lock:
+            self.batches += 1
+            self.readings += len(latencies_us)
+            self.latencies_us.extend(latencies_us)
+            self.batch_sizes.append(len(latencies_us))
+            self.inference_us.append(inference_us)
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started_at
+            if not self.readings:
+                return {"readings": 0, "throughput": 0.0}
+            latencies = np.array(self.latencies_us)
+            return {
+                "readings": self.readings,
+                "batches": self.batches,
+                "throughput": self.readings / elapsed,
+                "mean_batch_size": float(np.mean(self.batch_sizes)),
+                "mean_inference_us": float(np.mean(self.inference_us)),
+                "latency_p50_us": float(np.percentile(latencies, 50)),
+                "latency_p99_us": float(np.percentile(latencies, 99)),
+            }
+
+
+class GatewayService:
+    def __init__(self, client, model_manager, max_batch_size, max_wait_ms, inference_layer=GATEWAY_INFERENCE_LAYER):
+        self.client = client
+        self.model_manager = model_manager
+        self.inference_layer = inference_layer
+        self.stats = BatchStats()
+        self.batcher = MicroBatcher(self._infer_batch, max_batch_size, max_wait_ms / 1000)
+
+    def on_sensor_data(self, device_name, data):
+        try:
+            descriptor = data["inference_descriptor"]
+            reading = data["sensor_reading"]
+            inference_layer = descriptor["inference_layer"]
+            send_timestamp = descriptor["send_timestamp"]
+            reading_uuid = reading.get("uuid")
+            values = reading.get("values")
+            prediction = descriptor.get("prediction")
+        except (KeyError, TypeError, AttributeError):
+            print(f"Skipping malformed sensor data of {device_name}")
+            return
+        if inference_layer != self.inference_layer or prediction is not None:
+            return
+        if reading_uuid is None:
+            print(f"Skipping reading of {device_name} without uuid")
+            return
+        if values is None:
+            # the model takes the raw window, feature-only readings need another model
+            self._answer(device_name, reading_uuid, send_timestamp, None)
+            return
+        self.batcher.submit((device_name, reading_uuid, send_timestamp, values))
+
+    def _infer_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            inputs = np.array([values for _, (_, _, _, values) in batch], dtype=np.float32)
+            predictions = self.model_manager.predict_batch(inputs)
+        except (ValueError, RuntimeError) as e:
+            # e.g. a ragged or wrong-shaped window from one device: the batch
+            # is answered without predictions, so the latency is still reported
+            print(f"Inference failed for a batch of {len(batch)} readings: {e}")
+            predictions = [None] * len(batch)
+        done = time.perf_counter()
+
+        for (_, (device_name, reading_uuid, send_timestamp, _)), prediction in zip(batch, predictions):
+            self._answer(device_name, reading_uuid, send_timestamp, None if prediction is None else int(prediction))
+
+        # gateway-side latency: arrival at the gateway until the result is sent
+        sent = time.perf_counter()
+        self.stats.add_batch([(sent - arrived) * 1e6 for arrived, _ in batch], (done - start) * 1e6)
+
+    def _answer(self, device_name, reading_uuid, send_timestamp, prediction):
+        payload = {"inf-latency-bench": {
+            "reading_uuid": reading_uuid,
+            "send_timestamp": send_timestamp,
+            "inference_layer": self.inference_layer,
+            "prediction": prediction,
+        }}
+        self.client.publish(f"command/{device_name}/inf-latency-bench/set/{reading_uuid}", json.dumps(payload), qos=1)
+
+    def start(self):
+        self.batcher.start()
+
+    def stop(self):
+        self.batcher.stop()
+
+
+def load_model(model_path):
+    model_manager = TFModelManager()
+    with open(model_path, "rb") as f:
+        model_manager.load_model_bytes(f.read())
+    return model_manager
+
+
+class _NullClient:
+    def publish(self, topic, payload, qos=1):
+        pass
+
+
+def sweep(model_manager, batch_sizes, max_waits_ms, rate, duration_s, seed=0):
+    """
+    Offline throughput and latency of the micro-batcher, without a broker:
+    readings arrive as a Poisson process of the given rate (readings/s) for
+    duration_s at every (batch size, max wait) point.
+    """
+    rng = np.random.default_rng(seed)
+    n_channels = model_manager.get_input_shape()[-1]
+    values = rng.normal(size=(256, SEQ_LENGTH, n_channels)).tolist()
+    rows = []
+    for max_batch_size in batch_sizes:
+        for max_wait_ms in max_waits_ms:
+            service = GatewayService(_NullClient(), model_manager, max_batch_size, max_wait_ms)
+            service.start()
+            gaps = rng.exponential(1 / rate, size=int(rate * duration_s))
+            next_arrival = time.perf_counter()
+            for i, gap in enumerate(gaps):
+                next_arrival += gap
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                service.batcher.submit(("sweep", str(i), now_us(), values[i % len(values)]))
+            service.stop()
+            row = {"max_batch_size": max_batch_size, "max_wait_ms": max_wait_ms, "offered_rate": rate, **service.stats.summary()}
+            print(row)
+            rows.append(row)
+    return rows
+
+
+def _int_list(value):
+    return [int(x) for x in value.split(",")]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Gateway-tier micro-batching inference service")
+    parser.add_argument("model_path", help="Path to the .tflite model")
+    parser.add_argument("--max-batch-size", type=int, default=GATEWAY_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=GATEWAY_MAX_WAIT_MS)
+    parser.add_argument("--layer", type=int, default=GATEWAY_INFERENCE_LAYER, help="inference layer served")
+    parser.add_argument("--sweep", metavar="CSV", help="run the offline batch size/deadline sweep and write it to CSV")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--max-waits-ms", type=_int_list, default=[1, 5, 10, 50])
+    parser.add_argument("--rate", type=float, default=1000, help="sweep arrival rate in readings/s")
+    parser.add_argument("--duration", type=float, default=2, help="sweep duration per point in seconds")
+    args = parser.parse_args(argv)
+
+    model_manager = load_model(args.model_path)
+
+    if args.sweep:
+        import pandas as pd
+        rows = sweep(model_manager, args.batch_sizes, args.max_waits_ms, args.rate, args.duration)
+        pd.DataFrame(rows).to_csv(args.sweep, index=False)
+        return
+
+    client = mqtt.Client(client_id=f"gateway-{uuid.uuid4().hex[:8]}")
+    service = GatewayService(client, model_manager, args.max_batch_size, args.max_wait_ms, args.layer)
+
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe("export/+/sensor-data", qos=0)
+
+    def on_message(client, userdata, msg):
+        device_name = msg.topic.split("/")[1]
+        try:
+            data = json.loads(msg.payload)
+        except ValueError:
+            print(f"Skipping sensor data of {device_name} that is not JSON")
+            return
+        service.on_sensor_data(device_name, data)
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+    service.start()
+    client.loop_start()
+
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL_S)
+            print(service.stats.summary())
+            service.stats.reset()
+    except KeyboardInterrupt:
+        client.loop_stop()
+        service.stop()
+        client.disconnect()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,5 +1,6 @@
 import base64
 import gzip
+import hashlib
 import tempfile
 
 class TFModelManager:
@@ -8,6 +9,8 @@ class TFModelManager:
     Developers need to implement these methods according to their model and application.
     """
     _model = None
+    _model_bytes = None
+    _model_sha256 = None
     _tf = None
     _np = None
 
@@ -15,18 +18,10 @@ class TFModelManager:
         """
         Update the model with a new model.
         """
-        # Import modules if not already imported
-        if self._tf is None:
-            import tensorflow as tf
-            self._tf = tf
-        if self._np is None:
-            import numpy 
-            self._np = numpy
-
-        # Decode b64 encoded gzipped model into bytes
+        # Decode b64 encoded model into bytes
         _decoded_model = base64.b64decode(tf_model_b64)
 
-        # Decompress the model
+        # Decompress the gzip model
         _decoded_model = gzip.decompress(_decoded_model)
 
         # Check if the model size matches the expected size
@@ -34,20 +29,12 @@ class TFModelManager:
             raise ValueError(
                 f"Model size mismatch: expected {tf_model_bytesize} bytes, got {len(_decoded_model)} bytes"
             )
-        
-        # Load the model
-        self._model = self._tf.lite.Interpreter(model_content=_decoded_model)
-        self._model.allocate_tensors()
-
-        # Get input and output tensors.
-        self._input_details = self._model.get_input_details()
-        self._output_details = self._model.get_output_details()
-        print(f"Model loaded successfully. Input shape: {self._input_details[0]['shape']}, Output shape: {self._output_details[0]['shape']}")
 
+        self.load_model_bytes(_decoded_model)
 
-    def update_model(self, tf_model_b64, tf_model_bytesize):
+    def load_model_bytes(self, model_bytes):
         """
-        Update the model with a new model.
+        Loads a raw .tflite model.
         """
         # Import modules if not already imported
         if self._tf is None:
@@ -57,26 +44,41 @@ class TFModelManager:
             import numpy 
             self._np = numpy
 
-        # Decode b64 encoded model into bytes
-        _decoded_model = base64.b64decode(tf_model_b64)
-
-        # Decompress the gzip model
-        _decoded_model = gzip.decompress(_decoded_model)
-
-        # Check if the model size matches the expected size
-        if len(_decoded_model) != tf_model_bytesize:
-            raise ValueError(
-                f"Model size mismatch: expected {tf_model_bytesize} bytes, got {len(_decoded_model)} bytes"
-            )
-
         # Load the model
-        self._model = self._tf.lite.Interpreter(model_content=_decoded_model)
+        self._model_bytes = model_bytes
+        self._model_sha256 = None
+        self._model = self._tf.lite.Interpreter(model_content=model_bytes)
         self._model.allocate_tensors()
 
         # Get input and output tensors.
         self._input_details = self._model.get_input_details()
         self._output_details = self._model.get_output_details()
+        self._batch_size = int(self._input_details[0]['shape'][0])
+        # only models converted with a dynamic batch dimension can be resized
+        self._batching_supported = self._input_details[0]['shape_signature'][0] == -1
+
+
+    def get_model_bytes(self):
+        """
+        Raw .tflite bytes of the loaded model, None without one.
+        """
+        return self._model_bytes
+
+    def get_input_shape(self):
+        """
+        Input shape of the loaded model, (batch, SEQ_LENGTH, channels).
+        """
+        if self._model is None:
+            raise ValueError("Model is not loaded")
+        return tuple(int(d) for d in self._input_details[0]['shape'])
 
+    def get_model_sha256(self):
+        """
+        Content hash of the loaded model, None without one.
+        """
+        if self._model_sha256 is None and self._model_bytes is not None:
+            self._model_sha256 = hashlib.sha256(self._model_bytes).hexdigest()
+        return self._model_sha256
 
     def predict(self, input_data):
         """
@@ -89,6 +91,10 @@ class TFModelManager:
         if self._model is None:
             raise ValueError("Model is not loaded")
         
+        # Restore the single input batch after predict_batch
+        if self._batch_size != 1:
+            self._resize_batch(1)
+
         # Preprocess the input
         input_data = self._preprocess_input(input_data)
 
@@ -107,6 +113,53 @@ class TFModelManager:
         # Postprocess the output
         return self._postprocess_output(output_data)
 
+    def predict_batch(self, input_batch):
+        """
+        Performs inference on a batch of inputs (first axis), returns one label per input.
+        The input tensor is resized to the batch size, which is only reallocated when
+        the size changes. Models without a dynamic batch dimension are run one input
+        at a time.
+        """
+
+        # Check if the model is loaded
+        if self._model is None:
+            raise ValueError("Model is not loaded")
+
+        input_batch = self._preprocess_input(self._np.asarray(input_batch))
+        input_batch = input_batch.astype(self._input_details[0]['dtype'])
+        n = len(input_batch)
+
+        if self._batching_supported and n != self._batch_size:
+            try:
+                self._resize_batch(n)
+            except (RuntimeError, ValueError) as e:
+                # the interpreter is unusable after a failed allocation, reload it
+                print(f"Model does not support batching, running inputs one by one: {e}")
+                self.load_model_bytes(self._model_bytes)
+                self._batching_supported = False
+
+        if not self._batching_supported:
+            labels = []
+            for input_data in input_batch:
+                self._model.set_tensor(self._input_details[0]['index'], input_data[None])
+                self._model.invoke()
+                labels.append(self._postprocess_output(self._model.get_tensor(self._output_details[0]['index'])))
+            return self._np.array(labels)
+
+        self._model.set_tensor(self._input_details[0]['index'], input_batch)
+        self._model.invoke()
+        output_data = self._model.get_tensor(self._output_details[0]['index'])
+        return self._np.argmax(output_data, axis=-1)
+
+    def _resize_batch(self, batch_size):
+        input_shape = list(self._input_details[0]['shape'])
+        input_shape[0] = batch_size
+        self._model.resize_tensor_input(self._input_details[0]['index'], input_shape)
+        self._model.allocate_tensors()
+        self._input_details = self._model.get_input_details()
+        self._output_details = self._model.get_output_details()
+        self._batch_size = batch_size
+
     def _preprocess_input(self, input_data):
         """
         Preprocesses the input data before feeding it to the model.
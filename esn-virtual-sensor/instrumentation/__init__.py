@@ -0,0 +1,83 @@
+import threading
+import time
+from config import LOCK_INSTRUMENTATION
+
+
+class InstrumentedLock:
+    """
+    Drop-in replacement for threading.Lock (or RLock) that counts acquisitions,
+    contended acquisitions, wait time and hold time. The counters are only
+    updated while the lock is held, so they need no extra synchronization.
+    Nested acquisitions of a reentrant lock count once, by the outermost one.
+    """
+
+    def __init__(self, name, reentrant=False):
+        self.name = name
+        self._lock = threading.RLock() if reentrant else threading.Lock()
+        self._depth = 0
+        self._acquired_at = 0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_ns = 0
+        self.max_wait_ns = 0
+        self.hold_ns = 0
+        self.max_hold_ns = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter_ns()
+        contended = False
+        acquired = self._lock.acquire(False)
+        if not acquired and blocking:
+            contended = True
+            acquired = self._lock.acquire(True, timeout)
+        if acquired:
+            self._depth += 1
+            if self._depth > 1:
+                return acquired
+            now = time.perf_counter_ns()
+            wait = now - start
+            self._acquired_at = now
+            self.acquisitions += 1
+            self.contended += contended
+            self.wait_ns += wait
+            self.max_wait_ns = max(self.max_wait_ns, wait)
+        return acquired
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            hold = time.perf_counter_ns() - self._acquired_at
+            self.hold_ns += hold
+            self.max_hold_ns = max(self.max_hold_ns, hold)
+        self._lock.release()
+
+    def locked(self):
+        return self._depth > 0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait_ns": self.wait_ns,
+            "max_wait_ns": self.max_wait_ns,
+            "hold_ns": self.hold_ns,
+            "max_hold_ns": self.max_hold_ns,
+        }
+
+
+def make_lock(name, reentrant=False):
+    if LOCK_INSTRUMENTATION:
+        return InstrumentedLock(name, reentrant)
+    return threading.RLock() if reentrant else threading.Lock()
+
+
+def lock_stats(*locks):
+    return [lock.stats() for lock in locks if isinstance(lock, InstrumentedLock)]
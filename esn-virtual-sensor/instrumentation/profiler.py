@@ -0,0 +1,175 @@
+import io
+import sys
+import gzip
+import time
+import base64
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+
+# Profiling modes
+CPROFILE = "cprofile"
+TRACEMALLOC = "tracemalloc"
+STACK = "stack"
+OFF = "off"
+
+TRACEMALLOC_FRAMES = 10
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread every interval_s from a background thread
+    and counts the folded stacks ("outer;...;inner"), the input format of
+    flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval_s):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.samples = 0
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self, top):
+        return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common(top))
+
+
+class CycleProfiler:
+    """
+    On-demand profiling of the device cycle.
+
+    arm() may be called from any thread (e.g. the MQTT network thread), the
+    session itself is started and stopped by on_cycle_boundary(), which the
+    main loop calls once per cycle, so cProfile and the stack sampler observe
+    the main loop thread. A finished session is returned by on_cycle_boundary()
+    as (uuid, result) with the report gzip-compressed and base64-encoded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = None
+        self._cancel = False
+        self._session = None
+
+    def arm(self, uuid, mode, cycles, interval_ms=10, top=50):
+        """
+        Schedules a session for the next cycle boundary, mode OFF stops the
+        running one. Returns False if a session is already armed or running.
+        """
+        with self._lock:
+            if mode == OFF:
+                self._pending = None
+                self._cancel = self._session is not None
+                return True
+            if self._pending is not None or self._session is not None:
+                return False
+            self._pending = {"uuid": uuid, "mode": mode, "cycles": cycles, "interval_ms": interval_ms, "top": top}
+            return True
+
+    def status(self):
+        with self._lock:
+            if self._session is not None:
+                session = self._session
+                return {
+                    "status": "running",
+                    "uuid": session["uuid"],
+                    "mode": session["mode"],
+                    "cycles": session["cycles"],
+                    "completed_cycles": session["completed_cycles"],
+                }
+            if self._pending is not None:
+                return {"status": "armed", **{k: self._pending[k] for k in ("uuid", "mode", "cycles")}}
+        return {"status": "idle"}
+
+    def on_cycle_boundary(self, cycle):
+        with self._lock:
+            session = self._session
+            if session is not None:
+                session["completed_cycles"] += 1
+                if session["completed_cycles"] < session["cycles"] and not self._cancel:
+                    return None
+                self._session = None
+                self._cancel = False
+            elif self._pending is not None:
+                self._session, self._pending = self._start(self._pending, cycle), None
+                return None
+            else:
+                return None
+        return session["uuid"], self._finish(session, cycle)
+
+    def _start(self, request, cycle):
+        session = {**request, "start_cycle": cycle, "completed_cycles": 0}
+        mode = request["mode"]
+        if mode == CPROFILE:
+            session["profiler"] = cProfile.Profile()
+            session["profiler"].enable()
+        elif mode == TRACEMALLOC:
+            session["started_tracing"] = not tracemalloc.is_tracing()
+            if session["started_tracing"]:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            session["snapshot"] = tracemalloc.take_snapshot()
+        elif mode == STACK:
+            session["sampler"] = StackSampler(threading.get_ident(), request["interval_ms"] / 1000)
+            session["sampler"].start()
+        session["started_at"] = time.perf_counter()
+        return session
+
+    def _finish(self, session, cycle):
+        duration_s = time.perf_counter() - session["started_at"]
+        mode, top = session["mode"], session["top"]
+        extra = {}
+        if mode == CPROFILE:
+            session["profiler"].disable()
+            stream = io.StringIO()
+            pstats.Stats(session["profiler"], stream=stream).sort_stats("cumulative").print_stats(top)
+            report = stream.getvalue()
+        elif mode == TRACEMALLOC:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if session["started_tracing"]:
+                tracemalloc.stop()
+            stats = snapshot.compare_to(session["snapshot"], "lineno")[:top]
+            report = "\n".join(str(stat) for stat in stats)
+            extra = {"traced_bytes": current, "peak_traced_bytes": peak}
+        else:
+            session["sampler"].stop()
+            report = session["sampler"].report(top)
+            extra = {"samples": session["sampler"].samples}
+
+        return {
+            "mode": mode,
+            "start_cycle": session["start_cycle"],
+            "end_cycle": cycle,
+            "cycles": session["completed_cycles"],
+            "duration_s": duration_s,
+            **extra,
+            "encoding": "gzip+base64",
+            "report": base64.b64encode(gzip.compress(report.encode())).decode(),
+        }
+
+
+def decode_report(result):
+    return gzip.decompress(base64.b64decode(result["report"])).decode()
@@ -0,0 +1,84 @@
+import time
+from config import STAGE_TIMING
+
+# Device cycle stages
+MEASURE = 0
+INFERENCE_LAYER = 1
+PREDICT = 2
+PAYLOAD = 3
+PUBLISH = 4
+COMMAND = 5
+MODEL_UPDATE = 6
+FEATURES = 7
+STAGE_NAMES = ["measure", "inference_layer", "predict", "payload", "publish", "command", "model_update", "features"]
+
+# bin i counts the durations d with d.bit_length() == i, i.e. 2^(i-1) <= d < 2^i ns,
+# the last bin also holds anything slower (2^40 ns ~ 18 minutes)
+HISTOGRAM_BINS = 41
+
+
+class StageTimer:
+    """
+    Low-overhead per-stage timing of the device cycle.
+
+        t0 = timer.start()
+        ...
+        timer.stop(MEASURE, t0)
+
+    Durations come from the monotonic perf_counter_ns clock and go into fixed
+    power-of-two histograms allocated once, nothing is allocated per sample.
+    When disabled, start() and stop() return immediately. Each stage is only
+    timed from one thread (main loop or MQTT network thread), so no lock is taken.
+    """
+
+    def __init__(self, enabled=STAGE_TIMING):
+        self.enabled = enabled
+        n_stages = len(STAGE_NAMES)
+        self._histograms = [[0] * HISTOGRAM_BINS for _ in range(n_stages)]
+        self._counts = [0] * n_stages
+        self._total_ns = [0] * n_stages
+        self._max_ns = [0] * n_stages
+
+    def start(self):
+        if not self.enabled:
+            return 0
+        return time.perf_counter_ns()
+
+    def stop(self, stage, start_ns):
+        if not self.enabled:
+            return
+        duration = time.perf_counter_ns() - start_ns
+        self._histograms[stage][min(duration.bit_length(), HISTOGRAM_BINS - 1)] += 1
+        self._counts[stage] += 1
+        self._total_ns[stage] += duration
+        if duration > self._max_ns[stage]:
+            self._max_ns[stage] = duration
+
+    def _quantile_ns(self, stage, q):
+        # upper edge of the bin holding the q-quantile
+        target = q * self._counts[stage]
+        cumulative = 0
+        for i, count in enumerate(self._histograms[stage]):
+            cumulative += count
+            if count and cumulative >= target:
+                return min(1 << i, self._max_ns[stage])
+        return self._max_ns[stage]
+
+    def snapshot(self):
+        """
+        Per-stage summary, in microseconds, of everything timed so far.
+        """
+        stages = {}
+        for stage, name in enumerate(STAGE_NAMES):
+            count = self._counts[stage]
+            if count == 0:
+                continue
+            stages[name] = {
+                "count": count,
+                "mean_us": self._total_ns[stage] / count / 1000,
+                "p50_us": self._quantile_ns(stage, 0.5) / 1000,
+                "p99_us": self._quantile_ns(stage, 0.99) / 1000,
+                "max_us": self._max_ns[stage] / 1000,
+                "histogram": list(self._histograms[stage]),
+            }
+        return stages
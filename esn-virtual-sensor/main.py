@@ -1,28 +1,64 @@
 import time
 import sys
 import json
+import uuid
 from virtual_device import EdgeSensor
-from mqtt_client import MQTTClient
-from mqtt_client.export import SensorDataExport, InferenceDescriptor, SensorReading
-from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT, SENSOR_INFERENCE_LAYER
+from virtual_device.clock import now_us
+from virtual_device import checkpoint
+from instrumentation.stage_timer import MEASURE, INFERENCE_LAYER, PREDICT, FEATURES, PAYLOAD, PUBLISH
+from mqtt_client import MQTTClient, ready_notifier
+from mqtt_client.export import SensorDataExport, InferenceDescriptor, SensorReading, InferencePolicyExport
+from config import (
+    MQTT_BROKER_HOST,
+    MQTT_BROKER_PORT,
+    SENSOR_INFERENCE_LAYER,
+    ADAPTIVE_INFERENCE,
+    LATENCY_AWARE_INFERENCE,
+    STAGE_TIMING,
+    STAGE_TIMING_EXPORT_CYCLES,
+    LAUNCHER_READY_FD,
+    MAX_CYCLES,
+    CHECKPOINT_DIR,
+    CHECKPOINT_INTERVAL_CYCLES,
+)
 
 SLEEP_INTERVAL_MS = 30000 # 30 seconds
 MICROSECOND_CONVERSION_FACTOR = 1000000 # 1 second = 1,000,000 microseconds
 
 def device_predict(device, measurement):
-    send_timestamp = int(time.time() * MICROSECOND_CONVERSION_FACTOR)
+    send_timestamp = now_us()
     prediction = device.predict(measurement)
-    recv_timestamp = int(time.time() * MICROSECOND_CONVERSION_FACTOR)
+    recv_timestamp = now_us()
+    device.record_inference_latency(SENSOR_INFERENCE_LAYER, recv_timestamp - send_timestamp)
+    clock_offset, clock_error_bound = device.get_clock_offset(send_timestamp)
     return InferenceDescriptor(
         inference_layer=SENSOR_INFERENCE_LAYER,
         send_timestamp=send_timestamp,
         recv_timestamp=recv_timestamp,
-        prediction=prediction
+        prediction=prediction,
+        clock_offset=clock_offset,
+        clock_error_bound=clock_error_bound,
     )
 
-def device_mqtt_payload(device, measurement, inference_descriptor):
+def device_offload(device, inference_layer):
+    # timestamps come from the device clock, the offset lets the upper layer
+    # map them to its own clock
+    send_timestamp = now_us()
+    clock_offset, clock_error_bound = device.get_clock_offset(send_timestamp)
+    return InferenceDescriptor(
+        inference_layer=inference_layer,
+        send_timestamp=send_timestamp,
+        clock_offset=clock_offset,
+        clock_error_bound=clock_error_bound,
+    )
+
+def device_mqtt_payload(device, measurement, inference_descriptor, features=None):
+    # with features, the raw window is only sent when the feature set asks for it
+    include_raw = features is None or device.get_feature_set().include_raw
     sensor_reading = SensorReading(
-        values=measurement
+        uuid=str(uuid.uuid4()),
+        values=measurement if include_raw else None,
+        features=features,
     )
     sensor_data_export = SensorDataExport(
         low_battery=device.is_device_low_battery(),
@@ -32,17 +68,67 @@ def device_mqtt_payload(device, measurement, inference_descriptor):
     return json.dumps(sensor_data_export.model_dump())
 
 
-def device_deep_sleep(mqtt_client):
+def device_stage_timing_payload(device):
+    return json.dumps({
+        "cycle": device.get_cycle_counter(),
+        "stages": device.stage_timer.snapshot(),
+    })
+
+
+def device_profile(mqtt_client):
+    device = mqtt_client.device
+    finished = device.profiler.on_cycle_boundary(device.get_cycle_counter())
+    if finished is not None:
+        uuid, result = finished
+        print(f"Publishing {result['mode']} profile of {result['cycles']} cycles...")
+        mqtt_client.publish(f"response/{device.name}/profile/result/{uuid}", json.dumps({"profile": result}), qos=1)
+
+
+def device_policy_payload(device):
+    decision = device.get_policy_decision()
+    if decision is None:
+        return None
+    policy_export = InferencePolicyExport(cycle=device.get_cycle_counter(), **decision)
+    return json.dumps(policy_export.model_dump())
+
+
+def device_checkpoint(device, directory=CHECKPOINT_DIR):
+    saved = device.get_checkpoint()
+    if saved.model_sha256 is not None:
+        checkpoint.write_model(directory, saved.model_sha256, device.get_model_bytes())
+    checkpoint.write_checkpoint(checkpoint.checkpoint_path(directory, device.name), saved)
+
+
+def device_resume(device, directory=CHECKPOINT_DIR):
+    """
+    Restores the last checkpoint of the device, if any. Returns whether it did.
+    """
+    saved = checkpoint.read_checkpoint(checkpoint.checkpoint_path(directory, device.name))
+    if saved is None:
+        return False
+    model_bytes = None
+    if saved.model_sha256 is not None:
+        model_bytes = checkpoint.read_model(directory, saved.model_sha256)
+        if model_bytes is None and saved.state != "initial":
+            # the model has to be pushed again, which takes an unlocked device
+            print(f"Model {saved.model_sha256} of the checkpoint is missing, resuming unlocked")
+            saved = saved._replace(state="unlocked")
+    device.restore_checkpoint(saved, model_bytes)
+    print(f"Resumed from checkpoint: {saved.state}, cycle {saved.cycle_counter}")
+    return True
+
+
+def device_deep_sleep(mqtt_client, stop_event=None):
     device: EdgeSensor = mqtt_client.device
     #mqtt_client.loop_stop()  # Stop the network loop
     #mqtt_client.disconnect()  # Disconnect from the broker
-    sleep_time = device.get_sleep_interval_ms()
+    sleep_time = device.get_next_sleep_ms()
     if sleep_time != 0:
         device.set_sleeping(True)
         print(f"Entering deep sleep... [{sleep_time} ms]")
         print(f"Cycle {device.get_cycle_counter()} completed.")
         
-        time.sleep(sleep_time / 1000)  # Simulate deep sleep duration
+        _sleep(sleep_time / 1000, stop_event)  # Simulate deep sleep duration
         device.set_sleeping(False)
         print("Waking up from deep sleep...")
     device.update_cycle_counter()
@@ -51,49 +137,115 @@ def device_deep_sleep(mqtt_client):
     mqtt_client.loop_start()  # Start the network loop
 
 
-if __name__ == "__main__":
-    device = EdgeSensor(name=sys.argv[1])
-    mqtt_client = MQTTClient(device=device)
+def _sleep(seconds, stop_event=None):
+    # a stop event interrupts the sleep, used when many devices share a process
+    if stop_event is None:
+        time.sleep(seconds)
+    else:
+        stop_event.wait(seconds)
+
+
+def device_cycle(mqtt_client):
+    device: EdgeSensor = mqtt_client.device
+    device_profile(mqtt_client)
+    
+    match device.get_state():
+        case "initial":
+            device.trigger_startup_event()
+        case "error":
+            device.trigger_sensor_reset_event()
+        case "working":
+            timer = device.stage_timer
+            inference_descriptor = None
+            t0 = timer.start()
+            measurement = device.measure()
+            timer.stop(MEASURE, t0)
+            
+            t0 = timer.start()
+            inference_layer = device.get_inference_layer()
+            timer.stop(INFERENCE_LAYER, t0)
+            if ADAPTIVE_INFERENCE and LATENCY_AWARE_INFERENCE:
+                policy_payload = device_policy_payload(device)
+                if policy_payload is not None:
+                    mqtt_client.publish(f"export/{device.name}/inference-policy", policy_payload, qos=0)
+
+            features = None
+            t0 = timer.start()
+            if inference_layer == SENSOR_INFERENCE_LAYER:
+                inference_descriptor = device_predict(device, measurement)
+            else:
+                inference_descriptor = device_offload(device, inference_layer)
+            timer.stop(PREDICT, t0)
+
+            if inference_layer != SENSOR_INFERENCE_LAYER:
+                # offloaded readings may carry compact features instead of the raw window
+                t0 = timer.start()
+                features = device.extract_features(measurement)
+                timer.stop(FEATURES, t0)
+            
+            topic = f"export/{device.name}/sensor-data"
+            t0 = timer.start()
+            payload = device_mqtt_payload(device, measurement, inference_descriptor, features)
+            timer.stop(PAYLOAD, t0)
+            print("Publishing sensor data to broker...")
+            t0 = timer.start()
+            mqtt_client.publish(topic, payload, qos=0)
+            timer.stop(PUBLISH, t0)
+            
+        case _:
+            print(f"Device is in state {device.get_state()}. Skipping...")
+
+    if STAGE_TIMING and device.get_cycle_counter() % STAGE_TIMING_EXPORT_CYCLES == 0:
+        mqtt_client.publish(f"export/{device.name}/stage-timing", device_stage_timing_payload(device), qos=0)
+
+
+def run_device(mqtt_client, stop_event=None, max_cycles=MAX_CYCLES):
+    """
+    Runs the device loop until stop_event is set or, with max_cycles, until
+    that many working cycles were completed (forever by default).
+    """
+    device: EdgeSensor = mqtt_client.device
+    working_cycles = 0
+    if CHECKPOINT_DIR:
+        device_resume(device)
     mqtt_client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
     mqtt_client.loop_start()
-
     try:
-        while True:
+        while stop_event is None or not stop_event.is_set():
+            # checked after the deep sleep, so the responses to the last reading can still arrive
+            if max_cycles and working_cycles >= max_cycles:
+                print(f"Completed {working_cycles} working cycles")
+                return
+
             # wait for mqtt_client to connect
             while not mqtt_client.client.is_connected():
-                time.sleep(1)
-            
-            match device.get_state():
-                case "initial":
-                    device.trigger_startup_event()
-                case "error":
-                    device.trigger_sensor_reset_event()
-                case "working":
-                    inference_descriptor = None
-                    measurement = device.measure()
-                    
-                    inference_layer = device.get_inference_layer()
-                    if inference_layer == SENSOR_INFERENCE_LAYER:
-                        inference_descriptor = device_predict(device, measurement)
-                    else:
-                        inference_descriptor = InferenceDescriptor(
-                            inference_layer=inference_layer,
-                            send_timestamp=int(time.time() * MICROSECOND_CONVERSION_FACTOR),
-                        )
-                    
-                    topic = f"export/{device.name}/sensor-data"
-                    payload = device_mqtt_payload(device, measurement, inference_descriptor)
-                    print("Publishing sensor data to broker...")
-                    mqtt_client.publish(topic, payload, qos=0)
-                    
-                case _:
-                    print(f"Device is in state {device.get_state()}. Skipping...")
-            
-            device_deep_sleep(mqtt_client)
+                _sleep(1, stop_event)
+                if stop_event is not None and stop_event.is_set():
+                    return
 
-    except KeyboardInterrupt:
+            working_cycles += device.get_state() == "working"
+            device_cycle(mqtt_client)
+            if CHECKPOINT_DIR and CHECKPOINT_INTERVAL_CYCLES > 0 and device.get_cycle_counter() % CHECKPOINT_INTERVAL_CYCLES == 0:
+                device_checkpoint(device)
+            device_deep_sleep(mqtt_client, stop_event)
+    finally:
+        if CHECKPOINT_DIR:
+            device_checkpoint(device)
         mqtt_client.loop_stop()
         mqtt_client.disconnect()
+
+
+if __name__ == "__main__":
+    device = EdgeSensor(name=sys.argv[1])
+    mqtt_client = MQTTClient(device=device)
+    if LAUNCHER_READY_FD is not None:
+        mqtt_client.on_first_connect = ready_notifier(LAUNCHER_READY_FD)
+
+    try:
+        run_device(mqtt_client)
+    except KeyboardInterrupt:
+        # only populated when LOCK_INSTRUMENTATION is enabled
+        for stats in device.get_lock_stats():
+            print(f"Lock {stats['name']}: {stats}")
         print("Exiting simulation...")
         sys.exit(0)
-
@@ -1,8 +1,26 @@
 import paho.mqtt.client as mqtt
-from mqtt_client.command import InferenceLatencyBenchmarkCommand, CommandFactory, Method
+from mqtt_client.command import (
+    InferenceLatencyBenchmarkCommand,
+    CommandFactory,
+    Method,
+    GROUP_TOPIC_LEVEL,
+    BROADCAST_TOPIC_LEVEL,
+    parse_command_topic,
+)
 import mqtt_client.export as export
 from virtual_device import EdgeSensor
+from instrumentation.stage_timer import COMMAND
 import json
+import os
+
+
+def ready_notifier(fd):
+    """
+    on_first_connect callback that writes the device name to a launcher pipe.
+    """
+    def notify(mqtt_client):
+        os.write(fd, f"{mqtt_client.device.name}\n".encode())
+    return notify
 
 
 def _handle_inference_latency_benchmark(mqtt_client, uuid, mqtt_payload):
@@ -17,12 +35,18 @@ def _handle_inference_latency_benchmark(mqtt_client, uuid, mqtt_payload):
 
 def _handle_command(mqtt_client, uuid, method, resource_name, mqtt_payload):
     print(f"Received command with UUID {uuid}")
-    response = CommandFactory.create_command(method, resource_name, mqtt_payload).handle(
-        device=mqtt_client.device, uuid=uuid
-    )
-    if method == Method.GET:
+    command = CommandFactory.create_command(method, resource_name, mqtt_payload)
+    if not command.is_targeted(mqtt_client.device.name):
+        # group or broadcast command meant for other devices
+        return
+    response = command.handle(device=mqtt_client.device, uuid=uuid)
+    resources = [operation.resource for operation in command.resource_value] if resource_name == "batch" else [resource_name]
+    if method == Method.SET and "groups" in resources:
+        # a groups set, alone or within a batch, changes the subscriptions
+        mqtt_client.subscribe_groups()
+    if response is not None:
         topic, payload = response.topic, json.dumps(response.payload)
-        print(f"Sending GET response to topic {topic}")
+        print(f"Sending {method.upper()} response to topic {topic}")
         mqtt_client.publish(topic, payload, qos=1)
 
 
@@ -39,6 +63,11 @@ class MQTTClient:
         transport="tcp",
     ):
         self.device = device
+        self.published = 0
+        # called once, on the first successful connection
+        self.on_first_connect = None
+        self._connected_once = False
+        self._subscribed_groups = set()
         self.client = mqtt.Client(
             client_id=device.name,
             clean_session=clean_session,
@@ -58,16 +87,39 @@ class MQTTClient:
             device_name = self.device.name
             # cmd_topic: command/<device_name>/<resource_name>/<method>/<uuid>
             self.client.subscribe(f"command/{device_name}/+/+/#", qos=1)
+            # broadcast_topic: command/all/<resource_name>/<method>/<uuid>
+            self.client.subscribe(f"command/{BROADCAST_TOPIC_LEVEL}/+/+/#", qos=1)
+            self._subscribed_groups = set()
+            self.subscribe_groups()
+            if not self._connected_once:
+                self._connected_once = True
+                if self.on_first_connect is not None:
+                    self.on_first_connect(self)
         else:
             print(f"Connection failed with code {rc}")
 
+    def subscribe_groups(self):
+        """
+        Follows the groups of the device: subscribes to the topics of new
+        groups and unsubscribes from the ones it left.
+        """
+        groups = set(self.device.get_groups())
+        for group in groups - self._subscribed_groups:
+            # group_topic: command/group/<group>/<resource_name>/<method>/<uuid>
+            self.client.subscribe(f"command/{GROUP_TOPIC_LEVEL}/{group}/+/+/#", qos=1)
+        for group in self._subscribed_groups - groups:
+            self.client.unsubscribe(f"command/{GROUP_TOPIC_LEVEL}/{group}/+/+/#")
+        self._subscribed_groups = groups
+
     def on_message(self, client, userdata, msg):
         topic, payload = msg.topic, json.loads(msg.payload.decode())
-        _, resource_name, method, uuid = topic.split("/")[1:]
+        resource_name, method, uuid = parse_command_topic(topic)
+        t0 = self.device.stage_timer.start()
         if resource_name == "inf-latency-bench":
             _handle_inference_latency_benchmark(self, uuid, payload)
         else:
             _handle_command(self, uuid, method, resource_name, payload)
+        self.device.stage_timer.stop(COMMAND, t0)
         
     def on_disconnect(self, client, userdata, rc):
         print("Disconnected from broker")
@@ -85,6 +137,7 @@ class MQTTClient:
         self.client.loop_stop()
 
     def publish(self, topic, payload, qos=1):
+        self.published += 1
         self.client.publish(topic, payload, qos=qos)
     
     
\ No newline at end of file
@@ -1,9 +1,10 @@
-import time
 import enum
-from pydantic import BaseModel
+from typing import Optional
+from pydantic import BaseModel, PrivateAttr, field_validator
 from virtual_device import EdgeSensor
-
-MICROSECOND_CONVERSION_FACTOR = 1000000 # 1 second = 1,000,000 microseconds
+from virtual_device.clock import now_us
+from virtual_device.features import FEATURES
+from instrumentation.profiler import CPROFILE, TRACEMALLOC, STACK, OFF
 
 class Response(BaseModel):
     topic: str
@@ -18,11 +19,62 @@ class Method(str, enum.Enum):
         return super().__eq__(value)
 
 
+# Commands reach a device on its own topic, on the topics of its groups or
+# on the broadcast topic, "group" and "all" are not valid device names:
+#   command/<device_name>/<resource_name>/<method>/<uuid>
+#   command/group/<group>/<resource_name>/<method>/<uuid>
+#   command/all/<resource_name>/<method>/<uuid>
+GROUP_TOPIC_LEVEL = "group"
+BROADCAST_TOPIC_LEVEL = "all"
+# a group name is a single topic level, never a wildcard or a reserved level
+GROUP_NAME_FORBIDDEN = ("/", "+", "#")
+
+
+def validate_group_name(group):
+    if not group or any(c in group for c in GROUP_NAME_FORBIDDEN):
+        raise ValueError(f"Invalid group name {group!r}, it must be non-empty without '/', '+' or '#'")
+    if group in (GROUP_TOPIC_LEVEL, BROADCAST_TOPIC_LEVEL):
+        raise ValueError(f"Invalid group name {group!r}, it is a reserved topic level")
+    return group
+
+
+def command_topic(resource_name, method, uuid, device_name=None, group=None):
+    # one of device_name and group, broadcast without both
+    if device_name is not None:
+        prefix = f"command/{device_name}"
+    elif group is not None:
+        prefix = f"command/{GROUP_TOPIC_LEVEL}/{validate_group_name(group)}"
+    else:
+        prefix = f"command/{BROADCAST_TOPIC_LEVEL}"
+    return f"{prefix}/{resource_name}/{method}/{uuid}"
+
+
+def parse_command_topic(topic):
+    """
+    Returns (resource_name, method, uuid) of a command topic of any of the
+    three kinds.
+    """
+    levels = topic.split("/")
+    if levels[1] == GROUP_TOPIC_LEVEL:
+        return tuple(levels[3:])
+    return tuple(levels[2:])
+
+
 class BaseCommand(BaseModel):
     method: Method = None
+    # devices the command is meant for, all receivers when empty
     target: list[str] = []
     resource_name: str
     resource_value: object
+    # cleared by handle() when the device refuses a set, e.g. in the wrong state
+    _applied: bool = PrivateAttr(default=True)
+
+    def is_targeted(self, device_name):
+        return not self.target or device_name in self.target
+
+    @property
+    def applied(self):
+        return self._applied
 
 
 # --- Resource: Sensor State ---
@@ -62,21 +114,25 @@ class SetSensorState(SensorStateCommand):
             if state == SensorState.UNLOCKED:
                 device.trigger_settings_locked_event()
             else:
+                self._applied = False
                 print(f"Cannot lock settings from state {state}")
         elif self.resource_value == SensorState.UNLOCKED:
             if state == SensorState.LOCKED:
                 device.trigger_settings_unlocked_event()
             else:
+                self._applied = False
                 print(f"Cannot unlock settings from state {state}")
         elif self.resource_value == SensorState.WORKING:
             if state == SensorState.LOCKED or state == SensorState.IDLE:
                 device.trigger_sensor_started_event()
             else:
+                self._applied = False
                 print(f"Cannot start sensor from state {state}")
         elif self.resource_value == SensorState.IDLE:
             if state == SensorState.WORKING:
                 device.trigger_sensor_stopped_event()
             else:
+                self._applied = False
                 print(f"Cannot stop sensor from state {state}")
 
 
@@ -108,7 +164,7 @@ class SetInferenceLayer(InferenceLayerCommand):
 
     def handle(self, device: EdgeSensor, **kwargs):
         print(f"Setting inference layer to {self.resource_value}")
-        device.set_inference_layer(self.resource_value)
+        self._applied = device.set_inference_layer(self.resource_value)
 
 
 class GetInferenceLayer(InferenceLayerCommand):
@@ -117,7 +173,8 @@ class GetInferenceLayer(InferenceLayerCommand):
 
     def handle(self, device: EdgeSensor, uuid: str):
         topic = f"response/{device.name}/{self.resource_name}/get/{uuid}"
-        return Response(topic=topic, payload={"inference-layer": device.get_inference_layer()})
+        # read-only, the adaptive policy only runs in the device cycle
+        return Response(topic=topic, payload={"inference-layer": device.get_active_inference_layer()})
 
 
 # --- Resource: Sensor Config ---
@@ -137,7 +194,7 @@ class SetSensorConfig(SensorConfigCommand):
     resource_value: SensorConfig
 
     def handle(self, device: EdgeSensor, **kwargs):
-        device.set_sensor_config(self.resource_value.model_dump())
+        self._applied = device.set_sensor_config(self.resource_value.model_dump())
 
 class GetSensorConfig(SensorConfigCommand):
     method: Method = Method.GET
@@ -166,15 +223,23 @@ class SetSensorModel(SensorModelCommand):
     resource_value: SensorModel
 
     def handle(self, device: EdgeSensor, **kwargs):
-        device.update_model(self.resource_value.tf_model_b64, self.resource_value.tf_model_bytesize)
+        self._applied = device.update_model(self.resource_value.tf_model_b64, self.resource_value.tf_model_bytesize)
 
 
 # --- Resource: Inference Latency Benchmark ---
 
 
+class ClockDomain(str, enum.Enum):
+    DEVICE = "device" # the send_timestamp of the reading, echoed back
+    BACKEND = "backend" # stamped by the upper layer with its own clock
+
+
 class InferenceLatencyBenchmark(BaseModel):
     reading_uuid: str
     send_timestamp: int
+    clock_domain: ClockDomain = ClockDomain.DEVICE
+    inference_layer: Optional[InferenceLayer] = None
+    prediction: Optional[int] = None # label inferred by the upper layer, if any
 
 
 class InferenceLatencyBenchmarkCommand(BaseCommand):
@@ -185,27 +250,313 @@ class InferenceLatencyBenchmarkCommand(BaseCommand):
 
     def handle(self, device: EdgeSensor, **kwargs):
         send_timestamp = self.resource_value.send_timestamp
-        recv_timestamp = int(time.time() * MICROSECOND_CONVERSION_FACTOR)
+        recv_timestamp = now_us()
+        inference_latency = recv_timestamp - send_timestamp
+
+        clock_offset, clock_error_bound = device.get_clock_offset(recv_timestamp)
+        corrected_inference_latency = None
+        if self.resource_value.clock_domain == ClockDomain.DEVICE:
+            # an echoed device timestamp is on the same clock, nothing to correct
+            corrected_inference_latency = inference_latency
+        elif clock_error_bound is not None:
+            # a backend timestamp: recv_timestamp is mapped to the backend clock
+            # with the estimated offset of the device clock
+            corrected_inference_latency = recv_timestamp - clock_offset - send_timestamp
+
+        # readings without an explicit layer are attributed to the active one
+        inference_layer = self.resource_value.inference_layer
+        if inference_layer is None:
+            inference_layer = device.get_active_inference_layer()
+        device.record_inference_latency(
+            int(inference_layer),
+            inference_latency if corrected_inference_latency is None else corrected_inference_latency,
+        )
         
         export_topic = f"export/{device.name}/inf-latency-bench"
         export_data = {
             "reading_uuid": self.resource_value.reading_uuid,
             "send_timestamp": send_timestamp,
             "recv_timestamp": recv_timestamp,
-            "inference_latency": recv_timestamp - send_timestamp
+            "inference_latency": inference_latency,
+            "inference_layer": int(inference_layer),
+            "clock_domain": self.resource_value.clock_domain.value,
+            "corrected_inference_latency": corrected_inference_latency,
+            "clock_offset": clock_offset,
+            "clock_error_bound": clock_error_bound,
+            "prediction": self.resource_value.prediction,
         }
         return export_topic, export_data
 
 
 
+# --- Resource: Clock Sync ---
+
+
+class ClockSyncSample(BaseModel):
+    t1: int # probe sent by the backend (backend clock)
+    t2: int # probe received by the device (device clock)
+    t3: int # reply sent by the device (device clock)
+    t4: int # reply received by the backend (backend clock)
+
+
+class ClockSync(BaseModel):
+    origin_timestamp: int
+    # timestamps of the previous completed exchange, if any
+    sample: Optional[ClockSyncSample] = None
+
+
+class ClockSyncCommand(BaseCommand):
+    allowed_methods: list[Method] = [Method.SET]
+    resource_name: str = "clock-sync"
+
+
+class SetClockSync(ClockSyncCommand):
+    method: Method = Method.SET
+    resource_value: ClockSync
+
+    def handle(self, device: EdgeSensor, uuid: str):
+        receive_timestamp = now_us()
+        sample = self.resource_value.sample
+        if sample is not None:
+            device.add_clock_sample(sample.t1, sample.t2, sample.t3, sample.t4)
+
+        topic = f"response/{device.name}/{self.resource_name}/set/{uuid}"
+        return Response(topic=topic, payload={"clock-sync": {
+            "origin_timestamp": self.resource_value.origin_timestamp,
+            "receive_timestamp": receive_timestamp,
+            "transmit_timestamp": now_us(),
+        }})
+
+
+# --- Resource: Wake Slot ---
+
+
+class WakeSlotValue(BaseModel):
+    period_ms: int # 0 drops the slot
+    offset_ms: int = 0
+    epoch_us: int = 0 # backend clock
+
+
+class WakeSlotCommand(BaseCommand):
+    allowed_methods: list[Method] = [Method.GET, Method.SET]
+    resource_name: str = "wake-slot"
+
+
+class SetWakeSlot(WakeSlotCommand):
+    method: Method = Method.SET
+    resource_value: WakeSlotValue
+
+    def handle(self, device: EdgeSensor, **kwargs):
+        value = self.resource_value
+        print(f"Setting wake slot to {value.offset_ms} ms every {value.period_ms} ms")
+        self._applied = device.set_wake_slot(value.period_ms, value.offset_ms, value.epoch_us)
+
+
+class GetWakeSlot(WakeSlotCommand):
+    method: Method = Method.GET
+    resource_value: WakeSlotValue = None
+
+    def handle(self, device: EdgeSensor, uuid: str):
+        topic = f"response/{device.name}/{self.resource_name}/get/{uuid}"
+        wake_slot = device.get_wake_slot()
+        return Response(topic=topic, payload={"wake-slot": None if wake_slot is None else wake_slot._asdict()})
+
+
+# --- Resource: Feature Set ---
+
+
+# one member per feature of virtual_device.features, e.g. Feature.FFT_BANDS = "fft_bands"
+Feature = enum.Enum("Feature", {name.upper(): name for name in FEATURES}, type=str)
+
+
+class FeatureSetValue(BaseModel):
+    features: list[Feature] = [] # empty sends the raw window only
+    include_raw: bool = False # send the raw window alongside the features
+    fft_bands: int = 4
+
+
+class FeatureSetCommand(BaseCommand):
+    allowed_methods: list[Method] = [Method.GET, Method.SET]
+    resource_name: str = "feature-set"
+
+
+class SetFeatureSet(FeatureSetCommand):
+    method: Method = Method.SET
+    resource_value: FeatureSetValue
+
+    def handle(self, device: EdgeSensor, **kwargs):
+        value = self.resource_value
+        print(f"Setting feature set to {[feature.value for feature in value.features]}")
+        device.set_feature_set([feature.value for feature in value.features], value.include_raw, max(1, value.fft_bands))
+
+
+class GetFeatureSet(FeatureSetCommand):
+    method: Method = Method.GET
+    resource_value: FeatureSetValue = None
+
+    def handle(self, device: EdgeSensor, uuid: str):
+        topic = f"response/{device.name}/{self.resource_name}/get/{uuid}"
+        feature_set = device.get_feature_set()
+        return Response(topic=topic, payload={"feature-set": {**feature_set._asdict(), "features": list(feature_set.features)}})
+
+
+# --- Resource: Batch ---
+
+
+class BatchOperation(BaseModel):
+    resource: str
+    method: Method
+    value: object = None
+
+
+# status of each operation in the batch response
+BATCH_APPLIED = "applied"
+BATCH_REJECTED = "rejected"
+BATCH_SKIPPED = "skipped"
+
+
+class BatchCommand(BaseCommand):
+    allowed_methods: list[Method] = [Method.SET]
+    resource_name: str = "batch"
+
+
+class SetBatch(BatchCommand):
+    """
+    Ordered operations on several resources, e.g. the whole provisioning of a
+    device in one message. Every operation is validated before the first one
+    is applied, then they are applied in order while holding the device
+    mutexes, so no other writer interleaves, and answered with a single
+    response. It is not atomic: the batch stops at the first operation the
+    device refuses, the operations applied before it are kept and the ones
+    after it are skipped. Each result has the status of its operation.
+    """
+    method: Method = Method.SET
+    resource_value: list[BatchOperation]
+    _commands: list = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context):
+        for operation in self.resource_value:
+            if operation.resource == self.resource_name:
+                raise ValueError("Invalid batch, batches cannot be nested")
+            command = CommandFactory.create_command(operation.method.value, operation.resource, {operation.resource: operation.value})
+            if command is None:
+                raise ValueError(f"Invalid batch, unknown operation {operation.method.value} {operation.resource}")
+            self._commands.append(command)
+
+    def handle(self, device: EdgeSensor, uuid: str):
+        results = []
+        rejected = False
+        with device.transaction():
+            for operation, command in zip(self.resource_value, self._commands):
+                result = {"resource": operation.resource, "method": operation.method.value, "status": BATCH_SKIPPED, "response": None}
+                results.append(result)
+                if rejected:
+                    continue
+                try:
+                    response = command.handle(device=device, uuid=uuid)
+                except Exception as e:
+                    print(f"Batch operation {operation.method.value} {operation.resource} failed: {e}")
+                    rejected, result["status"], result["error"] = True, BATCH_REJECTED, str(e)
+                    continue
+                if not command.applied:
+                    print(f"Batch stopped, {operation.method.value} {operation.resource} was refused in state {device.get_state()}")
+                    rejected, result["status"] = True, BATCH_REJECTED
+                    continue
+                result["status"] = BATCH_APPLIED
+                result["response"] = None if response is None else response.payload
+        # the state the batch left the device in, set operations have no response
+        topic = f"response/{device.name}/{self.resource_name}/set/{uuid}"
+        return Response(topic=topic, payload={"batch": results, "applied": not rejected, "sensor-state": device.get_state()})
+
+
+# --- Resource: Groups ---
+
+
+class GroupsCommand(BaseCommand):
+    allowed_methods: list[Method] = [Method.GET, Method.SET]
+    resource_name: str = "groups"
+
+
+class SetGroups(GroupsCommand):
+    method: Method = Method.SET
+    resource_value: list[str]
+
+    @field_validator("resource_value")
+    @classmethod
+    def validate_groups(cls, groups):
+        # the names end up in the topic filters of subscribe_groups()
+        return [validate_group_name(group) for group in groups]
+
+    def handle(self, device: EdgeSensor, **kwargs):
+        print(f"Setting groups to {self.resource_value}")
+        device.set_groups(self.resource_value)
+
+
+class GetGroups(GroupsCommand):
+    method: Method = Method.GET
+    resource_value: list[str] = None
+
+    def handle(self, device: EdgeSensor, uuid: str):
+        topic = f"response/{device.name}/{self.resource_name}/get/{uuid}"
+        return Response(topic=topic, payload={"groups": list(device.get_groups())})
+
+
+# --- Resource: Profile ---
+
+
+class ProfileMode(str, enum.Enum):
+    CPROFILE = CPROFILE
+    TRACEMALLOC = TRACEMALLOC
+    STACK = STACK
+    OFF = OFF
+
+
+class Profile(BaseModel):
+    mode: ProfileMode
+    cycles: int = 10
+    interval_ms: int = 10 # stack sampler period
+    top: int = 50 # entries kept in the report
+
+
+class ProfileCommand(BaseCommand):
+    allowed_methods: list[Method] = [Method.GET, Method.SET]
+    resource_name: str = "profile"
+
+
+class SetProfile(ProfileCommand):
+    method: Method = Method.SET
+    resource_value: Profile
+
+    def handle(self, device: EdgeSensor, uuid: str):
+        # the session starts at the next cycle boundary, the report is published
+        # by the main loop to response/<device_name>/profile/result/<uuid>
+        value = self.resource_value
+        armed = device.profiler.arm(uuid, value.mode.value, max(1, value.cycles), value.interval_ms, value.top)
+        if not armed:
+            print("A profiling session is already armed or running")
+        self._applied = armed
+        topic = f"response/{device.name}/{self.resource_name}/set/{uuid}"
+        return Response(topic=topic, payload={"profile": {"accepted": armed, **device.profiler.status()}})
+
+
+class GetProfile(ProfileCommand):
+    method: Method = Method.GET
+    resource_value: Profile = None
+
+    def handle(self, device: EdgeSensor, uuid: str):
+        topic = f"response/{device.name}/{self.resource_name}/get/{uuid}"
+        return Response(topic=topic, payload={"profile": device.profiler.status()})
+
+
 class CommandFactory:
     @staticmethod
     def create_command(method: str, resource_name: str, mqtt_payload: dict):
         # mqtt_payload needs to be a dict with only one pair key-value
-        # e.g. {resource_name: resource_value}
+        # e.g. {resource_name: resource_value}, plus an optional "target"
+        # list of device names for group and broadcast commands
         
-        
-        if len(mqtt_payload) != 1:
+        target = mqtt_payload.get("target") or []
+        if len(mqtt_payload) - ("target" in mqtt_payload) != 1:
             raise ValueError("Invalid payload, expected only one key-value pair")
 
         if method not in ["get", "set"]:
@@ -217,6 +568,13 @@ class CommandFactory:
         method = Method(method)
         resource_value = mqtt_payload[resource_name]
 
+        command = CommandFactory._create_command(method, resource_name, resource_value)
+        if command is not None:
+            command.target = target
+        return command
+
+    @staticmethod
+    def _create_command(method: Method, resource_name: str, resource_value):
         if method == Method.SET:
             if resource_name == "sensor-state":
                 return SetSensorState(resource_value=resource_value)
@@ -226,6 +584,18 @@ class CommandFactory:
                 return SetSensorConfig(resource_value=resource_value)
             elif resource_name == "sensor-model":
                 return SetSensorModel(resource_value=resource_value)
+            elif resource_name == "clock-sync":
+                return SetClockSync(resource_value=resource_value)
+            elif resource_name == "profile":
+                return SetProfile(resource_value=resource_value)
+            elif resource_name == "wake-slot":
+                return SetWakeSlot(resource_value=resource_value)
+            elif resource_name == "feature-set":
+                return SetFeatureSet(resource_value=resource_value)
+            elif resource_name == "groups":
+                return SetGroups(resource_value=resource_value)
+            elif resource_name == "batch":
+                return SetBatch(resource_value=resource_value)
         elif method == Method.GET:
             if resource_name == "sensor-state":
                 return GetSensorState()
@@ -233,3 +603,11 @@ class CommandFactory:
                 return GetInferenceLayer()
             elif resource_name == "sensor-config":
                 return GetSensorConfig()
+            elif resource_name == "profile":
+                return GetProfile()
+            elif resource_name == "wake-slot":
+                return GetWakeSlot()
+            elif resource_name == "feature-set":
+                return GetFeatureSet()
+            elif resource_name == "groups":
+                return GetGroups()
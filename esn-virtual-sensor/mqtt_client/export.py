@@ -4,13 +4,16 @@ from typing import Optional
 # --- Export Payloads ---
 class SensorReading(BaseModel):
     uuid: Optional[str] = None
-    values: list[list[float]]
+    values: Optional[list[list[float]]] = None # raw window, omitted when features replace it
+    features: Optional[dict[str, list]] = None # per-channel features, see virtual_device.features
 
 class InferenceDescriptor(BaseModel):
     inference_layer: int # 0: cloud, 1: gateway, 2: sensor
     send_timestamp: int
     recv_timestamp: Optional[int] = None
     prediction: Optional[int] = None
+    clock_offset: Optional[int] = None # device clock minus backend clock, in us
+    clock_error_bound: Optional[int] = None # None until the clock is synchronized
 
 class SensorDataExport(BaseModel):
     low_battery: bool
@@ -22,3 +25,21 @@ class InferenceLatencyBenchmarkExport(BaseModel):
     send_timestamp: int
     recv_timestamp: int
     inference_latency: int
+    inference_layer: Optional[int] = None
+    clock_domain: str = "device"
+    corrected_inference_latency: Optional[int] = None
+    clock_offset: Optional[int] = None
+    clock_error_bound: Optional[int] = None
+    prediction: Optional[int] = None
+
+class InferencePolicyExport(BaseModel):
+    cycle: int
+    previous_layer: int
+    target_layer: int
+    selected_layer: int
+    latency_estimates: list[Optional[float]]
+    latency_slo: int
+    low_battery: bool
+    reason: str
+    probe_layer: Optional[int] = None
+
@@ -0,0 +1,195 @@
+import sys
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from dataset import EXPERIMENT_SEQUENCE
+from config import (
+    PREDICTION_HISTORY_LENGTH,
+    ABNORMAL_PREDICTION_THRESHOLD,
+    LOW_BATTERY_THRESHOLD,
+    DEVICE_BATTERY_LIFETIME_IN_CYCLES,
+    ABNORMAL_LABELS,
+    LAYER_ENERGY_COST,
+    SENSOR_INFERENCE_LAYER,
+    GATEWAY_INFERENCE_LAYER,
+)
+
+# Offline replay of the sensor adaptive inference heuristic.
+# Every cycle of the experiment is simulated for all parameter combinations
+# at once, the combinations being the first axis of every state array.
+
+
+def expand_schedule(schedule, repeats=1):
+    """
+    Expands an experiment schedule [{"label": l, "quantity": q}, ...] into
+    one ground-truth label per cycle.
+    """
+    labels = np.concatenate([np.full(exp["quantity"], exp["label"], dtype=np.int8) for exp in schedule])
+    return np.tile(labels, repeats)
+
+
+def build_grid(history_lengths, thresholds, low_battery_thresholds, lifetimes):
+    grid = np.array(
+        list(itertools.product(history_lengths, thresholds, low_battery_thresholds, lifetimes)),
+        dtype=np.float64,
+    )
+    # same clipping as ABNORMAL_PREDICTION_THRESHOLD in config.py
+    grid[:, 1] = np.minimum(grid[:, 1], grid[:, 0])
+    grid = np.unique(grid, axis=0)
+    m = grid[:, 0].astype(np.int64)
+    psi = grid[:, 1].astype(np.int64)
+    return {
+        "history_length": m,
+        "abnormal_threshold": psi,
+        "low_battery_threshold": grid[:, 2],
+        "battery_lifetime": grid[:, 3].astype(np.int64),
+    }
+
+
+def simulate(labels, predictions, params, gateway_dwell=0, energy_cost=LAYER_ENERGY_COST):
+    """
+    Replays the device cycle of main.py for every parameter combination.
+
+    labels: ground-truth label of each cycle, used for the detection delay
+    predictions: label predicted on the sensor at each cycle
+    gateway_dwell: cycles after which the upper layer hands inference back
+        to the sensor, 0 means never (as on the device)
+    """
+    m = params["history_length"]
+    psi = params["abnormal_threshold"]
+    lifetime = params["battery_lifetime"]
+    low_threshold = lifetime * params["low_battery_threshold"]
+    n_params, n_cycles = len(m), len(labels)
+    rows = np.arange(n_params)
+    energy_cost = np.asarray(energy_cost, dtype=np.float64)
+
+    # device state, one entry per parameter combination
+    history = np.zeros((n_params, int(m.max())), dtype=np.uint8)
+    head = np.zeros(n_params, dtype=np.int64)
+    abnormal_count = np.zeros(n_params, dtype=np.int64)
+    pred_state_counter = np.zeros(n_params, dtype=np.int64)
+    layer = np.full(n_params, SENSOR_INFERENCE_LAYER, dtype=np.int8)
+    offload_age = np.zeros(n_params, dtype=np.int64)
+
+    # metrics
+    offloaded_cycles = np.zeros(n_params, dtype=np.int64)
+    energy = np.zeros(n_params, dtype=np.float64)
+    delay_sum = np.zeros(n_params, dtype=np.int64)
+    detected = np.zeros(n_params, dtype=np.int64)
+    segment_detected = np.zeros(n_params, dtype=bool)
+    n_segments = 0
+
+    abnormal = np.isin(labels, ABNORMAL_LABELS)
+    abnormal_pred = np.isin(predictions, ABNORMAL_LABELS).astype(np.uint8)
+    segment_start = 0
+
+    for t in range(n_cycles):
+        if abnormal[t] and (t == 0 or not abnormal[t - 1]):
+            n_segments += 1
+            segment_start = t
+            segment_detected[:] = False
+
+        # get_inference_layer(): the heuristic only runs on the sensor layer
+        low_battery = (lifetime - t) < low_threshold
+        on_sensor = layer == SENSOR_INFERENCE_LAYER
+        adapt = on_sensor & (low_battery | ((pred_state_counter >= m) & (abnormal_count >= psi)))
+        layer[adapt] = GATEWAY_INFERENCE_LAYER
+        abnormal_count[adapt] = 0
+        pred_state_counter[adapt] = 0
+        head[adapt] = 0
+        offload_age[adapt] = 0
+
+        # predict() on the sensor layer updates the history ring
+        predicting = layer == SENSOR_INFERENCE_LAYER
+        if predicting.any():
+            idx = rows[predicting]
+            full = pred_state_counter[idx] >= m[idx]
+            abnormal_count[idx] -= history[idx, head[idx]] * full
+            history[idx, head[idx]] = abnormal_pred[t]
+            abnormal_count[idx] += abnormal_pred[t]
+            head[idx] = (head[idx] + 1) % m[idx]
+            pred_state_counter[idx] += 1
+
+        offloaded = ~predicting
+        offloaded_cycles += offloaded
+        energy += energy_cost[layer]
+
+        if abnormal[t]:
+            newly = offloaded & ~segment_detected
+            delay_sum[newly] += t - segment_start
+            detected[newly] += 1
+            segment_detected |= offloaded
+
+        if gateway_dwell:
+            offload_age[offloaded] += 1
+            handed_back = offloaded & (offload_age >= gateway_dwell) & ~low_battery
+            layer[handed_back] = SENSOR_INFERENCE_LAYER
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_detection_delay = np.where(detected > 0, delay_sum / detected, np.nan)
+
+    return pd.DataFrame({
+        **params,
+        "offload_rate": offloaded_cycles / n_cycles,
+        "mean_detection_delay": mean_detection_delay,
+        "missed_detections": n_segments - detected,
+        "energy": energy,
+        "battery_used": np.minimum(energy / lifetime, 1.0),
+    })
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def _float_list(value):
+    return [float(v) for v in value.split(",")]
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Offline replay and parameter sweep of the adaptive inference policy")
+    parser.add_argument("output", help="CSV file with one row per parameter combination")
+    parser.add_argument("--schedule", help="JSON experiment schedule, defaults to the dataset experiment")
+    parser.add_argument("--predictions", help="JSON list with the predicted label of each cycle, defaults to the ground truth")
+    parser.add_argument("--repeats", type=int, default=1, help="times the schedule is replayed")
+    parser.add_argument("--gateway-dwell", type=int, default=0)
+    parser.add_argument("--history-lengths", type=_int_list, default=list(range(1, 2 * PREDICTION_HISTORY_LENGTH + 1)))
+    parser.add_argument("--thresholds", type=_int_list, default=list(range(1, 2 * ABNORMAL_PREDICTION_THRESHOLD + 1)))
+    parser.add_argument("--low-battery-thresholds", type=_float_list, default=[LOW_BATTERY_THRESHOLD])
+    parser.add_argument("--lifetimes", type=_int_list, default=[DEVICE_BATTERY_LIFETIME_IN_CYCLES])
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = _parse_args(argv)
+
+    schedule = EXPERIMENT_SEQUENCE
+    if args.schedule:
+        with open(args.schedule) as f:
+            schedule = json.load(f)
+    labels = expand_schedule(schedule, args.repeats)
+
+    predictions = labels
+    if args.predictions:
+        with open(args.predictions) as f:
+            predictions = np.asarray(json.load(f), dtype=np.int8)
+        if len(predictions) < len(labels):
+            raise ValueError(f"Expected at least {len(labels)} predictions, got {len(predictions)}")
+        predictions = predictions[:len(labels)]
+
+    params = build_grid(args.history_lengths, args.thresholds, args.low_battery_thresholds, args.lifetimes)
+
+    start = time.perf_counter()
+    results = simulate(labels, predictions, params, gateway_dwell=args.gateway_dwell)
+    elapsed = time.perf_counter() - start
+
+    results.to_csv(args.output, index=False)
+    print(f"Simulated {len(results)} parameter combinations over {len(labels)} cycles in {elapsed:.2f} s")
+    print(results.sort_values(["missed_detections", "mean_detection_delay", "battery_used"]).head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timezone
+import pandas as pd
+import paho.mqtt.client as mqtt
+from cli_tool import generate_device_names
+from gateway import GatewayService, load_model
+from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT, GATEWAY_INFERENCE_LAYER, GATEWAY_MAX_BATCH_SIZE, GATEWAY_MAX_WAIT_MS
+
+# Node-count scaling sweep. For every node count, a fleet is launched with
+# cli_tool.py, provisioned over MQTT (sensor config, inference layer, locked,
+# working), run for a fixed number of working cycles and stopped. The
+# offloaded readings are served by an in-process gateway, and the
+# inf-latency-bench exports are written to <output>/<node_count>.csv with
+# the columns latency/latency.py reads:
+#
+#   python3 scaling_sweep.py <output_dir> --node-counts 1,5,10,20 --cycles 50
+
+PROVISION_INTERVAL_S = 2
+BENCHMARK_MODEL_PATH = os.path.join(os.path.dirname(__file__), "benchmarks", "fixtures", "tiny_model.tflite")
+
+
+class SweepRun:
+    """
+    Provisioning state and collected exports of the fleet of one node count.
+    """
+
+    def __init__(self, node_count, device_names):
+        self.node_count = node_count
+        self.pending = set(device_names)
+        self.readings = set()
+        self.rows = []
+        self.lock = threading.Lock()
+
+
+class ScalingSweep:
+    def __init__(self, client, gateway, inference_layer, sleep_interval_ms, batch=False):
+        self.client = client
+        self.gateway = gateway
+        self.inference_layer = inference_layer
+        self.sleep_interval_ms = sleep_interval_ms
+        # provision with one batch command instead of one command per step
+        self.batch = batch
+        self.run = None
+
+    def _command(self, device_name, resource_name, method, value):
+        topic = f"command/{device_name}/{resource_name}/{method}/{uuid.uuid4()}"
+        self.client.publish(topic, json.dumps({resource_name: value}), qos=1)
+
+    def provision(self, device_name, state):
+        if state == "unlocked" and self.batch:
+            self._command(device_name, "batch", "set", [
+                {"resource": "sensor-config", "method": "set", "value": {"sleep_interval_ms": self.sleep_interval_ms}},
+                {"resource": "inference-layer", "method": "set", "value": self.inference_layer},
+                {"resource": "sensor-state", "method": "set", "value": "locked"},
+                {"resource": "sensor-state", "method": "set", "value": "working"},
+            ])
+        elif state == "unlocked":
+            self._command(device_name, "sensor-config", "set", {"sleep_interval_ms": self.sleep_interval_ms})
+            self._command(device_name, "inference-layer", "set", self.inference_layer)
+            self._command(device_name, "sensor-state", "set", "locked")
+            self._command(device_name, "sensor-state", "set", "working")
+        elif state in ("locked", "idle"):
+            self._command(device_name, "sensor-state", "set", "working")
+
+    def poll_pending(self):
+        with self.run.lock:
+            pending = list(self.run.pending)
+        for device_name in pending:
+            self._command(device_name, "sensor-state", "get", None)
+        return len(pending)
+
+    def on_message(self, client, userdata, msg):
+        run = self.run
+        if run is None:
+            return
+        levels = msg.topic.split("/")
+        device_name = levels[1]
+        data = json.loads(msg.payload)
+        if levels[0] == "response" and levels[2] in ("sensor-state", "batch"):
+            state = data["sensor-state"]
+            with run.lock:
+                if state == "working":
+                    run.pending.discard(device_name)
+                    return
+            self.provision(device_name, state)
+        elif levels[2] == "sensor-data":
+            reading_uuid = data["sensor_reading"].get("uuid")
+            with run.lock:
+                run.readings.add(reading_uuid)
+            self.gateway.on_sensor_data(device_name, data)
+        elif levels[2] == "inf-latency-bench":
+            registered_at = datetime.now(timezone.utc).isoformat()
+            with run.lock:
+                # commands queued for a previous run's session are ignored
+                if data["reading_uuid"] not in run.readings:
+                    return
+                run.rows.append({
+                    "sensor_name": device_name,
+                    "inference_latency": data["inference_latency"],
+                    "registered_at": registered_at,
+                })
+
+    def run_fleet(self, node_count, device_names, cycles, timeout_s):
+        self.run = SweepRun(node_count, device_names)
+        env = {**os.environ, "MAX_CYCLES": str(cycles)}
+        with open(os.devnull, "w") as devnull:
+            fleet = subprocess.Popen(
+                [sys.executable, "cli_tool.py", str(node_count), "--mode", "fork"],
+                env=env, stdout=devnull, stderr=subprocess.STDOUT,
+            )
+        started = time.monotonic()
+        provisioned_at = None
+        while fleet.poll() is None:
+            if time.monotonic() - started > timeout_s:
+                print(f"Fleet of {node_count} timed out, stopping it")
+                fleet.terminate()
+                fleet.wait()
+                break
+            if provisioned_at is None and self.poll_pending() == 0:
+                provisioned_at = time.monotonic()
+                print(f"{node_count} devices provisioned in {provisioned_at - started:.1f} s")
+            time.sleep(PROVISION_INTERVAL_S)
+        run, self.run = self.run, None
+        return run
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Node-count scaling sweep producing <node_count>.csv latency datasets")
+    parser.add_argument("output_path", help="directory for the <node_count>.csv files")
+    parser.add_argument("--node-counts", type=lambda v: [int(x) for x in v.split(",")], default=[1, 5, 10, 20])
+    parser.add_argument("--cycles", type=int, default=50, help="working cycles per device")
+    parser.add_argument("--sleep-interval-ms", type=int, default=1000)
+    parser.add_argument("--layer", type=int, default=GATEWAY_INFERENCE_LAYER, help="offloaded inference layer served by the gateway")
+    parser.add_argument("--model", default=BENCHMARK_MODEL_PATH, help=".tflite model of the gateway")
+    parser.add_argument("--max-batch-size", type=int, default=GATEWAY_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=GATEWAY_MAX_WAIT_MS)
+    parser.add_argument("--timeout", type=float, help="seconds per node count, default scaled from the cycles")
+    parser.add_argument("--batch", action="store_true", help="provision every device with a single batch command")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_path, exist_ok=True)
+    # every node count uses a prefix of the same device names
+    device_names = generate_device_names(max(args.node_counts))
+
+    client = mqtt.Client(client_id=f"scaling-sweep-{uuid.uuid4().hex[:8]}")
+    gateway = GatewayService(client, load_model(args.model), args.max_batch_size, args.max_wait_ms, args.layer)
+    sweep = ScalingSweep(client, gateway, args.layer, args.sleep_interval_ms, args.batch)
+
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe("export/+/sensor-data", qos=0)
+        client.subscribe("export/+/inf-latency-bench", qos=1)
+        client.subscribe("response/+/sensor-state/get/+", qos=1)
+        client.subscribe("response/+/batch/set/+", qos=1)
+
+    client.on_connect = on_connect
+    client.on_message = sweep.on_message
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+    gateway.start()
+    client.loop_start()
+
+    try:
+        for node_count in args.node_counts:
+            # startup, provisioning and the first sleep with the default interval take a while
+            timeout_s = args.timeout or 120 + 2 * args.cycles * args.sleep_interval_ms * 1.5 / 1000
+            print(f"Running {node_count} devices for {args.cycles} cycles...")
+            run = sweep.run_fleet(node_count, device_names[:node_count], args.cycles, timeout_s)
+            path = os.path.join(args.output_path, f"{node_count}.csv")
+            pd.DataFrame(run.rows, columns=["sensor_name", "inference_latency", "registered_at"]).to_csv(path, index=False)
+            print(f"Wrote {len(run.rows)} latencies of {node_count} devices to {path}")
+    finally:
+        client.loop_stop()
+        gateway.stop()
+        client.disconnect()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
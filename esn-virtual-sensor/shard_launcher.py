@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+import multiprocessing as mp
+from cli_tool import generate_device_names
+
+# Runs N devices in K worker processes (shards), each hosting many devices,
+# one thread per device. A supervisor restarts crashed shards, moves the
+# devices of a shard that keeps failing to the surviving ones and prints a
+# health report (cycles/s, publish rate, RSS per shard), also written to JSON.
+#
+#   python3 shard_launcher.py <n> [--shards K] [--report health.json]
+
+HEALTH_INTERVAL_S = 5
+MAX_RESTARTS = 3
+STOP_TIMEOUT_S = 10
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # peak, not current, RSS where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Shard:
+    """
+    The devices of one worker process.
+    """
+
+    def __init__(self, shard_id):
+        # imported in the worker, the supervisor does not load the device stack
+        from main import run_device
+        from mqtt_client import MQTTClient
+        from virtual_device import EdgeSensor
+
+        self.shard_id = shard_id
+        self._run_device = run_device
+        self._mqtt_client_class = MQTTClient
+        self._device_class = EdgeSensor
+        self.stop_event = threading.Event()
+        self.devices = {}
+
+    def add_device(self, device_name):
+        if device_name in self.devices:
+            return
+        mqtt_client = self._mqtt_client_class(device=self._device_class(name=device_name))
+        thread = threading.Thread(
+            target=self._run_device, args=(mqtt_client, self.stop_event), name=device_name, daemon=True
+        )
+        self.devices[device_name] = (mqtt_client, thread)
+        thread.start()
+
+    def health(self):
+        clients = [mqtt_client for mqtt_client, _ in self.devices.values()]
+        return {
+            "shard": self.shard_id,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "devices": len(self.devices),
+            "alive_devices": sum(thread.is_alive() for _, thread in self.devices.values()),
+            "connected_devices": sum(mqtt_client.client.is_connected() for mqtt_client in clients),
+            "cycles": sum(mqtt_client.device.get_cycle_counter() for mqtt_client in clients),
+            "published": sum(mqtt_client.published for mqtt_client in clients),
+            "rss_bytes": _rss_bytes(),
+        }
+
+    def stop(self):
+        self.stop_event.set()
+        for _, thread in self.devices.values():
+            thread.join(STOP_TIMEOUT_S)
+
+
+def run_shard(shard_id, device_names, inbox, health_queue, log_path=None):
+    # the devices print on every step, keep it out of the supervisor console
+    sys.stdout = open(log_path or os.devnull, "a", buffering=1)
+    shard = Shard(shard_id)
+    try:
+        for device_name in device_names:
+            shard.add_device(device_name)
+        while True:
+            try:
+                command, names = inbox.get(timeout=HEALTH_INTERVAL_S)
+                if command == "add":
+                    for device_name in names:
+                        shard.add_device(device_name)
+                elif command == "stop":
+                    break
+            except queue.Empty:
+                pass
+            health_queue.put(shard.health())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shard.stop()
+
+
+class ShardSupervisor:
+    def __init__(self, device_names, n_shards, max_restarts=MAX_RESTARTS, report_path=None, log_dir=None):
+        self.max_restarts = max_restarts
+        self.report_path = report_path
+        self.log_dir = log_dir
+        self.health_queue = mp.Queue()
+        self.stopping = False
+        self.shards = [
+            {
+                "id": k,
+                "device_names": device_names[k::n_shards],
+                "restarts": 0,
+                "failed": False,
+                "process": None,
+                "inbox": None,
+                "health": None,
+                "rates": {},
+            }
+            for k in range(min(n_shards, len(device_names)))
+        ]
+
+    def _spawn(self, shard):
+        shard["inbox"] = mp.Queue()
+        log_path = os.path.join(self.log_dir, f"shard-{shard['id']}.log") if self.log_dir else None
+        shard["process"] = mp.Process(
+            target=run_shard,
+            args=(shard["id"], list(shard["device_names"]), shard["inbox"], self.health_queue, log_path),
+            name=f"shard-{shard['id']}",
+        )
+        shard["process"].start()
+        print(f"Shard {shard['id']} started with {len(shard['device_names'])} devices (pid {shard['process'].pid})")
+
+    def start(self):
+        for shard in self.shards:
+            self._spawn(shard)
+
+    def _alive_shards(self):
+        return [shard for shard in self.shards if not shard["failed"] and shard["process"].is_alive()]
+
+    def _rebalance(self, failed_shard):
+        targets = self._alive_shards()
+        if not targets:
+            print(f"No shard left to take the devices of shard {failed_shard['id']}")
+            return
+        names, failed_shard["device_names"] = failed_shard["device_names"], []
+        # fill up the least loaded shards first
+        targets.sort(key=lambda shard: len(shard["device_names"]))
+        moved = {shard["id"]: [] for shard in targets}
+        for i, device_name in enumerate(names):
+            moved[targets[i % len(targets)]["id"]].append(device_name)
+        for shard in targets:
+            if moved[shard["id"]]:
+                shard["device_names"].extend(moved[shard["id"]])
+                shard["inbox"].put(("add", moved[shard["id"]]))
+                print(f"Moved {len(moved[shard['id']])} devices of shard {failed_shard['id']} to shard {shard['id']}")
+
+    def check_shards(self):
+        for shard in self.shards:
+            process = shard["process"]
+            if shard["failed"] or process.is_alive() or self.stopping:
+                continue
+            print(f"Shard {shard['id']} exited with code {process.exitcode}")
+            shard["health"], shard["rates"] = None, {}
+            if shard["restarts"] < self.max_restarts:
+                shard["restarts"] += 1
+                self._spawn(shard)
+            else:
+                shard["failed"] = True
+                self._rebalance(shard)
+
+    def collect_health(self):
+        while True:
+            try:
+                health = self.health_queue.get_nowait()
+            except queue.Empty:
+                return
+            shard = self.shards[health["shard"]]
+            if health["pid"] != shard["process"].pid:
+                # sent by a shard process that has since died
+                continue
+            previous = shard["health"]
+            if previous is not None and health["time"] > previous["time"]:
+                elapsed = health["time"] - previous["time"]
+                shard["rates"] = {
+                    "cycles_per_s": (health["cycles"] - previous["cycles"]) / elapsed,
+                    "publish_per_s": (health["published"] - previous["published"]) / elapsed,
+                }
+            shard["health"] = health
+
+    def report(self):
+        shards = []
+        for shard in self.shards:
+            health = shard["health"] or {}
+            shards.append({
+                "shard": shard["id"],
+                "pid": shard["process"].pid,
+                "alive": shard["process"].is_alive(),
+                "failed": shard["failed"],
+                "restarts": shard["restarts"],
+                "assigned_devices": len(shard["device_names"]),
+                "devices": health.get("alive_devices", 0),
+                "connected": health.get("connected_devices", 0),
+                "cycles": health.get("cycles", 0),
+                "published": health.get("published", 0),
+                "cycles_per_s": shard["rates"].get("cycles_per_s", 0.0),
+                "publish_per_s": shard["rates"].get("publish_per_s", 0.0),
+                "rss_mb": health.get("rss_bytes", 0) / 2**20,
+            })
+        totals = {
+            key: sum(shard[key] for shard in shards)
+            for key in ("assigned_devices", "devices", "connected", "cycles", "published", "cycles_per_s", "publish_per_s", "rss_mb")
+        }
+        return {"time": time.time(), "totals": totals, "shards": shards}
+
+    def print_report(self, report):
+        print(f"{'shard':>5} {'pid':>7} {'devices':>8} {'conn':>5} {'cycles/s':>9} {'pub/s':>8} {'rss MB':>8} {'restarts':>8}")
+        for shard in report["shards"] + [{"shard": "all", "pid": "", "restarts": "", **report["totals"]}]:
+            print(
+                f"{shard['shard']:>5} {shard['pid']:>7} {shard['devices']:>8} {shard['connected']:>5} "
+                f"{shard['cycles_per_s']:>9.2f} {shard['publish_per_s']:>8.2f} {shard['rss_mb']:>8.1f} {shard['restarts']:>8}"
+            )
+
+    def supervise(self):
+        while True:
+            time.sleep(HEALTH_INTERVAL_S)
+            self.collect_health()
+            self.check_shards()
+            report = self.report()
+            self.print_report(report)
+            if self.report_path:
+                with open(self.report_path, "w") as f:
+                    json.dump(report, f, indent=2)
+
+    def stop(self):
+        self.stopping = True
+        for shard in self.shards:
+            if shard["process"].is_alive():
+                shard["inbox"].put(("stop", None))
+        for shard in self.shards:
+            shard["process"].join(STOP_TIMEOUT_S)
+            if shard["process"].is_alive():
+                shard["process"].terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded fleet launcher")
+    parser.add_argument("n", type=int, help="number of devices")
+    parser.add_argument("--shards", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--max-restarts", type=int, default=MAX_RESTARTS, help="restarts of a shard before its devices are moved")
+    parser.add_argument("--report", help="JSON file for the health report, rewritten every interval")
+    parser.add_argument("--log-dir", help="directory for the per-shard device logs, discarded by default")
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.n <= 0 or args.shards <= 0:
+        print("The number of devices and shards must be greater than 0.")
+        sys.exit(1)
+
+    supervisor = ShardSupervisor(
+        generate_device_names(args.n), args.shards, args.max_restarts, args.report, args.log_dir
+    )
+    supervisor.start()
+    try:
+        supervisor.supervise()
+    except KeyboardInterrupt:
+        # the shards get the SIGINT too, ignore a second one while they stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        print("\nCtrl+C detected, stopping shards...")
+        supervisor.stop()
+        print("All shards stopped.")
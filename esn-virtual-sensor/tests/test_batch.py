@@ -0,0 +1,123 @@
+import json
+import pytest
+from pydantic import ValidationError
+from virtual_device import EdgeSensor
+from mqtt_client import _handle_command
+from mqtt_client.command import CommandFactory
+
+
+def _batch(*operations):
+    return {"batch": [{"resource": r, "method": m, "value": v} for r, m, v in operations]}
+
+
+def _unlocked_device():
+    device = EdgeSensor(name="ESP32_TEST")
+    device.trigger_startup_event()
+    return device
+
+
+class FakeMQTTClient:
+    def __init__(self, device):
+        self.device = device
+        self.group_updates = 0
+        self.published = []
+
+    def subscribe_groups(self):
+        self.group_updates += 1
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, json.loads(payload)))
+
+
+def test_applies_every_operation_in_order():
+    device = _unlocked_device()
+    payload = _batch(
+        ("sensor-config", "set", {"sleep_interval_ms": 1000}),
+        ("groups", "set", ["line-1"]),
+        ("sensor-state", "set", "locked"),
+        ("sensor-state", "set", "working"),
+        ("sensor-state", "get", None),
+    )
+    response = CommandFactory.create_command("set", "batch", payload).handle(device=device, uuid="u")
+
+    assert response.topic == "response/ESP32_TEST/batch/set/u"
+    assert response.payload["applied"] is True
+    assert response.payload["sensor-state"] == "working"
+    assert [result["status"] for result in response.payload["batch"]] == ["applied"] * 5
+    assert response.payload["batch"][-1]["response"] == {"sensor-state": "working"}
+    assert device.get_groups() == ("line-1",)
+
+
+@pytest.mark.parametrize("operation", [
+    ("sensor-config", "set", {"sleep_interval_ms": "soon"}),
+    ("inference-layer", "set", 7),
+    ("unknown-resource", "set", 1),
+    ("sensor-state", "delete", None),
+    ("groups", "set", ["line/1"]),
+])
+def test_invalid_operation_rejects_the_whole_batch(operation):
+    device = _unlocked_device()
+    payload = _batch(("groups", "set", ["line-1"]), operation)
+    with pytest.raises((ValueError, ValidationError)):
+        CommandFactory.create_command("set", "batch", payload)
+    # nothing was applied
+    assert device.get_groups() == ()
+    assert device.get_state() == "unlocked"
+
+
+def test_nested_batch_is_rejected():
+    nested = _batch(("sensor-state", "set", "locked"))["batch"]
+    with pytest.raises((ValueError, ValidationError), match="nested"):
+        CommandFactory.create_command("set", "batch", _batch(("batch", "set", nested)))
+
+
+def test_refused_set_stops_the_batch():
+    device = _unlocked_device()
+    payload = _batch(
+        ("groups", "set", ["line-1"]),
+        ("sensor-state", "set", "working"),  # refused: unlocked devices are locked first
+        ("sensor-config", "set", {"sleep_interval_ms": 1000}),
+        ("sensor-state", "get", None),
+    )
+    sleep_interval_ms = device.get_sleep_interval_ms()
+    response = CommandFactory.create_command("set", "batch", payload).handle(device=device, uuid="u")
+
+    assert response.payload["applied"] is False
+    assert [result["status"] for result in response.payload["batch"]] == ["applied", "rejected", "skipped", "skipped"]
+    assert all(result["response"] is None for result in response.payload["batch"][1:])
+    # applied operations are kept, the skipped ones never ran
+    assert device.get_groups() == ("line-1",)
+    assert device.get_state() == "unlocked"
+    assert device.get_sleep_interval_ms() == sleep_interval_ms
+
+
+def test_refused_setter_stops_the_batch():
+    device = _unlocked_device()
+    device.trigger_settings_locked_event()
+    payload = _batch(
+        ("sensor-config", "set", {"sleep_interval_ms": 1000}),  # refused while locked
+        ("sensor-state", "set", "working"),
+    )
+    response = CommandFactory.create_command("set", "batch", payload).handle(device=device, uuid="u")
+    assert [result["status"] for result in response.payload["batch"]] == ["rejected", "skipped"]
+    assert device.get_state() == "locked"
+
+
+def test_groups_set_in_a_batch_updates_the_subscriptions():
+    mqtt_client = FakeMQTTClient(_unlocked_device())
+    _handle_command(mqtt_client, "u1", "set", "batch", _batch(("sensor-config", "set", {"sleep_interval_ms": 1000})))
+    assert mqtt_client.group_updates == 0
+
+    _handle_command(mqtt_client, "u2", "set", "batch", _batch(
+        ("sensor-config", "set", {"sleep_interval_ms": 1000}),
+        ("groups", "set", ["line-1"]),
+    ))
+    assert mqtt_client.group_updates == 1
+    topic, payload = mqtt_client.published[-1]
+    assert topic == "response/ESP32_TEST/batch/set/u2"
+    assert payload["applied"] is True
+
+    _handle_command(mqtt_client, "u3", "set", "sensor-config", {"sensor-config": {"sleep_interval_ms": 1000}})
+    assert mqtt_client.group_updates == 1
+    _handle_command(mqtt_client, "u4", "set", "groups", {"groups": ["line-2"]})
+    assert mqtt_client.group_updates == 2
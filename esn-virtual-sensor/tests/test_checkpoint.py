@@ -0,0 +1,150 @@
+import os
+import gzip
+import base64
+import hashlib
+import threading
+import pytest
+import main
+from virtual_device import EdgeSensor, checkpoint
+
+FIXTURE_MODEL = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fixtures", "tiny_model.tflite")
+
+
+def _checkpoint(**changes):
+    fields = dict(
+        written_at_us=1_700_000_000_000_000,
+        cycle_counter=42,
+        pred_state_counter=7,
+        state="working",
+        inference_layer=1,
+        fallback_inference_layer=0,
+        sleep_interval_ms=30000,
+        history_maxlen=10,
+        history_head=3,
+        history_size=7,
+        history_buffer=bytes([0, 1, 1, 0, 1, 0, 0, 0, 0, 1]),
+        config={"wake_slot": None, "groups": ["line-1"]},
+        model_sha256=None,
+    )
+    fields.update(changes)
+    return checkpoint.Checkpoint(**fields)
+
+
+def _model_bytes():
+    pytest.importorskip("tensorflow")
+    with open(FIXTURE_MODEL, "rb") as f:
+        return f.read()
+
+
+def test_round_trip(tmp_path):
+    path = checkpoint.checkpoint_path(tmp_path, "ESP32_TEST")
+    for state in checkpoint.STATES:
+        saved = _checkpoint(state=state, model_sha256="ab" * 32)
+        checkpoint.write_checkpoint(path, saved)
+        assert checkpoint.read_checkpoint(path) == saved
+    # no temporary file is left behind
+    assert os.listdir(tmp_path) == ["ESP32_TEST.ckpt"]
+
+
+def test_device_round_trip(tmp_path):
+    model_bytes = _model_bytes()
+    device = EdgeSensor(name="ESP32_TEST")
+    device.trigger_startup_event()
+    device.update_model(base64.b64encode(gzip.compress(model_bytes)), len(model_bytes))
+    device.set_groups(["line-1"])
+    for label in [0, 2, 3, 2, 1]:
+        device.update_prediction_history(label)
+        device.update_pred_state_counter()
+    main.device_checkpoint(device, tmp_path)
+
+    resumed = EdgeSensor(name="ESP32_TEST")
+    assert main.device_resume(resumed, tmp_path)
+    assert resumed.get_state() == "unlocked"
+    assert resumed.get_groups() == ("line-1",)
+    assert resumed.get_model_bytes() == model_bytes
+    assert resumed.get_checkpoint()._replace(written_at_us=0) == device.get_checkpoint()._replace(written_at_us=0)
+
+
+@pytest.mark.parametrize("offset", [len(checkpoint.MAGIC), len(checkpoint.MAGIC) + checkpoint.CRC.size, -1])
+def test_corrupted_checkpoint_is_ignored(tmp_path, offset):
+    path = checkpoint.checkpoint_path(tmp_path, "ESP32_TEST")
+    checkpoint.write_checkpoint(path, _checkpoint())
+    with open(path, "r+b") as f:
+        data = bytearray(f.read())
+        data[offset] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+    assert checkpoint.read_checkpoint(path) is None
+
+
+def test_truncated_or_missing_checkpoint_is_ignored(tmp_path):
+    path = checkpoint.checkpoint_path(tmp_path, "ESP32_TEST")
+    assert checkpoint.read_checkpoint(path) is None
+    checkpoint.write_checkpoint(path, _checkpoint())
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 1)
+    assert checkpoint.read_checkpoint(path) is None
+
+
+def test_missing_model(tmp_path):
+    model_bytes = b"not a real model"
+    model_sha256 = hashlib.sha256(model_bytes).hexdigest()
+    assert checkpoint.read_model(tmp_path, model_sha256) is None
+
+    checkpoint.write_model(tmp_path, model_sha256, model_bytes)
+    assert checkpoint.read_model(tmp_path, model_sha256) == model_bytes
+
+    # a model that does not match its hash counts as missing
+    with open(checkpoint.model_path(tmp_path, model_sha256), "wb") as f:
+        f.write(b"tampered")
+    assert checkpoint.read_model(tmp_path, model_sha256) is None
+
+
+def test_resume_without_model_file_resumes_unlocked(tmp_path):
+    device = EdgeSensor(name="ESP32_TEST")
+    saved = _checkpoint(model_sha256="cd" * 32)
+    checkpoint.write_checkpoint(checkpoint.checkpoint_path(tmp_path, device.name), saved)
+    assert main.device_resume(device, tmp_path)
+    assert device.get_state() == "unlocked"
+    assert device.get_model_bytes() is None
+
+
+def _run_concurrently(n_threads, target):
+    barrier = threading.Barrier(n_threads)
+    errors = []
+
+    def run():
+        barrier.wait()
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_concurrent_model_writes(tmp_path):
+    # devices of one shard process checkpoint the same model on the same cycle
+    model_bytes = os.urandom(64 * 1024)
+    model_sha256 = hashlib.sha256(model_bytes).hexdigest()
+    for trial in range(50):
+        directory = tmp_path / str(trial)
+        errors = _run_concurrently(8, lambda: checkpoint.write_model(directory, model_sha256, model_bytes))
+        assert errors == []
+        assert checkpoint.read_model(directory, model_sha256) == model_bytes
+        assert os.listdir(directory / checkpoint.MODELS_DIR) == [f"{model_sha256}.tflite"]
+
+
+def test_concurrent_checkpoint_writes(tmp_path):
+    path = checkpoint.checkpoint_path(tmp_path, "ESP32_TEST")
+    for trial in range(50):
+        saved = _checkpoint(cycle_counter=trial)
+        errors = _run_concurrently(8, lambda: checkpoint.write_checkpoint(path, saved))
+        assert errors == []
+        assert checkpoint.read_checkpoint(path) == saved
+    assert os.listdir(tmp_path) == ["ESP32_TEST.ckpt"]
@@ -0,0 +1,23 @@
+import virtual_device
+from virtual_device import EdgeSensor
+from mqtt_client.command import CommandFactory
+from config import SENSOR_INFERENCE_LAYER
+
+
+def test_get_does_not_run_the_latency_policy(monkeypatch):
+    monkeypatch.setattr(virtual_device, "ADAPTIVE_INFERENCE", True)
+    monkeypatch.setattr(virtual_device, "LATENCY_AWARE_INFERENCE", True)
+    device = EdgeSensor(name="ESP32_TEST")
+    policy = device._latency_policy
+    policy.probe_interval = 3
+
+    for _ in range(10):
+        response = CommandFactory.create_command("get", "inference-layer", {"inference-layer": None}).handle(device=device, uuid="u")
+        assert response.payload == {"inference-layer": SENSOR_INFERENCE_LAYER}
+    assert policy.last_decision is None
+
+    # the first probe is still made by the device cycle
+    layers = [device.get_inference_layer() for _ in range(3)]
+    assert layers[:2] == [SENSOR_INFERENCE_LAYER] * 2
+    assert layers[2] != SENSOR_INFERENCE_LAYER
+    assert device.get_active_inference_layer() == SENSOR_INFERENCE_LAYER
@@ -0,0 +1,93 @@
+import random
+from collections import deque
+import pytest
+from virtual_device import EdgeSensor
+from virtual_device.prediction_history import PredictionHistory
+from config import (
+    PREDICTION_HISTORY_LENGTH,
+    ABNORMAL_LABELS,
+    ABNORMAL_PREDICTION_THRESHOLD,
+    DEVICE_BATTERY_LIFETIME_IN_CYCLES,
+    SENSOR_INFERENCE_LAYER,
+    GATEWAY_INFERENCE_LAYER,
+)
+
+
+class DequeHistoryHeuristic:
+    """
+    The heuristic as it was before the ring buffer: a deque history summed on
+    every decision.
+    """
+
+    def __init__(self, is_low_battery):
+        self.is_low_battery = is_low_battery
+        self.history = deque(maxlen=PREDICTION_HISTORY_LENGTH)
+        self.pred_state_counter = 0
+
+    def update(self, prediction):
+        self.history.append(1 if prediction in ABNORMAL_LABELS else 0)
+        self.pred_state_counter += 1
+
+    def clear(self):
+        self.history = deque(maxlen=PREDICTION_HISTORY_LENGTH)
+        self.pred_state_counter = 0
+
+    def decide(self):
+        assert self.pred_state_counter >= len(self.history)
+        if self.is_low_battery():
+            return GATEWAY_INFERENCE_LAYER
+        if self.pred_state_counter < PREDICTION_HISTORY_LENGTH:
+            return SENSOR_INFERENCE_LAYER
+        if sum(self.history) >= ABNORMAL_PREDICTION_THRESHOLD:
+            return GATEWAY_INFERENCE_LAYER
+        return SENSOR_INFERENCE_LAYER
+
+
+def _prediction_stream(rng, cycles):
+    # normal stretches with abnormal bursts, like the experiment sequence
+    abnormal_rate = 0.1
+    for _ in range(cycles):
+        if rng.random() < 0.05:
+            abnormal_rate = rng.choice([0.05, 0.3, 0.6, 0.9])
+        yield rng.choice(ABNORMAL_LABELS) if rng.random() < abnormal_rate else rng.choice([0, 1])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_same_decisions_as_deque_history(seed):
+    rng = random.Random(seed)
+    device = EdgeSensor(name=f"ESP32_TEST_{seed}")
+    reference = DequeHistoryHeuristic(device.is_device_low_battery)
+
+    cycles = DEVICE_BATTERY_LIFETIME_IN_CYCLES + 500 # long enough to reach low battery
+    for cycle, prediction in enumerate(_prediction_stream(rng, cycles)):
+        device.update_prediction_history(prediction)
+        device.update_pred_state_counter()
+        reference.update(prediction)
+
+        decision = device.sensor_adaptive_inference_heuristic()
+        assert decision == reference.decide(), f"cycle {cycle}"
+        assert device._prediction_history.abnormal_count() == sum(reference.history)
+
+        # the history is cleared when the layer is adapted, and now and then by a reset
+        if decision != SENSOR_INFERENCE_LAYER or rng.random() < 0.01:
+            device.clear_prediction_history()
+            device.clear_pred_state_counter()
+            reference.clear()
+        device.update_cycle_counter()
+
+
+def test_ring_buffer_matches_deque():
+    rng = random.Random(0)
+    history = PredictionHistory(maxlen=PREDICTION_HISTORY_LENGTH)
+    reference = deque(maxlen=PREDICTION_HISTORY_LENGTH)
+    for _ in range(10000):
+        if rng.random() < 0.02:
+            history.clear()
+            reference.clear()
+        else:
+            flag = rng.random() < 0.4
+            history.append(flag)
+            reference.append(int(flag))
+        assert list(history) == list(reference)
+        assert history.abnormal_count() == sum(reference)
+        assert history.is_full() == (len(reference) == PREDICTION_HISTORY_LENGTH)
@@ -0,0 +1,288 @@
+import os
+import mmap
+import sys
+import time
+import uuid
+import struct
+import bisect
+import argparse
+from collections import deque
+import paho.mqtt.client as mqtt
+from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT
+
+# Records every MQTT message of a run into an append-only binary log and
+# replays it to a broker at any speed, optionally multiplying the devices.
+#
+#   python3 traffic.py record run.mqtrace
+#   python3 traffic.py replay run.mqtrace --speed 10 --multiply 20
+#   python3 traffic.py info run.mqtrace
+#
+# Log layout (little endian), after the MAGIC header:
+#   topic record:   b"T" u32 topic_id, u16 length, topic bytes
+#   message record: b"M" u64 t_ns, u32 topic_id, u8 qos, u32 length, payload bytes
+# Topics are written once and then referred to by id. t_ns is the monotonic
+# time since the start of the recording.
+#
+# The index file (<log>.idx) holds one (t_ns, offset, topic count) entry
+# every INDEX_INTERVAL messages and <log>.topics the topics in id order, so a
+# replay can seek to a time without scanning the log. Both can always be
+# rebuilt from the log.
+
+MAGIC = b"MQTRACE1"
+TOPIC = b"T"
+MESSAGE = b"M"
+TOPIC_HEADER = struct.Struct("<IH")
+MESSAGE_HEADER = struct.Struct("<QIBI")
+INDEX_ENTRY = struct.Struct("<QQI")
+INDEX_INTERVAL = 1024
+WRITE_BUFFER_BYTES = 1 << 20
+# messages a replay keeps queued in the client before waiting for the oldest
+REPLAY_WINDOW = 1000
+# topics that carry the device name in their second level
+DEVICE_TOPIC_PREFIXES = ("export", "command", "response")
+
+
+class TrafficWriter:
+    def __init__(self, path):
+        self.path = path
+        self._log = open(path, "wb", buffering=WRITE_BUFFER_BYTES)
+        self._index = open(path + ".idx", "wb")
+        self._topic_table = open(path + ".topics", "w")
+        self._log.write(MAGIC)
+        self._offset = len(MAGIC)
+        self._topics = {}
+        self._start_ns = time.monotonic_ns()
+        self.messages = 0
+
+    def write(self, topic, payload, qos, t_ns=None):
+        if t_ns is None:
+            t_ns = time.monotonic_ns() - self._start_ns
+        topic_id = self._topics.get(topic)
+        if topic_id is None:
+            topic_id = self._topics[topic] = len(self._topics)
+            encoded = topic.encode()
+            self._log.write(TOPIC + TOPIC_HEADER.pack(topic_id, len(encoded)) + encoded)
+            self._topic_table.write(topic + "\n")
+            self._offset += 1 + TOPIC_HEADER.size + len(encoded)
+        if self.messages % INDEX_INTERVAL == 0:
+            self._index.write(INDEX_ENTRY.pack(t_ns, self._offset, len(self._topics)))
+        self._log.write(MESSAGE + MESSAGE_HEADER.pack(t_ns, topic_id, qos, len(payload)))
+        self._log.write(payload)
+        self._offset += 1 + MESSAGE_HEADER.size + len(payload)
+        self.messages += 1
+
+    def close(self):
+        self._log.close()
+        self._index.close()
+        self._topic_table.close()
+
+
+class TrafficReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a traffic log")
+        self.topics = self._load_topics()
+        self.index = self._load_index()
+
+    def _load_topics(self):
+        topics_path = self.path + ".topics"
+        if not os.path.exists(topics_path):
+            return []
+        with open(topics_path) as f:
+            # a partially written last line is ignored, the log has the full topic
+            lines = f.read().split("\n")
+        return lines[:-1]
+
+    def _load_index(self):
+        index_path = self.path + ".idx"
+        if not os.path.exists(index_path):
+            return self.build_index()
+        with open(index_path, "rb") as f:
+            raw = f.read()
+        # a partially written last entry (e.g. the recorder was killed) is ignored
+        raw = raw[:len(raw) - len(raw) % INDEX_ENTRY.size]
+        return [entry for entry in INDEX_ENTRY.iter_unpack(raw)]
+
+    def build_index(self):
+        index = []
+        for i, (t_ns, offset, n_topics, _, _, _) in enumerate(self._records(len(MAGIC))):
+            if i % INDEX_INTERVAL == 0:
+                index.append((t_ns, offset, n_topics))
+        with open(self.path + ".idx", "wb") as f:
+            for entry in index:
+                f.write(INDEX_ENTRY.pack(*entry))
+        return index
+
+    def _records(self, offset):
+        """
+        Yields (t_ns, offset, topics known, topic_id, qos, payload) of every
+        message from offset on. Topic records are collected into self.topics.
+        """
+        data, end = self._data, len(self._data)
+        while offset < end:
+            kind = data[offset:offset + 1]
+            if kind == TOPIC:
+                header_end = offset + 1 + TOPIC_HEADER.size
+                if header_end > end:
+                    return
+                topic_id, length = TOPIC_HEADER.unpack_from(data, offset + 1)
+                if topic_id == len(self.topics):
+                    self.topics.append(data[header_end:header_end + length].decode())
+                offset = header_end + length
+            elif kind == MESSAGE:
+                header_end = offset + 1 + MESSAGE_HEADER.size
+                if header_end > end:
+                    return
+                t_ns, topic_id, qos, length = MESSAGE_HEADER.unpack_from(data, offset + 1)
+                if header_end + length > end:
+                    # truncated last record
+                    return
+                yield t_ns, offset, len(self.topics), topic_id, qos, data[header_end:header_end + length]
+                offset = header_end + length
+            else:
+                raise ValueError(f"Corrupted traffic log at offset {offset}")
+
+    def messages(self, start_s=0):
+        """
+        Yields (t_ns, topic, qos, payload) of every message recorded at or after start_s.
+        """
+        offset, start_ns = len(MAGIC), int(start_s * 1e9)
+        if start_ns and self.index:
+            i = bisect.bisect_right([entry[0] for entry in self.index], start_ns) - 1
+            if i > 0 and len(self.topics) >= self.index[i][2]:
+                # the topics defined before the index entry are already known
+                offset = self.index[i][1]
+        for t_ns, _, _, topic_id, qos, payload in self._records(offset):
+            if t_ns >= start_ns:
+                yield t_ns, self.topics[topic_id], qos, payload
+
+
+def device_topic_variants(topic, multiply):
+    """
+    The topic for each of the multiply copies of its device, copy 0 keeps the
+    original name, copy k is renamed <device>_<k>.
+    """
+    levels = topic.split("/")
+    if multiply <= 1 or len(levels) < 2 or levels[0] not in DEVICE_TOPIC_PREFIXES:
+        return [topic]
+    variants = [topic]
+    for k in range(1, multiply):
+        levels[1] = f"{topic.split('/')[1]}_{k}"
+        variants.append("/".join(levels))
+    return variants
+
+
+def record(path, topics, duration_s=None):
+    writer = TrafficWriter(path)
+    client = mqtt.Client(client_id=f"recorder-{uuid.uuid4().hex[:8]}")
+
+    def on_connect(client, userdata, flags, rc):
+        for topic in topics:
+            client.subscribe(topic, qos=1)
+
+    def on_message(client, userdata, msg):
+        writer.write(msg.topic, msg.payload, msg.qos)
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+    print(f"Recording {', '.join(topics)} to {path}...")
+    try:
+        # the network loop runs in this thread, so the writer needs no lock
+        deadline = None if duration_s is None else time.monotonic() + duration_s
+        while deadline is None or time.monotonic() < deadline:
+            client.loop(timeout=0.1)
+    except KeyboardInterrupt:
+        pass
+    client.disconnect()
+    writer.close()
+    print(f"Recorded {writer.messages} messages")
+
+
+def replay(path, speed=1.0, multiply=1, start_s=0):
+    """
+    Publishes the recorded traffic again. speed scales the recorded timing
+    (2 is twice as fast), 0 publishes as fast as possible. At most
+    REPLAY_WINDOW messages are waiting to be sent at any time, a slower broker
+    slows the replay down instead of growing the client queue.
+    """
+    reader = TrafficReader(path)
+    client = mqtt.Client(client_id=f"replayer-{uuid.uuid4().hex[:8]}")
+    client.max_queued_messages_set(REPLAY_WINDOW)
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+    client.loop_start()
+
+    variants = {}
+    pending = deque()
+    published = 0
+    first_ns = None
+    started = time.monotonic()
+    for t_ns, topic, qos, payload in reader.messages(start_s):
+        if speed > 0:
+            if first_ns is None:
+                first_ns = t_ns
+            delay = (t_ns - first_ns) / 1e9 / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        topic_variants = variants.get(topic)
+        if topic_variants is None:
+            topic_variants = variants[topic] = device_topic_variants(topic, multiply)
+        for variant in topic_variants:
+            if len(pending) == REPLAY_WINDOW:
+                pending.popleft().wait_for_publish()
+            pending.append(client.publish(variant, payload, qos=qos))
+        published += len(topic_variants)
+
+    # the last messages are sent before disconnecting
+    for message_info in pending:
+        message_info.wait_for_publish()
+    elapsed = time.monotonic() - started
+    client.loop_stop()
+    client.disconnect()
+    print(f"Replayed {published} messages in {elapsed:.2f} s ({published / max(elapsed, 1e-9):.0f} msg/s)")
+
+
+def info(path):
+    reader = TrafficReader(path)
+    counts, size, last_ns = {}, 0, 0
+    for t_ns, topic, _, payload in reader.messages():
+        levels = topic.split("/")
+        key = "/".join([levels[0], "+", *levels[2:3]]) if len(levels) > 2 else topic
+        counts[key] = counts.get(key, 0) + 1
+        size += len(payload)
+        last_ns = t_ns
+    total = sum(counts.values())
+    print(f"{path}: {total} messages, {len(reader.topics)} topics, {size} payload bytes, {last_ns / 1e9:.1f} s")
+    for key, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"  {key:<40} {count}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="MQTT traffic recorder and replayer")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--topic", action="append", help="topic filter (repeatable), default #")
+    record_parser.add_argument("--duration", type=float, help="seconds to record, default until Ctrl+C")
+    replay_parser = subparsers.add_parser("replay")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="time scaling, 0 for as fast as possible")
+    replay_parser.add_argument("--multiply", type=int, default=1, help="copies of every device")
+    replay_parser.add_argument("--start", type=float, default=0, help="seconds into the recording to start from")
+    info_parser = subparsers.add_parser("info")
+    info_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        record(args.path, args.topic or ["#"], args.duration)
+    elif args.command == "replay":
+        replay(args.path, args.speed, args.multiply, args.start)
+    else:
+        info(args.path)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,5 +1,15 @@
 from inference.tf_model_manager import TFModelManager
 from state_machine import StateMachine
+from virtual_device.prediction_history import PredictionHistory
+from virtual_device.latency_policy import LatencyAwarePolicy
+from virtual_device.snapshot import DeviceSnapshot
+from virtual_device.clock import ClockOffsetEstimator, now_us
+from virtual_device.wake_slot import WakeSlot
+from virtual_device.features import FeatureSet, extract_features
+from virtual_device.checkpoint import Checkpoint
+from instrumentation import make_lock, lock_stats
+from instrumentation.stage_timer import StageTimer, MODEL_UPDATE
+from instrumentation.profiler import CycleProfiler
 from dataset import MeasurementHandler
 from config import (
     FALLBACK_INFERENCE_LAYER,
@@ -11,11 +21,19 @@ from config import (
     LOW_BATTERY_THRESHOLD,
     SENSOR_INFERENCE_LAYER,
     GATEWAY_INFERENCE_LAYER,
+    LATENCY_AWARE_INFERENCE,
+    LATENCY_SLO_US,
+    LATENCY_EWMA_ALPHA,
+    LATENCY_SLO_MARGIN,
+    LATENCY_POLICY_HYSTERESIS,
+    LATENCY_PROBE_INTERVAL,
+    LAYER_ENERGY_COST,
+    SYNTHETIC_DATASET,
+    SYNTHETIC_SEED,
 )
-from collections import deque
+import zlib
 import random
-
-import threading
+import contextlib
 
 # --- Config class ---
 class EdgeSensorConfig:
@@ -30,24 +48,16 @@ class EdgeSensor:
     _sleeping = False
     _cycle_counter = 0
     _pred_state_counter = 0
-    _prediction_history = deque(maxlen=PREDICTION_HISTORY_LENGTH)
-    _mh = MeasurementHandler()
-
-    # critical section variables
-
-    # Inference-related variables
-    _inference_mutex = threading.Lock()
-    _inference_layer = SENSOR_INFERENCE_LAYER
-    _fallback_inference_layer = FALLBACK_INFERENCE_LAYER
 
-    # State-related variables
-    _state_mutex = threading.Lock()
-    _sm = StateMachine()
-    _model_manager = TFModelManager()
-
-    # Config-related variables
-    _config_mutex = threading.Lock()
-    _config = EdgeSensorConfig(sleep_interval_ms=10000)
+    # critical section variables, created per device in the constructor:
+    # - inference-related: _inference_mutex, _inference_layer, _fallback_inference_layer
+    # - state-related: _state_mutex, _sm, _model_manager
+    # - config-related: _config_mutex, _config
+    # - measurement-related: _mh, its counters are per device, the dataset is shared
+    # writers serialize on these mutexes and then publish a new immutable
+    # _snapshot under the _snapshot_mutex, readers of the snapshot take no lock.
+    # The three device mutexes are reentrant, transaction() holds all of them
+    # (state, inference, config, always in this order) around several writes
 
     # --- Sensor Adaptive Inference Heuristic ---
     def sensor_adaptive_inference_heuristic(self):
@@ -62,7 +72,7 @@ class EdgeSensor:
         u_t = self._pred_state_counter
         assert u_t >= len(self._prediction_history)
         m = PREDICTION_HISTORY_LENGTH
-        sigma_M_t = sum(self._prediction_history)
+        sigma_M_t = self._prediction_history.abnormal_count()
         low_battery = self.is_device_low_battery()
         psi_s = ABNORMAL_PREDICTION_THRESHOLD
 
@@ -100,22 +110,76 @@ class EdgeSensor:
     
     def update_prediction_history(self, prediction):
         is_abnormal = 1 if prediction in ABNORMAL_LABELS else 0
-        _pred_history = self._get_prediction_history()
-        _pred_history.append(is_abnormal)
-        self._set_prediction_history(_pred_history)
+        self._get_prediction_history().append(is_abnormal)
 
     def clear_prediction_history(self):
-        self._set_prediction_history(deque(maxlen=PREDICTION_HISTORY_LENGTH))
+        # the ring buffer is reset in place, no new buffer is allocated
+        self._get_prediction_history().clear()
 
     # --- Constructor ---
     def __init__(self, name):
         self.name = name
 
+        # Inference-related variables
+        self._inference_mutex = make_lock("inference", reentrant=True)
+        self._inference_layer = SENSOR_INFERENCE_LAYER
+        self._fallback_inference_layer = FALLBACK_INFERENCE_LAYER
+
+        # State-related variables
+        self._state_mutex = make_lock("state", reentrant=True)
+        self._sm = StateMachine()
+        self._model_manager = TFModelManager()
+
+        # Config-related variables
+        self._config_mutex = make_lock("config", reentrant=True)
+        self._config = EdgeSensorConfig(sleep_interval_ms=10000)
+
+        # Measurement-related variables
+        if SYNTHETIC_DATASET:
+            # imported here, the generator is only needed for scale tests
+            from dataset.synthetic import SyntheticMeasurementHandler
+            self._mh = SyntheticMeasurementHandler(seed=zlib.crc32(name.encode()) ^ SYNTHETIC_SEED)
+        else:
+            self._mh = MeasurementHandler()
+
+        # Per-stage timing of the device cycle, see instrumentation.stage_timer
+        self.stage_timer = StageTimer()
+
+        # On-demand profiling, armed by the profile resource, see instrumentation.profiler
+        self.profiler = CycleProfiler()
+
+        # Clock-related variables, the estimator publishes its fit atomically
+        self._clock_estimator = ClockOffsetEstimator()
+
+        # Snapshot-related variables
+        self._snapshot_mutex = make_lock("snapshot")
+        self._snapshot = DeviceSnapshot(
+            state=self._sm.state,
+            inference_layer=self._inference_layer,
+            fallback_inference_layer=self._fallback_inference_layer,
+            sleep_interval_ms=self._config.sleep_interval_ms,
+        )
+
+        self._prediction_history = PredictionHistory(maxlen=PREDICTION_HISTORY_LENGTH)
+        self._latency_policy = LatencyAwarePolicy(
+            slo_us=LATENCY_SLO_US,
+            alpha=LATENCY_EWMA_ALPHA,
+            energy_cost=LAYER_ENERGY_COST,
+            hysteresis=LATENCY_POLICY_HYSTERESIS,
+            margin=LATENCY_SLO_MARGIN,
+            probe_interval=LATENCY_PROBE_INTERVAL,
+        )
+
     # --- Inference-related methods --- [MUST use the _inference_mutex]
     def update_model(self, tf_model_b64, tf_model_bytesize):
+        # returns whether the model was updated, like the other guarded setters
         state = self.get_state()
         if state == "unlocked" or state == "idle":
+            t0 = self.stage_timer.start()
             self._model_manager.update_model(tf_model_b64, tf_model_bytesize)
+            self.stage_timer.stop(MODEL_UPDATE, t0)
+            return True
+        return False
 
     def predict(self, input_data):
         state = self.get_state()
@@ -130,12 +194,28 @@ class EdgeSensor:
             return output_label
 
     def _get_fallback_inference_layer(self):
+        return self._snapshot.fallback_inference_layer
+
+    def _get_latency_aware_inference_layer(self):
+        low_battery = self.is_device_low_battery()
+
         with self._inference_mutex:
-            return self._fallback_inference_layer
+            selected = self._latency_policy.decide(self._inference_layer, low_battery)
+            if selected != self._inference_layer:
+                layers = ["SENSOR_INFERENCE_LAYER", "GATEWAY_INFERENCE_LAYER", "CLOUD_INFERENCE_LAYER"]
+                print(f"Adapting inference layer to {layers[selected]}")
+                self._inference_layer = selected
+                self._publish_snapshot(inference_layer=selected)
+            probe_layer = self._latency_policy.last_decision["probe_layer"]
+            if probe_layer is not None:
+                # this cycle only, the active layer stays as it is
+                print(f"Probing inference layer {probe_layer}")
+                return probe_layer
+            return self._inference_layer
 
     def _get_inference_layer(self):
-        low_battery = self.is_device_low_battery()
-        prediction_history = self._prediction_history
+        if LATENCY_AWARE_INFERENCE:
+            return self._get_latency_aware_inference_layer()
 
         with self._inference_mutex:
             # the heuristic is only called when the inference layer is set to SENSOR_INFERENCE_LAYER
@@ -148,6 +228,7 @@ class EdgeSensor:
                     self.clear_prediction_history()
                     self.clear_pred_state_counter()
                     self._inference_layer = heuristic_result
+                    self._publish_snapshot(inference_layer=heuristic_result)
 
                     layers = ["SENSOR_INFERENCE_LAYER", "GATEWAY_INFERENCE_LAYER"]
                     print(f"Adapting inference layer to {layers[heuristic_result]}")
@@ -160,11 +241,29 @@ class EdgeSensor:
         else:
             return self._get_fallback_inference_layer()
 
+    def get_active_inference_layer(self):
+        # current layer, without running the adaptive policy
+        if ADAPTIVE_INFERENCE:
+            return self._snapshot.inference_layer
+        else:
+            return self._get_fallback_inference_layer()
+
+    def record_inference_latency(self, inference_layer, latency_us):
+        with self._inference_mutex:
+            self._latency_policy.observe(inference_layer, latency_us)
+
+    def get_policy_decision(self):
+        with self._inference_mutex:
+            return self._latency_policy.last_decision
+
     def _set_fallback_inference_layer(self, value):
         state = self.get_state()
         with self._inference_mutex:
             if state == "unlocked":
                 self._fallback_inference_layer = value
+                self._publish_snapshot(fallback_inference_layer=value)
+                return True
+            return False
 
     def _set_inference_layer(self, value):
         state = self.get_state()
@@ -173,48 +272,79 @@ class EdgeSensor:
                 layers = ["SENSOR_INFERENCE_LAYER", "GATEWAY_INFERENCE_LAYER", "CLOUD_INFERENCE_LAYER"]
                 print(f"Setting inference layer to {layers[value]}")
                 self._inference_layer = value
+                self._publish_snapshot(inference_layer=value)
+                return True
+            return False
 
     def set_inference_layer(self, value):
         ""
         if ADAPTIVE_INFERENCE:
-            self._set_inference_layer(value)
+            return self._set_inference_layer(value)
         else:
-            self._set_fallback_inference_layer(value)
+            return self._set_fallback_inference_layer(value)
 
-    # --- State-related methods --- [MUST use the _state_mutex]
+    # --- Snapshot-related methods ---
+    def get_snapshot(self) -> DeviceSnapshot:
+        return self._snapshot
+
+    def _publish_snapshot(self, **changes):
+        # the new snapshot is built aside and published with a single
+        # reference assignment, so readers never see a partial update
+        with self._snapshot_mutex:
+            self._snapshot = self._snapshot._replace(**changes)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Holds the state, inference and config mutexes, the writes made inside
+        do not interleave with any other writer (commands, adaptive inference).
+        """
+        with self._state_mutex, self._inference_mutex, self._config_mutex:
+            yield self
+
+    def get_lock_stats(self):
+        return lock_stats(self._state_mutex, self._inference_mutex, self._config_mutex, self._snapshot_mutex)
+
+    # --- State-related methods --- [writers MUST use the _state_mutex]
     def get_state(self):
-        with self._state_mutex:
-            return self._sm.state
+        return self._snapshot.state
 
     def trigger_startup_event(self):
         with self._state_mutex:
             self._sm.startup_event()
+            self._publish_snapshot(state=self._sm.state)
 
     def trigger_settings_locked_event(self):
         with self._state_mutex:
             self._sm.settings_locked_event()
+            self._publish_snapshot(state=self._sm.state)
 
     def trigger_settings_unlocked_event(self):
         with self._state_mutex:
             self._sm.settings_unlocked_event()
+            self._publish_snapshot(state=self._sm.state)
 
     def trigger_sensor_started_event(self):
         with self._state_mutex:
             self._sm.sensor_started_event()
+            self._publish_snapshot(state=self._sm.state)
 
     def trigger_sensor_stopped_event(self):
         with self._state_mutex:
             self._sm.sensor_stopped_event()
+            self._publish_snapshot(state=self._sm.state)
 
     def trigger_sensor_error_event(self):
         with self._state_mutex:
             self._sm.sensor_error_event()
+            self._publish_snapshot(state=self._sm.state)
 
     def trigger_sensor_reset_event(self):
         with self._state_mutex:
             self._sm.sensor_reset_event()
+            self._publish_snapshot(state=self._sm.state)
 
-    # --- Config-related methods [must use the _config_mutex] ---
+    # --- Config-related methods [writers must use the _config_mutex] ---
 
     def get_sensor_config(self):
         with self._config_mutex:
@@ -225,11 +355,149 @@ class EdgeSensor:
         if state == "unlocked" or state == "idle":
             with self._config_mutex:
                 self._config = EdgeSensorConfig(**value)
+                self._publish_snapshot(sleep_interval_ms=self._config.sleep_interval_ms)
+                return True
+        return False
     
     def get_sleep_interval_ms(self):
-        config = self.get_sensor_config()
-        return config.sleep_interval_ms
+        return self._snapshot.sleep_interval_ms
+
+    def set_wake_slot(self, period_ms, offset_ms, epoch_us):
+        # a period of 0 drops the slot, the device sleeps its own interval again
+        state = self.get_state()
+        if state == "unlocked" or state == "idle":
+            wake_slot = WakeSlot(period_ms, offset_ms, epoch_us) if period_ms > 0 else None
+            with self._config_mutex:
+                self._publish_snapshot(wake_slot=wake_slot)
+            return True
+        return False
+
+    def get_wake_slot(self):
+        return self._snapshot.wake_slot
+
+    def set_feature_set(self, features, include_raw, fft_bands):
+        feature_set = FeatureSet(tuple(features), include_raw, fft_bands)
+        with self._config_mutex:
+            self._publish_snapshot(feature_set=feature_set)
+
+    def get_feature_set(self) -> FeatureSet:
+        return self._snapshot.feature_set
+
+    def set_groups(self, groups):
+        # command/group/<group>/... topics the device subscribes to
+        with self._config_mutex:
+            self._publish_snapshot(groups=tuple(dict.fromkeys(groups)))
+
+    def get_groups(self):
+        return self._snapshot.groups
+
+    def extract_features(self, measurement):
+        """
+        Features of the measurement for an offloaded reading, None when the
+        feature set is empty and the raw window is sent instead.
+        """
+        feature_set = self._snapshot.feature_set
+        if not feature_set.features:
+            return None
+        return extract_features(measurement, feature_set)
+
+    def get_next_sleep_ms(self):
+        """
+        Sleep until the next assigned wake-up slot, or the sleep interval
+        when the scheduler did not assign one.
+        """
+        wake_slot = self._snapshot.wake_slot
+        if wake_slot is None:
+            return self.get_sleep_interval_ms()
+        device_now = now_us()
+        return wake_slot.ms_until_next(self._clock_estimator.to_backend_time(device_now))
+
+
+    # --- Checkpoint-related methods ---
+    def get_checkpoint(self) -> Checkpoint:
+        """
+        Everything a restarted device needs to resume, see virtual_device.checkpoint.
+        The model itself is stored apart, under its hash.
+        """
+        snapshot = self._snapshot
+        with self._inference_mutex:
+            history_buffer, history_head, history_size = self._prediction_history.dump()
+            pred_state_counter = self._pred_state_counter
+        config = {
+            "wake_slot": None if snapshot.wake_slot is None else snapshot.wake_slot._asdict(),
+            "feature_set": {**snapshot.feature_set._asdict(), "features": list(snapshot.feature_set.features)},
+            "groups": list(snapshot.groups),
+        }
+        return Checkpoint(
+            written_at_us=now_us(),
+            cycle_counter=self.get_cycle_counter(),
+            pred_state_counter=pred_state_counter,
+            state=snapshot.state,
+            inference_layer=snapshot.inference_layer,
+            fallback_inference_layer=snapshot.fallback_inference_layer,
+            sleep_interval_ms=snapshot.sleep_interval_ms,
+            history_maxlen=self._prediction_history.maxlen,
+            history_head=history_head,
+            history_size=history_size,
+            history_buffer=history_buffer,
+            config=config,
+            model_sha256=self._model_manager.get_model_sha256(),
+        )
+
+    def get_model_bytes(self):
+        return self._model_manager.get_model_bytes()
+
+    def load_model_bytes(self, model_bytes):
+        # a raw .tflite model given at launch or resume, whatever the state,
+        # models pushed over MQTT go through update_model
+        self._model_manager.load_model_bytes(model_bytes)
+
+    def restore_checkpoint(self, checkpoint: Checkpoint, model_bytes=None):
+        """
+        Resumes from a checkpoint, without going through the state transitions.
+        Without model_bytes the device resumes without a model.
+        """
+        if model_bytes is not None:
+            self.load_model_bytes(model_bytes)
+
+        with self._config_mutex:
+            self._config = EdgeSensorConfig(sleep_interval_ms=0)
+            # restored as it was, without a new random offset
+            self._config.sleep_interval_ms = checkpoint.sleep_interval_ms
+            wake_slot = checkpoint.config.get("wake_slot")
+            feature_set = checkpoint.config.get("feature_set")
+            self._publish_snapshot(
+                sleep_interval_ms=checkpoint.sleep_interval_ms,
+                wake_slot=None if wake_slot is None else WakeSlot(**wake_slot),
+                feature_set=FeatureSet() if feature_set is None else FeatureSet(
+                    tuple(feature_set["features"]), feature_set["include_raw"], feature_set["fft_bands"]
+                ),
+                groups=tuple(checkpoint.config.get("groups", ())),
+            )
+
+        with self._inference_mutex:
+            self._inference_layer = checkpoint.inference_layer
+            self._fallback_inference_layer = checkpoint.fallback_inference_layer
+            self._prediction_history.load(checkpoint.history_buffer, checkpoint.history_head, checkpoint.history_size)
+            self._pred_state_counter = checkpoint.pred_state_counter if len(self._prediction_history) else 0
+            self._publish_snapshot(
+                inference_layer=checkpoint.inference_layer,
+                fallback_inference_layer=checkpoint.fallback_inference_layer,
+            )
+
+        self._cycle_counter = checkpoint.cycle_counter
+
+        with self._state_mutex:
+            self._sm.machine.set_state(checkpoint.state)
+            self._publish_snapshot(state=self._sm.state)
+
+
+    # --- Clock-related methods ---
+    def add_clock_sample(self, t1, t2, t3, t4):
+        self._clock_estimator.add_sample(t1, t2, t3, t4)
 
+    def get_clock_offset(self, device_time_us):
+        return self._clock_estimator.offset_at(device_time_us)
 
     # --- Thread Safe Methods ---
     def get_sleeping(self):
@@ -0,0 +1,162 @@
+import os
+import mmap
+import contextlib
+import tempfile
+import json
+import zlib
+import struct
+import hashlib
+from typing import NamedTuple, Optional
+from state_machine import states
+
+# Durable device checkpoint, one file per device:
+#
+#   <dir>/<device>.ckpt           state, counters, prediction history and config
+#   <dir>/models/<sha256>.tflite  the loaded model, shared by every device with the same model
+#
+# Checkpoint layout (little endian), after the MAGIC header:
+#   u32 crc32 of everything after it
+#   HEADER (see below)
+#   history ring buffer, history_maxlen bytes
+#   config, config_length bytes of JSON (wake slot, feature set, groups)
+# Files are written aside and renamed, so a reader sees the previous or the
+# new checkpoint, never a partial one.
+
+MAGIC = b"ESNCKPT1"
+# the state is stored as its index in the state machine, new states go last
+STATES = list(states)
+# written_at_us, cycle_counter, pred_state_counter, state, inference_layer,
+# fallback_inference_layer, sleep_interval_ms, history maxlen/head/size,
+# config length, model sha256 (zeros without a model)
+CRC = struct.Struct("<I")
+HEADER = struct.Struct("<QQQBBBIIIII32s")
+NO_MODEL = bytes(32)
+MODELS_DIR = "models"
+
+
+class Checkpoint(NamedTuple):
+    written_at_us: int
+    cycle_counter: int
+    pred_state_counter: int
+    state: str
+    inference_layer: int
+    fallback_inference_layer: int
+    sleep_interval_ms: int
+    history_maxlen: int
+    history_head: int
+    history_size: int
+    history_buffer: bytes
+    config: dict
+    model_sha256: Optional[str] = None
+
+
+def checkpoint_path(directory, device_name):
+    return os.path.join(directory, f"{device_name}.ckpt")
+
+
+def model_path(directory, model_sha256):
+    return os.path.join(directory, MODELS_DIR, f"{model_sha256}.tflite")
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # one temporary file per writer, devices may share a process (shard mode)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def write_model(directory, model_sha256, model_bytes):
+    """
+    Stores the model under its content hash, once. The content is the same
+    whoever writes it, so a model already stored, or stored concurrently by
+    another device, is left as it is.
+    """
+    path = model_path(directory, model_sha256)
+    if not os.path.exists(path):
+        _write_atomic(path, model_bytes)
+
+
+def write_checkpoint(path, checkpoint):
+    config = json.dumps(checkpoint.config, separators=(",", ":")).encode()
+    body = HEADER.pack(
+        checkpoint.written_at_us,
+        checkpoint.cycle_counter,
+        checkpoint.pred_state_counter,
+        STATES.index(checkpoint.state),
+        checkpoint.inference_layer,
+        checkpoint.fallback_inference_layer,
+        checkpoint.sleep_interval_ms,
+        checkpoint.history_maxlen,
+        checkpoint.history_head,
+        checkpoint.history_size,
+        len(config),
+        bytes.fromhex(checkpoint.model_sha256) if checkpoint.model_sha256 else NO_MODEL,
+    ) + checkpoint.history_buffer + config
+    _write_atomic(path, MAGIC + CRC.pack(zlib.crc32(body)) + body)
+
+
+def read_checkpoint(path):
+    """
+    Returns the checkpoint at path, None when there is none or it is corrupted.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # missing or empty file
+        return None
+    with data:
+        header_start = len(MAGIC) + CRC.size
+        if len(data) < header_start + HEADER.size or data[:len(MAGIC)] != MAGIC:
+            print(f"Ignoring invalid checkpoint {path}")
+            return None
+        (crc,) = CRC.unpack_from(data, len(MAGIC))
+        fields = HEADER.unpack_from(data, header_start)
+        written_at_us, cycle_counter, pred_state_counter, state, inference_layer = fields[:5]
+        fallback_inference_layer, sleep_interval_ms, maxlen, head, size, config_length, model_sha256 = fields[5:]
+        history_start = header_start + HEADER.size
+        config_start = history_start + maxlen
+        if len(data) != config_start + config_length or zlib.crc32(data[header_start:]) != crc:
+            print(f"Ignoring corrupted checkpoint {path}")
+            return None
+        return Checkpoint(
+            written_at_us=written_at_us,
+            cycle_counter=cycle_counter,
+            pred_state_counter=pred_state_counter,
+            state=STATES[state],
+            inference_layer=inference_layer,
+            fallback_inference_layer=fallback_inference_layer,
+            sleep_interval_ms=sleep_interval_ms,
+            history_maxlen=maxlen,
+            history_head=head,
+            history_size=size,
+            history_buffer=data[history_start:config_start],
+            config=json.loads(data[config_start:]),
+            model_sha256=None if model_sha256 == NO_MODEL else model_sha256.hex(),
+        )
+
+
+def read_model(directory, model_sha256):
+    """
+    Returns the model bytes stored under the hash, None when they are missing
+    or do not match it.
+    """
+    try:
+        with open(model_path(directory, model_sha256), "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    with data:
+        if hashlib.sha256(data).hexdigest() != model_sha256:
+            return None
+        return data[:]
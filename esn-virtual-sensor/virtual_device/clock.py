@@ -0,0 +1,91 @@
+import time
+from collections import deque
+
+import numpy as np
+
+
+class MonotonicClock:
+    """
+    Microsecond timestamps from the monotonic clock, anchored once to the wall
+    clock. NTP steps or manual clock changes after startup do not move them.
+    """
+
+    def __init__(self):
+        self._wall_anchor_us = time.time_ns() // 1000
+        self._monotonic_anchor_ns = time.monotonic_ns()
+
+    def now_us(self):
+        return self._wall_anchor_us + (time.monotonic_ns() - self._monotonic_anchor_ns) // 1000
+
+
+_device_clock = MonotonicClock()
+
+
+def now_us():
+    return _device_clock.now_us()
+
+
+class ClockOffsetEstimator:
+    """
+    NTP-style estimator of the device clock offset and drift w.r.t. the backend.
+
+    t1: probe sent by the backend (backend clock)
+    t2: probe received by the device (device clock)
+    t3: reply sent by the device (device clock)
+    t4: reply received by the backend (backend clock)
+
+    theta = ((t2 - t1) + (t3 - t4)) / 2: offset of the device clock
+    delta = (t4 - t1) - (t3 - t2): round-trip time of the exchange
+
+    Only the samples with the lowest round-trip times are used, a line
+    theta(t) = offset + drift * (t - t_ref) is fitted on them, and the error
+    bound is half the minimum round-trip time plus the largest residual.
+    """
+
+    def __init__(self, window=64, best_fraction=0.25):
+        self.best_fraction = best_fraction
+        self._samples = deque(maxlen=window)
+        # (offset_us, drift, t_ref_us, error_bound_us), replaced atomically on every fit
+        self._fit = None
+
+    def add_sample(self, t1, t2, t3, t4):
+        theta = ((t2 - t1) + (t3 - t4)) / 2
+        delta = (t4 - t1) - (t3 - t2)
+        if delta < 0:
+            # inconsistent timestamps, the sample is discarded
+            return
+        self._samples.append((t2, theta, delta))
+        self._fit = self._fit_samples()
+
+    def _fit_samples(self):
+        samples = np.array(self._samples, dtype=np.float64)
+        n_best = max(1, int(len(samples) * self.best_fraction))
+        best = samples[np.argsort(samples[:, 2])[:n_best]]
+        t, theta, delta = best[:, 0], best[:, 1], best[:, 2]
+
+        t_ref = t.mean()
+        if n_best >= 2 and np.ptp(t) > 0:
+            drift, offset = np.polyfit(t - t_ref, theta, 1)
+        else:
+            drift, offset = 0.0, theta.mean()
+        residuals = theta - (offset + drift * (t - t_ref))
+        error_bound = delta.min() / 2 + np.abs(residuals).max()
+        return float(offset), float(drift), float(t_ref), float(error_bound)
+
+    def is_synchronized(self):
+        return self._fit is not None
+
+    def offset_at(self, device_time_us):
+        """
+        Returns (offset_us, error_bound_us) at the given device time, or
+        (0, None) before the first probe.
+        """
+        fit = self._fit
+        if fit is None:
+            return 0, None
+        offset, drift, t_ref, error_bound = fit
+        return int(round(offset + drift * (device_time_us - t_ref))), int(round(error_bound))
+
+    def to_backend_time(self, device_time_us):
+        offset, _ = self.offset_at(device_time_us)
+        return device_time_us - offset
@@ -0,0 +1,44 @@
+from typing import NamedTuple
+import numpy as np
+
+FEATURES = ["mean", "std", "rms", "ptp", "fft_bands"]
+FEATURE_DECIMALS = 6
+
+
+class FeatureSet(NamedTuple):
+    """
+    Features sent in offloaded readings, set through the feature-set resource.
+    An empty feature list sends the raw window only.
+    """
+    features: tuple = ()
+    include_raw: bool = False
+    fft_bands: int = 4
+
+
+def extract_features(window, feature_set):
+    """
+    Per-channel features of a (SEQ_LENGTH, channels) window, computed over
+    all channels at once. fft_bands holds one row per band: the spectral
+    energy of the band, with the DC bin excluded and the remaining bins split
+    into fft_bands contiguous bands.
+    """
+    window = np.asarray(window, dtype=np.float64)
+    features = {}
+    for name in feature_set.features:
+        if name == "mean":
+            values = window.mean(axis=0)
+        elif name == "std":
+            values = window.std(axis=0)
+        elif name == "rms":
+            values = np.sqrt(np.mean(window * window, axis=0))
+        elif name == "ptp":
+            values = np.ptp(window, axis=0)
+        elif name == "fft_bands":
+            power = np.abs(np.fft.rfft(window, axis=0)[1:]) ** 2
+            n_bands = min(feature_set.fft_bands, len(power))
+            starts = np.linspace(0, len(power), n_bands + 1, dtype=int)[:-1]
+            values = np.add.reduceat(power, starts, axis=0) / len(window)
+        else:
+            raise ValueError(f"Unknown feature {name}")
+        features[name] = np.round(values, FEATURE_DECIMALS).tolist()
+    return features
@@ -0,0 +1,116 @@
+class LatencyAwarePolicy:
+    """
+    Latency-Aware Offloading Policy
+
+    L_t[k]: exponentially weighted latency estimate of layer k at time step t
+    slo: latency service level objective, in microseconds
+    e[k]: relative energy cost of running one cycle at layer k
+
+    A layer is feasible when L_t[k] <= slo. The current layer stays feasible
+    until L_t[k] > slo * (1 + margin). Among feasible layers the cheapest one
+    is the target, and the policy only switches after the same target has won
+    `hysteresis` consecutive decisions, so it does not flap.
+
+    Only the layer that runs a cycle gets a latency sample, so every
+    `probe_interval` decisions one cycle is run on the non-active layer
+    observed longest ago (never observed first). The probe does not change
+    the active layer, it only refreshes L_t of the probed one; layers that
+    were never observed are otherwise never chosen. No probes are made on
+    low battery, and a probe_interval of 0 disables them.
+    """
+
+    def __init__(self, slo_us, alpha, energy_cost, hysteresis, margin, probe_interval=0):
+        self.slo_us = slo_us
+        self.alpha = alpha
+        self.energy_cost = list(energy_cost)
+        self.hysteresis = max(1, hysteresis)
+        self.margin = margin
+        self.probe_interval = max(0, probe_interval)
+
+        self._estimates = [None] * len(self.energy_cost)
+        # decision count of the last sample of each layer
+        self._observed_at = [None] * len(self.energy_cost)
+        self._decisions = 0
+        self._candidate = None
+        self._candidate_streak = 0
+        self.last_decision = None
+
+    def observe(self, layer, latency_us):
+        estimate = self._estimates[layer]
+        if estimate is None:
+            self._estimates[layer] = float(latency_us)
+        else:
+            self._estimates[layer] = estimate + self.alpha * (latency_us - estimate)
+        self._observed_at[layer] = self._decisions
+
+    def get_latency_estimates(self):
+        return list(self._estimates)
+
+    def _is_feasible(self, layer, current_layer):
+        estimate = self._estimates[layer]
+        if estimate is None:
+            return False
+        if layer == current_layer:
+            return estimate <= self.slo_us * (1 + self.margin)
+        return estimate <= self.slo_us
+
+    def _target(self, current_layer, low_battery):
+        layers = range(len(self._estimates))
+        if low_battery:
+            # battery protection: the energy cost is the only criterion
+            return min(layers, key=lambda k: (self.energy_cost[k], k != current_layer)), "low_battery"
+
+        feasible = [k for k in layers if self._is_feasible(k, current_layer)]
+        if feasible:
+            return min(feasible, key=lambda k: (self.energy_cost[k], k != current_layer)), "slo_met"
+
+        measured = [k for k in layers if self._estimates[k] is not None]
+        if measured:
+            # no layer meets the SLO => best effort, lowest latency
+            return min(measured, key=lambda k: self._estimates[k]), "slo_violated"
+
+        return current_layer, "no_estimates"
+
+    def _probe_layer(self, selected_layer, low_battery):
+        if low_battery or not self.probe_interval or self._decisions % self.probe_interval:
+            return None
+        stale = [
+            k for k in range(len(self._estimates))
+            if k != selected_layer
+            and (self._observed_at[k] is None or self._decisions - self._observed_at[k] >= self.probe_interval)
+        ]
+        if not stale:
+            return None
+        return min(stale, key=lambda k: -1 if self._observed_at[k] is None else self._observed_at[k])
+
+    def decide(self, current_layer, low_battery=False):
+        """
+        Returns the active layer after this decision. last_decision holds the
+        layer to probe in this cycle instead, if any.
+        """
+        self._decisions += 1
+        target, reason = self._target(current_layer, low_battery)
+
+        selected = current_layer
+        if target == current_layer:
+            self._candidate, self._candidate_streak = None, 0
+        else:
+            if target == self._candidate:
+                self._candidate_streak += 1
+            else:
+                self._candidate, self._candidate_streak = target, 1
+            if self._candidate_streak >= self.hysteresis:
+                selected = target
+                self._candidate, self._candidate_streak = None, 0
+
+        self.last_decision = {
+            "previous_layer": current_layer,
+            "target_layer": target,
+            "selected_layer": selected,
+            "latency_estimates": self.get_latency_estimates(),
+            "latency_slo": self.slo_us,
+            "low_battery": low_battery,
+            "reason": reason,
+            "probe_layer": self._probe_layer(selected, low_battery),
+        }
+        return selected
@@ -0,0 +1,64 @@
+class PredictionHistory:
+    """
+    Fixed-size ring buffer of abnormal (1) / normal (0) prediction flags.
+
+    The buffer is allocated once and keeps a running count of abnormal flags,
+    so appending, clearing and reading the abnormal count are all O(1) and
+    allocation-free.
+    """
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self._buffer = bytearray(maxlen)
+        self._head = 0
+        self._size = 0
+        self._abnormal_count = 0
+
+    def append(self, is_abnormal):
+        if self.maxlen == 0:
+            return
+        is_abnormal = 1 if is_abnormal else 0
+        if self._size == self.maxlen:
+            # the oldest flag is overwritten
+            self._abnormal_count -= self._buffer[self._head]
+        else:
+            self._size += 1
+        self._buffer[self._head] = is_abnormal
+        self._abnormal_count += is_abnormal
+        self._head = (self._head + 1) % self.maxlen
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+        self._abnormal_count = 0
+
+    def dump(self):
+        """
+        Returns (buffer, head, size), the whole ring as stored.
+        """
+        return bytes(self._buffer), self._head, self._size
+
+    def load(self, buffer, head, size):
+        # a ring of another length (PREDICTION_HISTORY_LENGTH changed) is dropped
+        if len(buffer) != self.maxlen or size > self.maxlen:
+            self.clear()
+            return
+        self._buffer[:] = buffer
+        self._head = head
+        self._size = size
+        self._abnormal_count = sum(self)
+
+    def abnormal_count(self):
+        return self._abnormal_count
+
+    def is_full(self):
+        return self._size == self.maxlen
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        # oldest to newest, same order as the deque it replaces
+        start = (self._head - self._size) % self.maxlen if self.maxlen else 0
+        for i in range(self._size):
+            yield self._buffer[(start + i) % self.maxlen]
@@ -0,0 +1,17 @@
+from typing import NamedTuple, Optional
+from virtual_device.wake_slot import WakeSlot
+from virtual_device.features import FeatureSet
+
+
+class DeviceSnapshot(NamedTuple):
+    """
+    Immutable view of the device state. A new snapshot is published on every
+    transition, so readers only load the current reference and take no lock.
+    """
+    state: str
+    inference_layer: int
+    fallback_inference_layer: int
+    sleep_interval_ms: int
+    wake_slot: Optional[WakeSlot] = None
+    feature_set: FeatureSet = FeatureSet()
+    groups: tuple = ()
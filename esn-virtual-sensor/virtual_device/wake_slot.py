@@ -0,0 +1,16 @@
+from typing import NamedTuple
+
+
+class WakeSlot(NamedTuple):
+    """
+    Wake-up slot assigned by the backend scheduler: the device wakes at
+    epoch_us + offset_ms + k * period_ms, on the backend clock.
+    """
+    period_ms: int
+    offset_ms: int
+    epoch_us: int
+
+    def ms_until_next(self, backend_now_us):
+        period_us = self.period_ms * 1000
+        phase = (backend_now_us - self.epoch_us - self.offset_ms * 1000) % period_us
+        return (period_us - phase) // 1000
@@ -0,0 +1,214 @@
+import sys
+import json
+import time
+import heapq
+import uuid
+import argparse
+import numpy as np
+from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT
+
+# Fleet-wide wake-up scheduler. The sleep period is divided into a timing
+# wheel of slots, every device is assigned the least loaded slot, and a slot
+# never takes more devices than the publish and connection rate limits allow.
+# A fleet that does not fit in the period is refused, it needs a longer
+# period. Devices get their slot through the wake-slot resource, like
+# sensor-config only while they are unlocked or idle:
+#
+#   scheduler --- command/<device>/wake-slot/set/<uuid> {period_ms, offset_ms, epoch_us} ---> device
+#
+#   python3 wake_scheduler.py assign --period-ms 30000 [--devices-file devices.json]
+#   python3 wake_scheduler.py simulate --devices 5000 --period-ms 30000 --broker-rate 2000
+
+SLOT_MS = 100
+# devices sharing a slot are spread over it by this low-discrepancy sequence
+GOLDEN_RATIO_FRACTION = 0.6180339887498949
+# broker operations of one wake-up: reconnect and sensor-data publish
+OPS_PER_WAKE = 2
+
+
+class WakeSlotScheduler:
+    """
+    Timing wheel of period_ms / slot_ms slots. A heap of (load, slot) keeps
+    the least loaded slot on top; entries made stale by later assignments
+    are skipped when popped.
+    """
+
+    def __init__(self, period_ms, slot_ms=SLOT_MS, max_publish_rate=None, max_connect_rate=None):
+        self.period_ms = period_ms
+        self.slot_ms = slot_ms
+        self.n_slots = max(1, period_ms // slot_ms)
+        # devices a slot may hold: every device connects and publishes once per wake
+        rates = [rate for rate in (max_publish_rate, max_connect_rate) if rate is not None]
+        self.slot_capacity = None if not rates else max(1, int(min(rates) * slot_ms / 1000))
+        self.loads = [0] * self.n_slots
+        self.assignments = {}
+        self._heap = [(0, slot) for slot in range(self.n_slots)]
+
+    def check_capacity(self, n_devices):
+        """
+        Raises ValueError when n_devices do not fit in the period within the
+        rate limits, with the shortest period that would hold them.
+        """
+        if self.slot_capacity is None or n_devices <= self.slot_capacity * self.n_slots:
+            return
+        min_period_ms = -(-n_devices // self.slot_capacity) * self.slot_ms
+        raise ValueError(
+            f"Rate limits exceeded, a period of {self.period_ms} ms holds {self.slot_capacity * self.n_slots} "
+            f"devices, {n_devices} devices need at least {min_period_ms} ms"
+        )
+
+    def assign(self, device_name):
+        """
+        Returns the slot offset (ms from the period start) of the device.
+        Raises ValueError when every slot is at the rate limits.
+        """
+        if device_name in self.assignments:
+            return self.assignments[device_name][1]
+        while True:
+            load, slot = heapq.heappop(self._heap)
+            if load == self.loads[slot]:
+                break
+        if self.slot_capacity is not None and load >= self.slot_capacity:
+            # the least loaded slot is full, so are all the others
+            heapq.heappush(self._heap, (load, slot))
+            self.check_capacity(len(self.assignments) + 1)
+        self.loads[slot] += 1
+        heapq.heappush(self._heap, (self.loads[slot], slot))
+        offset_ms = slot * self.slot_ms + int((load * GOLDEN_RATIO_FRACTION) % 1 * self.slot_ms)
+        self.assignments[device_name] = (slot, offset_ms)
+        return offset_ms
+
+    def release(self, device_name):
+        slot, _ = self.assignments.pop(device_name, (None, None))
+        if slot is not None:
+            self.loads[slot] -= 1
+            heapq.heappush(self._heap, (self.loads[slot], slot))
+
+    def peak_load(self):
+        return max(self.loads)
+
+
+# --- Simulation ---
+
+
+def broker_load(arrivals_s, broker_rate, window_s=1.0):
+    """
+    Peak operations per window and the latency of every operation through a
+    FIFO broker serving broker_rate operations per second. The departure of
+    operation i is d_i = max(a_i, d_{i-1}) + s = (i + 1) s + max_{j <= i}(a_j - j s).
+    """
+    arrivals = np.sort(arrivals_s)
+    service_s = 1 / broker_rate
+    index = np.arange(len(arrivals))
+    departures = (index + 1) * service_s + np.maximum.accumulate(arrivals - index * service_s)
+    latencies_ms = (departures - arrivals) * 1000
+    counts = np.bincount((arrivals // window_s).astype(np.int64))
+    return {
+        "operations": len(arrivals),
+        "peak_ops_per_window": int(counts.max()),
+        "mean_ops_per_window": float(counts.mean()),
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p99_ms": float(np.percentile(latencies_ms, 99)),
+        "latency_p999_ms": float(np.percentile(latencies_ms, 99.9)),
+        "latency_max_ms": float(latencies_ms.max()),
+    }
+
+
+def unscheduled_arrivals(n_devices, sleep_interval_ms, duration_s, rng):
+    # today: every device picks its interval once, base + 0-50% (EdgeSensorConfig),
+    # and the whole fleet starts together, e.g. after a broker restart or a
+    # fleet-wide sensor-config command
+    intervals_s = (sleep_interval_ms + rng.integers(0, sleep_interval_ms // 2 + 1, n_devices)) / 1000
+    wakes = [np.arange(0, duration_s, interval) for interval in intervals_s]
+    return np.concatenate(wakes)
+
+
+def scheduled_arrivals(n_devices, period_ms, duration_s, scheduler):
+    scheduler.check_capacity(n_devices)
+    offsets_s = np.array([scheduler.assign(f"device-{i}") for i in range(n_devices)]) / 1000
+    starts = np.arange(0, duration_s, period_ms / 1000)
+    wakes = (offsets_s[:, None] + starts[None, :]).ravel()
+    return wakes[wakes < duration_s]
+
+
+def simulate(n_devices, sleep_interval_ms, period_ms, broker_rate, duration_s, max_publish_rate=None, max_connect_rate=None, seed=0):
+    rng = np.random.default_rng(seed)
+    scheduler = WakeSlotScheduler(period_ms, SLOT_MS, max_publish_rate, max_connect_rate)
+    rows = []
+    for mode, wakes in (
+        ("unscheduled", unscheduled_arrivals(n_devices, sleep_interval_ms, duration_s, rng)),
+        ("scheduled", scheduled_arrivals(n_devices, period_ms, duration_s, scheduler)),
+    ):
+        arrivals = np.repeat(wakes, OPS_PER_WAKE)
+        rows.append({"mode": mode, "devices": n_devices, "wakes": len(wakes), **broker_load(arrivals, broker_rate)})
+    return rows
+
+
+# --- Assignment ---
+
+
+def assign(device_names, period_ms, max_publish_rate=None, max_connect_rate=None):
+    import paho.mqtt.client as mqtt
+    from virtual_device.clock import now_us
+
+    scheduler = WakeSlotScheduler(period_ms, SLOT_MS, max_publish_rate, max_connect_rate)
+    # every slot is computed before the first command, a fleet that does not fit gets none
+    scheduler.check_capacity(len(device_names))
+    offsets_ms = {device_name: scheduler.assign(device_name) for device_name in device_names}
+    client = mqtt.Client(client_id=f"wake-scheduler-{uuid.uuid4().hex[:8]}")
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT)
+    client.loop_start()
+
+    # the wheel starts on the next second of the backend clock
+    epoch_us = (now_us() // 1000000 + 1) * 1000000
+    for device_name in device_names:
+        payload = {"wake-slot": {"period_ms": period_ms, "offset_ms": offsets_ms[device_name], "epoch_us": epoch_us}}
+        client.publish(f"command/{device_name}/wake-slot/set/{uuid.uuid4()}", json.dumps(payload), qos=1)
+        # the commands themselves are paced at the connection rate limit
+        if max_connect_rate:
+            time.sleep(1 / max_connect_rate)
+
+    client.loop_stop()
+    client.disconnect()
+    print(f"Assigned {len(device_names)} devices to {scheduler.n_slots} slots, peak {scheduler.peak_load()} devices per slot")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fleet-wide wake-up slot scheduler")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name in ("assign", "simulate"):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument("--period-ms", type=int, default=30000)
+        subparser.add_argument("--max-publish-rate", type=float, help="fleet publishes per second")
+        subparser.add_argument("--max-connect-rate", type=float, help="fleet connections per second")
+    subparsers.choices["assign"].add_argument("device_names", nargs="*")
+    subparsers.choices["assign"].add_argument("--devices-file", default="devices.json")
+    simulate_parser = subparsers.choices["simulate"]
+    simulate_parser.add_argument("--devices", type=int, default=5000)
+    simulate_parser.add_argument("--sleep-interval-ms", type=int, default=30000, help="base interval of the unscheduled fleet")
+    simulate_parser.add_argument("--broker-rate", type=float, default=2000, help="broker operations per second")
+    simulate_parser.add_argument("--duration", type=float, default=300, help="simulated seconds")
+    simulate_parser.add_argument("--output", help="CSV file for the comparison")
+    args = parser.parse_args(sys.argv[1:])
+
+    try:
+        if args.command == "assign":
+            device_names = args.device_names
+            if not device_names:
+                with open(args.devices_file) as f:
+                    device_names = json.load(f)
+            assign(device_names, args.period_ms, args.max_publish_rate, args.max_connect_rate)
+        else:
+            rows = simulate(
+                args.devices, args.sleep_interval_ms, args.period_ms, args.broker_rate, args.duration,
+                args.max_publish_rate, args.max_connect_rate,
+            )
+            for row in rows:
+                print(row)
+            if args.output:
+                import pandas as pd
+                pd.DataFrame(rows).to_csv(args.output, index=False)
+    except ValueError as e:
+        # the fleet does not fit in the period within the rate limits
+        print(e)
+        sys.exit(1)
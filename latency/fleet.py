@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from latency import _load_data, histogram_edges
+from summary_hist import LatencyHistograms
+
+# Fleet-wide latency analysis: every sensor of every node-count file is
+# analyzed in one invocation. Per-sensor statistics and figures are spread
+# across a process pool, then merged into a fleet-level summary.
+
+QUANTILES = [0.5, 0.9, 0.99]
+WORST_OFFENDERS = 10
+
+
+def _sensor_tasks(node_counts, dataframes):
+    """
+    Groups the loaded data by sensor: {sensor_name: {node_count: latencies}}.
+    """
+    tasks = {}
+    for node_count, df in zip(node_counts, dataframes):
+        for sensor_name, latencies in df.groupby('sensor_name', observed=True)['inference_latency']:
+            tasks.setdefault(sensor_name, {})[node_count] = latencies.to_numpy()
+    return tasks
+
+
+def _plot_sensor(sensor_name, histograms, output_path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    ax.bxp(histograms.boxplot_stats(), showfliers=True)
+    ax.set_title(f'Inference Latency by Node Count - {sensor_name}')
+    ax.set_xlabel('Nodes in the Network')
+    ax.set_ylabel('Inference Latency (ms)')
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+    fig.savefig(os.path.join(output_path, f'{sensor_name}.png'))
+    plt.close(fig)
+
+
+def analyze_sensor(sensor_name, latencies_by_node_count, edges, output_path=None):
+    """
+    Worker task: statistics (and optionally the figure) of one sensor.
+    """
+    node_counts = sorted(latencies_by_node_count)
+    histograms = LatencyHistograms.build(node_counts, [latencies_by_node_count[n] for n in node_counts], edges)
+    quantiles = histograms.quantiles(QUANTILES)
+    means = histograms.means()
+
+    if output_path is not None:
+        _plot_sensor(sensor_name, histograms, output_path)
+
+    return [
+        {
+            'sensor_name': sensor_name,
+            'node_count': node_count,
+            'count': int(histograms.totals()[i]),
+            'mean': means[i],
+            'p50': quantiles[i, 0],
+            'p90': quantiles[i, 1],
+            'p99': quantiles[i, 2],
+            'max': histograms.maxs[i],
+        }
+        for i, node_count in enumerate(node_counts)
+    ]
+
+
+def analyze_fleet(tasks, edges, workers, figures_path=None):
+    rows = []
+    if workers <= 1:
+        for sensor_name, latencies in tasks.items():
+            rows.extend(analyze_sensor(sensor_name, latencies, edges, figures_path))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(analyze_sensor, sensor_name, latencies, edges, figures_path)
+                for sensor_name, latencies in tasks.items()
+            ]
+            for future in futures:
+                rows.extend(future.result())
+    return pd.DataFrame(rows).sort_values(['node_count', 'sensor_name']).reset_index(drop=True)
+
+
+def fleet_summary(sensor_stats):
+    """
+    Per node count spread of the per-sensor p99 latencies.
+    """
+    grouped = sensor_stats.groupby('node_count')['p99']
+    summary = grouped.agg(['count', 'min', 'median', 'max', 'std']).rename(columns={'count': 'sensors'})
+    summary = summary.add_prefix('p99_').rename(columns={'p99_sensors': 'sensors'})
+    summary['p99_spread'] = summary['p99_max'] - summary['p99_min']
+    return summary.reset_index()
+
+
+def worst_offenders(sensor_stats, n=WORST_OFFENDERS):
+    return (
+        sensor_stats.sort_values('p99', ascending=False)
+        .groupby('node_count', sort=True)
+        .head(n)
+        .sort_values(['node_count', 'p99'], ascending=[True, False])
+        .reset_index(drop=True)
+    )
+
+
+def main(input_path, output_path, workers, plot=True, scaling=None):
+    node_counts, dataframes = _load_data(input_path, sensor_name=None)
+    if not any(len(df) for df in dataframes):
+        print("No latency data found")
+        return
+    edges = histogram_edges(dataframes)
+    tasks = _sensor_tasks(node_counts, dataframes)
+    print(f"Analyzing {len(tasks)} sensors over {len(dataframes)} node counts with {workers} workers")
+
+    figures_path = None
+    if plot:
+        figures_path = os.path.join(output_path, 'sensors')
+        os.makedirs(figures_path, exist_ok=True)
+
+    start = time.perf_counter()
+    sensor_stats = analyze_fleet(tasks, edges, workers, figures_path)
+    print(f"Per-sensor analysis took {time.perf_counter() - start:.2f} s")
+
+    sensor_stats.to_csv(os.path.join(output_path, 'latency_by_sensor.csv'), index=False)
+    summary = fleet_summary(sensor_stats)
+    summary.to_csv(os.path.join(output_path, 'fleet_summary.csv'), index=False)
+    offenders = worst_offenders(sensor_stats)
+    offenders.to_csv(os.path.join(output_path, 'worst_offenders.csv'), index=False)
+    print(summary.to_string(index=False))
+    print(offenders.groupby('node_count').head(3).to_string(index=False))
+
+    if scaling:
+        # wall time of the per-sensor phase as the worker count grows
+        timings = []
+        for n_workers in scaling:
+            start = time.perf_counter()
+            analyze_fleet(tasks, edges, n_workers, figures_path)
+            timings.append({'workers': n_workers, 'wall_time_s': time.perf_counter() - start})
+        timings = pd.DataFrame(timings)
+        timings['speedup'] = timings['wall_time_s'].iloc[0] / timings['wall_time_s']
+        timings.to_csv(os.path.join(output_path, 'scaling.csv'), index=False)
+        print(timings.to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel latency analysis of every sensor")
+    parser.add_argument("input_path", help="Path to the input directory (CSV files or store)")
+    parser.add_argument("output_path", help="Path to the output directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no-plot", action="store_true")
+    parser.add_argument("--scaling", type=lambda v: [int(x) for x in v.split(',')],
+                        help="comma separated worker counts to report wall-time scaling for, e.g. 1,2,4,8")
+    args = parser.parse_args(sys.argv[1:])
+    main(args.input_path, args.output_path, args.workers, plot=not args.no_plot, scaling=args.scaling)
@@ -2,15 +2,49 @@ import os
 import sys
 import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
 import itertools
+import numpy as np
+import store
+from summary_hist import LatencyHistograms, linear_bins, log_bins
 
 SENSOR_NAME = "ESP32_AABBCC"
 SENSOR_SLEEP_TIME = 10
+HISTOGRAM_BINS = 512
 
 # Set the Seaborn theme
 
-def _load_data(input_path):
+def _load_store_data(store_path, sensor_name=SENSOR_NAME):
+    # Only the sensor of interest and the needed columns are read from the store,
+    # rows are already sorted by registered_at within each sensor
+    if sensor_name is None:
+        data = store.load(store_path, columns=['sensor_name', 'inference_latency', 'registered_at'])
+    else:
+        data = store.load(
+            store_path,
+            columns=['inference_latency', 'registered_at'],
+            sensors=[sensor_name],
+        )
+
+    node_counts = []
+    dataframes = []
+    for node_count, df in data.groupby('node_count', sort=True):
+        df = df.reset_index(drop=True)
+
+        # Convert inference_latency entries from us to ms
+        df['inference_latency'] = df['inference_latency'] / 1000
+
+        node_counts.append(int(node_count))
+        dataframes.append(df)
+
+    return node_counts, dataframes
+
+def _load_data(input_path, sensor_name=SENSOR_NAME):
+    # sensor_name=None loads every sensor
+
+    # Read from the columnar store when the input was ingested with store.py
+    if store.is_store(input_path):
+        return _load_store_data(input_path, sensor_name)
+
     # Get a list of CSV files in the folder
     csv_files = [f for f in os.listdir(input_path) if f.endswith('.csv') and f.replace('.csv', '').isdigit()]
 
@@ -32,7 +66,8 @@ def _load_data(input_path):
             raise ValueError(f"The input CSV file {csv_file} must contain 'sensor_name', 'inference_latency', and 'registered_at' columns")
 
         # Filter the DataFrame to only include the sensor of interest
-        df = df[df['sensor_name'] == SENSOR_NAME]
+        if sensor_name is not None:
+            df = df[df['sensor_name'] == sensor_name]
 
         # Convert inference_latency entries from us to ms
         df['inference_latency'] = df['inference_latency'] / 1000
@@ -51,10 +86,30 @@ def _load_data(input_path):
 
     return node_counts, dataframes
 
-def plot_and_save_boxplot(dataframes, output_path):
+def histogram_edges(dataframes, n_bins=HISTOGRAM_BINS):
+    # Empty frames have no range, without any data the edges are a unit range
+    latencies = [df['inference_latency'] for df in dataframes if len(df)]
+    if not latencies:
+        return linear_bins(0, 1, n_bins)
+    low = min(values.min() for values in latencies)
+    high = max(values.max() for values in latencies)
+
+    # Log bins unless clock skew produced non-positive latencies
+    return log_bins(low, high, n_bins) if low > 0 else linear_bins(low, high, n_bins)
+
+def build_histograms(node_counts, dataframes, n_bins=HISTOGRAM_BINS):
+    return LatencyHistograms.from_dataframes(node_counts, dataframes, histogram_edges(dataframes, n_bins))
+
+def plot_and_save_boxplot(histograms, output_path):
     plt.figure(figsize=(12, 8))
-    for df in dataframes:
-        sns.boxplot(x='node_count', y='inference_latency', data=df, showfliers=True, linecolor='black', linewidth=1.5)
+    plt.gca().bxp(
+        histograms.boxplot_stats(),
+        showfliers=True,
+        boxprops={'color': 'black', 'linewidth': 1.5},
+        whiskerprops={'color': 'black', 'linewidth': 1.5},
+        capprops={'color': 'black', 'linewidth': 1.5},
+        medianprops={'color': 'black', 'linewidth': 1.5},
+    )
 
     # Set the title and labels
     plt.title('Inference Latency by Node Count')
@@ -70,6 +125,25 @@ def plot_and_save_boxplot(dataframes, output_path):
     # Save the plot to a file
     plt.savefig(os.path.join(output_path, f'latency_boxplot.png'))
 
+def plot_and_save_cdf(labels, histograms, output_path):
+    plt.figure(figsize=(12, 8))
+    cdfs = histograms.cdfs()
+    for label, cdf in zip(labels, cdfs):
+        plt.step(histograms.edges[1:], cdf, where='post', label=label)
+
+    # Set the title and labels
+    plt.title('Inference Latency CDF by Node Count')
+    plt.xlabel('Inference Latency (ms)')
+    plt.ylabel('Cumulative Probability')
+    if histograms.edges[0] > 0:
+        plt.xscale('log')
+
+    plt.grid(True, which='both', linestyle='--', linewidth=0.5)
+    plt.legend(loc='lower right')
+
+    # Save the plot to a file
+    plt.savefig(os.path.join(output_path, f'latency_cdf.png'))
+
 def plot_and_save_lineplot(labels, dataframes, output_path):
     markers = ['o', 's', 'd', 'p', 'h', 'X']  # List of different markers
     colors = itertools.cycle(plt.cm.tab10.colors)  # Use a color cycle
@@ -109,19 +183,25 @@ def plot_and_save_lineplot(labels, dataframes, output_path):
     plt.tight_layout()
     
     # Save the plot to a file
-    plt.savefig(os.path.join(output_path, f'latency_boxplot.png'))
+    plt.savefig(os.path.join(output_path, f'latency_lineplot.png'))
 
 def main(input_path, output_path):
     # Load the data from the CSV files into an array of DataFrames
     node_counts, dataframes = _load_data(input_path)
 
+    # Latency histograms of every node count, built in one pass
+    histograms = build_histograms(node_counts, dataframes)
+
     # First figure: Boxplot of inference latency by node count
-    plot_and_save_boxplot(dataframes, output_path)
+    plot_and_save_boxplot(histograms, output_path)
     
     # Second figure: Line plots of inference latency over time
     labels = [f'{node_count} Nodes' if node_count != 1 else f'{node_count} Node' for node_count in node_counts]
     plot_and_save_lineplot(labels, dataframes, output_path)
 
+    # Third figure: CDF of inference latency by node count
+    plot_and_save_cdf(labels, histograms, output_path)
+
     # Show the plots
     plt.show()
 
@@ -129,13 +209,19 @@ def main(input_path, output_path):
     # Load the data from the CSV files into an array of DataFrames
     node_counts, dataframes = _load_data(input_path)
 
+    # Latency histograms of every node count, built in one pass
+    histograms = build_histograms(node_counts, dataframes)
+
     # First figure: Boxplot of inference latency by node count
-    plot_and_save_boxplot(dataframes, output_path)
+    plot_and_save_boxplot(histograms, output_path)
     
     # Second figure: Line plots of inference latency over time
     labels = [f'{node_count} Nodes' if node_count != 1 else f'{node_count} Node' for node_count in node_counts]
     plot_and_save_lineplot(labels, dataframes, output_path)
 
+    # Third figure: CDF of inference latency by node count
+    plot_and_save_cdf(labels, histograms, output_path)
+
     # Show the plots
     plt.show()
     
@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import paho.mqtt.client as mqtt
+from sketch import LatencySketch
+
+# Live rolling latency monitor. Subscribes to the device exports, keeps a
+# sliding window of quantile sketches per device and per inference layer and
+# periodically publishes the summaries to a metrics topic and a text endpoint.
+#
+# Memory is bounded: incoming samples go to a fixed-size pending buffer that
+# is flushed in vectorized batches, every window is a fixed ring of sketches
+# with fixed-size bucket arrays, and the number of tracked keys is capped.
+
+MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST', 'localhost')
+MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', 1883))
+MICROSECOND_CONVERSION_FACTOR = 1000000 # 1 second = 1,000,000 microseconds
+
+# coarser sketches than the offline analysis, there is one per key and slot
+MONITOR_RELATIVE_ACCURACY = 0.05
+MONITOR_MIN_VALUE = 1e-2 # ms
+MONITOR_MAX_VALUE = 1e6  # ms
+
+PENDING_BUFFER_SIZE = 200000
+METRICS_TOPIC = "metrics/latency"
+
+
+def _new_sketch():
+    return LatencySketch(
+        relative_accuracy=MONITOR_RELATIVE_ACCURACY,
+        min_value=MONITOR_MIN_VALUE,
+        max_value=MONITOR_MAX_VALUE,
+    )
+
+
+class WindowedSketch:
+    """
+    Sliding window made of n_slots sketches covering slot_seconds each. Slots
+    that fall out of the window are cleared in place and reused.
+    """
+
+    def __init__(self, window_seconds, n_slots):
+        self.slot_seconds = window_seconds / n_slots
+        self._slots = [_new_sketch() for _ in range(n_slots)]
+        self._slot_ids = [None] * n_slots
+        self.last_update = 0.0
+
+    def _slot(self, now):
+        slot_id = int(now // self.slot_seconds)
+        index = slot_id % len(self._slots)
+        if self._slot_ids[index] != slot_id:
+            self._slots[index].clear()
+            self._slot_ids[index] = slot_id
+        return self._slots[index]
+
+    def add(self, values, now):
+        self._slot(now).add(values)
+        self.last_update = now
+
+    def merged(self, now, into):
+        into.clear()
+        oldest = int(now // self.slot_seconds) - len(self._slots) + 1
+        for slot_id, sketch in zip(self._slot_ids, self._slots):
+            if slot_id is not None and slot_id >= oldest:
+                into.merge(sketch)
+        return into
+
+
+class RollingLatencyMonitor:
+    def __init__(self, window_seconds=60, n_slots=6, max_keys=20000):
+        self.window_seconds = window_seconds
+        self.n_slots = n_slots
+        self.max_keys = max_keys
+        self.dropped_samples = 0
+        self.received_messages = 0
+
+        self._pending = deque(maxlen=PENDING_BUFFER_SIZE)
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._scratch = _new_sketch()
+
+    # --- ingestion (MQTT network thread) ---
+    def record(self, scope, key, metric, value_ms):
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped_samples += 1
+        self._pending.append((scope, key, metric, value_ms))
+
+    def on_inference_latency_benchmark(self, device_name, data):
+        latency_ms = data["inference_latency"] / 1000
+        layer = data.get("inference_layer")
+        layer = "unknown" if layer is None else layer
+        self.record("device", device_name, "inference", latency_ms)
+        self.record("layer", layer, "inference", latency_ms)
+
+    def on_sensor_data(self, device_name, data, arrival_us):
+        descriptor = data["inference_descriptor"]
+        layer = descriptor["inference_layer"]
+        send_timestamp = descriptor["send_timestamp"]
+        if descriptor.get("recv_timestamp") is not None:
+            latency_ms = (descriptor["recv_timestamp"] - send_timestamp) / 1000
+            self.record("device", device_name, "sensor_inference", latency_ms)
+            self.record("layer", layer, "sensor_inference", latency_ms)
+        # device to monitor delay, includes the clock offset between hosts
+        transit_ms = (arrival_us - send_timestamp) / 1000
+        self.record("device", device_name, "transit", transit_ms)
+        self.record("layer", layer, "transit", transit_ms)
+
+    # --- aggregation ---
+    def flush(self, now=None):
+        now = time.time() if now is None else now
+        batches = {}
+        while self._pending:
+            scope, key, metric, value = self._pending.popleft()
+            batches.setdefault((scope, key, metric), []).append(value)
+
+        with self._lock:
+            for window_key, values in batches.items():
+                window = self._windows.get(window_key)
+                if window is None:
+                    if len(self._windows) >= self.max_keys:
+                        self._evict(now)
+                    if len(self._windows) >= self.max_keys:
+                        self.dropped_samples += len(values)
+                        continue
+                    window = WindowedSketch(self.window_seconds, self.n_slots)
+                    self._windows[window_key] = window
+                window.add(values, now)
+
+    def _evict(self, now):
+        # keys without samples in the whole window are forgotten
+        idle = [k for k, w in self._windows.items() if now - w.last_update > self.window_seconds]
+        for k in idle:
+            del self._windows[k]
+
+    def summaries(self, now=None):
+        now = time.time() if now is None else now
+        result = {"device": {}, "layer": {}}
+        with self._lock:
+            self._evict(now)
+            for (scope, key, metric), window in self._windows.items():
+                summary = window.merged(now, self._scratch).summary()
+                if summary["count"]:
+                    result[scope].setdefault(str(key), {})[metric] = summary
+        return result
+
+    def to_text(self, summaries):
+        """
+        Prometheus-style text exposition of the summaries.
+        """
+        lines = [
+            "# TYPE esn_latency_ms summary",
+            f"esn_monitor_received_messages {self.received_messages}",
+            f"esn_monitor_dropped_samples {self.dropped_samples}",
+        ]
+        for scope, entries in summaries.items():
+            for key, metrics in entries.items():
+                for metric, summary in metrics.items():
+                    labels = f'scope="{scope}",key="{key}",metric="{metric}"'
+                    for q, quantile in (("p50", "0.5"), ("p90", "0.9"), ("p99", "0.99")):
+                        lines.append(f'esn_latency_ms{{{labels},quantile="{quantile}"}} {summary[q]:.3f}')
+                    lines.append(f'esn_latency_ms_max{{{labels}}} {summary["max"]:.3f}')
+                    lines.append(f'esn_latency_ms_count{{{labels}}} {summary["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+def _make_http_handler(monitor, latest):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = monitor.to_text(latest["summaries"]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def main(args):
+    monitor = RollingLatencyMonitor(window_seconds=args.window, n_slots=args.slots, max_keys=args.max_keys)
+    latest = {"summaries": {"device": {}, "layer": {}}}
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            print("Connected successfully")
+            client.subscribe("export/+/inf-latency-bench", qos=0)
+            client.subscribe("export/+/sensor-data", qos=0)
+        else:
+            print(f"Connection failed with code {rc}")
+
+    def on_message(client, userdata, msg):
+        arrival_us = int(time.time() * MICROSECOND_CONVERSION_FACTOR)
+        monitor.received_messages += 1
+        try:
+            _, device_name, resource_name = msg.topic.split("/")
+            data = json.loads(msg.payload)
+            if resource_name == "inf-latency-bench":
+                monitor.on_inference_latency_benchmark(device_name, data)
+            elif resource_name == "sensor-data":
+                monitor.on_sensor_data(device_name, data, arrival_us)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Skipping malformed message on {msg.topic}: {e}")
+
+    client = mqtt.Client(client_id=args.client_id)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.host, args.port)
+    client.loop_start()
+
+    if args.http_port:
+        server = ThreadingHTTPServer(("", args.http_port), _make_http_handler(monitor, latest))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://localhost:{args.http_port}/metrics")
+
+    try:
+        next_publish = time.time() + args.publish_interval
+        while True:
+            time.sleep(args.flush_interval)
+            monitor.flush()
+            if time.time() >= next_publish:
+                next_publish += args.publish_interval
+                summaries = monitor.summaries()
+                latest["summaries"] = summaries
+                client.publish(METRICS_TOPIC, json.dumps({
+                    "window_seconds": args.window,
+                    "received_messages": monitor.received_messages,
+                    "dropped_samples": monitor.dropped_samples,
+                    "layer": summaries["layer"],
+                }), qos=0)
+                for device_name, metrics in summaries["device"].items():
+                    client.publish(f"{METRICS_TOPIC}/{device_name}", json.dumps(metrics), qos=0)
+    except KeyboardInterrupt:
+        client.loop_stop()
+        client.disconnect()
+        print("Exiting monitor...")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live rolling latency monitor")
+    parser.add_argument("--host", default=MQTT_BROKER_HOST)
+    parser.add_argument("--port", type=int, default=MQTT_BROKER_PORT)
+    parser.add_argument("--client-id", default="esn-latency-monitor")
+    parser.add_argument("--window", type=float, default=60, help="sliding window length in seconds")
+    parser.add_argument("--slots", type=int, default=6, help="sketches per sliding window")
+    parser.add_argument("--max-keys", type=int, default=20000)
+    parser.add_argument("--flush-interval", type=float, default=0.2)
+    parser.add_argument("--publish-interval", type=float, default=5)
+    parser.add_argument("--http-port", type=int, default=9108, help="0 disables the text endpoint")
+    main(parser.parse_args(sys.argv[1:]))
@@ -0,0 +1,157 @@
+import math
+import numpy as np
+
+# Relative-error quantile sketch with logarithmic buckets (DDSketch style).
+# Bucket i holds the values in (gamma^(i-1), gamma^i], so any quantile is
+# returned within RELATIVE_ACCURACY of its true value. The bucket arrays
+# have a fixed size, the memory does not depend on the number of samples,
+# and two sketches are merged by adding their bucket counts.
+
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 1e-3 # smallest tracked magnitude, smaller ones count as zero
+MAX_VALUE = 1e9  # largest tracked magnitude, larger ones go to the last bucket
+
+
+class LatencySketch:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, min_value=MIN_VALUE, max_value=MAX_VALUE):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._offset = self._raw_index(min_value)
+        n_buckets = self._raw_index(max_value) - self._offset + 1
+
+        # negative values (e.g. clock skew) are kept in a mirrored array
+        self._positive = np.zeros(n_buckets, dtype=np.int64)
+        self._negative = np.zeros(n_buckets, dtype=np.int64)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def clear(self):
+        # reset in place, the bucket arrays are reused
+        self._positive[:] = 0
+        self._negative[:] = 0
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _raw_index(self, value):
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _indices(self, magnitudes):
+        raw = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        return np.clip(raw - self._offset, 0, len(self._positive) - 1)
+
+    def _bucket_value(self, index):
+        # midpoint of the bucket, within relative_accuracy of every value in it
+        upper = self._gamma ** (index + self._offset)
+        return 2 * upper / (1 + self._gamma)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values >= self.min_value]
+        negative = -values[values <= -self.min_value]
+        self.zero_count += len(values) - len(positive) - len(negative)
+        n_buckets = len(self._positive)
+        if len(positive):
+            self._positive += np.bincount(self._indices(positive), minlength=n_buckets)
+        if len(negative):
+            self._negative += np.bincount(self._indices(negative), minlength=n_buckets)
+
+    def merge(self, other):
+        if (other.relative_accuracy, other.min_value, other.max_value) != (
+            self.relative_accuracy, self.min_value, self.max_value
+        ):
+            raise ValueError("Cannot merge sketches with different parameters")
+        self._positive += other._positive
+        self._negative += other._negative
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def mean(self):
+        return self.sum / self.count if self.count else math.nan
+
+    def _buckets(self):
+        """
+        Non-empty buckets in ascending value order, as (values, counts) arrays.
+        """
+        neg_idx = np.nonzero(self._negative)[0][::-1]
+        pos_idx = np.nonzero(self._positive)[0]
+        values = np.concatenate([
+            -self._bucket_value(neg_idx),
+            [0.0] if self.zero_count else [],
+            self._bucket_value(pos_idx),
+        ])
+        counts = np.concatenate([
+            self._negative[neg_idx],
+            [self.zero_count] if self.zero_count else [],
+            self._positive[pos_idx],
+        ])
+        return values, counts
+
+    def quantiles(self, qs):
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        if self.count == 0:
+            return np.full(len(qs), math.nan)
+        values, counts = self._buckets()
+        ranks = np.searchsorted(np.cumsum(counts), qs * (self.count - 1), side="right")
+        result = values[np.minimum(ranks, len(values) - 1)]
+        # the exact extremes are known, keep estimates within them
+        return np.clip(result, self.min, self.max)
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def summary(self):
+        p50, p90, p99 = self.quantiles([0.5, 0.9, 0.99])
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "min": self.min if self.count else math.nan,
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": self.max if self.count else math.nan,
+        }
+
+    def boxplot_stats(self, label=None, whis=1.5):
+        """
+        Statistics in the format expected by matplotlib's Axes.bxp. Fliers are
+        represented by one value per non-empty bucket outside the whiskers.
+        """
+        q1, med, q3 = self.quantiles([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        values, _ = self._buckets()
+        values = np.clip(values, self.min, self.max)
+        inside = values[(values >= q1 - whis * iqr) & (values <= q3 + whis * iqr)]
+        whislo = float(inside.min()) if len(inside) else q1
+        whishi = float(inside.max()) if len(inside) else q3
+        return {
+            "label": label,
+            "mean": self.mean(),
+            "med": med,
+            "q1": q1,
+            "q3": q3,
+            "whislo": whislo,
+            "whishi": whishi,
+            "fliers": values[(values < whislo) | (values > whishi)],
+        }
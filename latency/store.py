@@ -0,0 +1,107 @@
+import os
+import csv
+import sys
+
+# Columnar latency store. The exported <node_count>.csv files are converted
+# once into a Parquet dataset partitioned by node_count:
+#
+#   <store_path>/node_count=<n>/part-0.parquet
+#
+# Rows are sorted by (sensor_name, registered_at) and sensor_name is
+# dictionary-encoded, so a filter on sensor_name is pushed down to the row
+# group statistics and the analysis reads only the columns and sensors it needs.
+# pyarrow is imported by the functions that read or write the store, so
+# is_store() can be used on plain CSV directories without it.
+
+REQUIRED_COLUMNS = ['sensor_name', 'inference_latency', 'registered_at']
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def _list_csv_files(input_path):
+    csv_files = [f for f in os.listdir(input_path) if f.endswith('.csv') and f.replace('.csv', '').isdigit()]
+    csv_files.sort(key=lambda x: int(x.replace('.csv', '')))
+    return csv_files
+
+
+def is_store(path):
+    return os.path.isdir(path) and any(d.startswith('node_count=') for d in os.listdir(path))
+
+
+def ingest(input_path, store_path):
+    """
+    Converts every <node_count>.csv file of input_path into the store.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    for csv_file in _list_csv_files(input_path):
+        node_count = int(csv_file.replace('.csv', ''))
+        csv_path = os.path.join(input_path, csv_file)
+
+        # Ensure the required columns are present, read_csv only reports a
+        # missing include_columns entry as a generic ArrowInvalid
+        with open(csv_path, newline='') as f:
+            header = next(csv.reader(f), [])
+        if not set(REQUIRED_COLUMNS).issubset(header):
+            raise ValueError(f"The input CSV file {csv_file} must contain 'sensor_name', 'inference_latency', and 'registered_at' columns")
+
+        table = pa_csv.read_csv(
+            csv_path,
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=REQUIRED_COLUMNS,
+                column_types={'sensor_name': pa.string(), 'inference_latency': pa.int64(), 'registered_at': pa.string()},
+            ),
+        )
+
+        table = table.sort_by([('sensor_name', 'ascending'), ('registered_at', 'ascending')])
+        table = table.set_column(0, 'sensor_name', pc.dictionary_encode(table['sensor_name']))
+
+        partition_path = os.path.join(store_path, f'node_count={node_count}')
+        os.makedirs(partition_path, exist_ok=True)
+        pq.write_table(
+            table,
+            os.path.join(partition_path, 'part-0.parquet'),
+            row_group_size=ROW_GROUP_SIZE,
+            use_dictionary=['sensor_name'],
+            compression='zstd',
+        )
+        print(f"Ingested {csv_file}: {table.num_rows} rows")
+
+
+def load(store_path, columns=None, sensors=None, node_counts=None):
+    """
+    Reads the store into a pandas DataFrame with a node_count column. Only the
+    requested columns are read, and the sensor and node count filters are
+    pushed down to the partitions and row groups.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([('node_count', pa.int32())]), flavor='hive')
+    dataset = ds.dataset(store_path, format='parquet', partitioning=partitioning)
+
+    expression = None
+    if sensors is not None:
+        expression = pc.field('sensor_name').isin(list(sensors))
+    if node_counts is not None:
+        node_filter = pc.field('node_count').isin(list(node_counts))
+        expression = node_filter if expression is None else expression & node_filter
+
+    if columns is not None and 'node_count' not in columns:
+        columns = list(columns) + ['node_count']
+    table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas()
+
+
+def node_counts(store_path):
+    return sorted(int(d.split('=', 1)[1]) for d in os.listdir(store_path) if d.startswith('node_count='))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python3 store.py <csv_input_path> <store_path>")
+        sys.exit(1)
+    ingest(sys.argv[1], sys.argv[2])
@@ -0,0 +1,112 @@
+import os
+import sys
+import argparse
+import pandas as pd
+from sketch import LatencySketch
+
+# Streaming counterpart of latency.py: the per-node-count CSVs are read in
+# chunks and every (node_count, sensor_name) pair is summarized by a
+# mergeable quantile sketch, so memory stays constant whatever the input size.
+
+REQUIRED_COLUMNS = ['sensor_name', 'inference_latency', 'registered_at']
+CHUNK_SIZE = 100000
+
+
+def _list_csv_files(input_path):
+    csv_files = [f for f in os.listdir(input_path) if f.endswith('.csv') and f.replace('.csv', '').isdigit()]
+    csv_files.sort(key=lambda x: int(x.replace('.csv', '')))
+    return csv_files
+
+
+def stream_sketches(input_path, chunksize=CHUNK_SIZE, sensors=None):
+    """
+    Returns {(node_count, sensor_name): LatencySketch} with latencies in ms.
+    """
+    sketches = {}
+    for csv_file in _list_csv_files(input_path):
+        file_path = os.path.join(input_path, csv_file)
+        node_count = int(csv_file.replace('.csv', ''))
+
+        # Ensure the required columns are present
+        columns = pd.read_csv(file_path, nrows=0).columns
+        if not set(REQUIRED_COLUMNS).issubset(columns):
+            raise ValueError(f"The input CSV file {csv_file} must contain 'sensor_name', 'inference_latency', and 'registered_at' columns")
+
+        chunks = pd.read_csv(
+            file_path,
+            usecols=['sensor_name', 'inference_latency'],
+            dtype={'sensor_name': 'category', 'inference_latency': 'float64'},
+            chunksize=chunksize,
+        )
+        for chunk in chunks:
+            if sensors is not None:
+                chunk = chunk[chunk['sensor_name'].isin(sensors)]
+            for sensor_name, latencies in chunk.groupby('sensor_name', observed=True)['inference_latency']:
+                key = (node_count, sensor_name)
+                if key not in sketches:
+                    sketches[key] = LatencySketch()
+                # Convert inference_latency entries from us to ms
+                sketches[key].add(latencies.to_numpy() / 1000)
+    return sketches
+
+
+def merge_by_node_count(sketches):
+    merged = {}
+    for (node_count, _), sketch in sketches.items():
+        if node_count not in merged:
+            merged[node_count] = LatencySketch()
+        merged[node_count].merge(sketch)
+    return dict(sorted(merged.items()))
+
+
+def summary_table(sketches):
+    rows = []
+    for (node_count, sensor_name), sketch in sorted(sketches.items()):
+        rows.append({'node_count': node_count, 'sensor_name': sensor_name, **sketch.summary()})
+    return pd.DataFrame(rows)
+
+
+def plot_and_save_boxplot(node_sketches, output_path, filename='latency_boxplot_streaming.png'):
+    import matplotlib.pyplot as plt
+
+    stats = [sketch.boxplot_stats(label=str(node_count)) for node_count, sketch in node_sketches.items()]
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    ax.bxp(stats, showfliers=True, showmeans=False)
+
+    # Set the title and labels
+    ax.set_title('Inference Latency by Node Count')
+    ax.set_xlabel('Nodes in the Network')
+    ax.set_ylabel('Inference Latency (ms)')
+
+    # Add grid
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+    ax.yaxis.set_major_locator(plt.MaxNLocator(nbins=12))
+
+    fig.savefig(os.path.join(output_path, filename))
+    plt.close(fig)
+
+
+def main(input_path, output_path, sensors=None, chunksize=CHUNK_SIZE, plot=True):
+    sketches = stream_sketches(input_path, chunksize=chunksize, sensors=sensors)
+
+    # per (node_count, sensor) and per node_count quantile tables
+    summary_table(sketches).to_csv(os.path.join(output_path, 'latency_quantiles_by_sensor.csv'), index=False)
+    node_sketches = merge_by_node_count(sketches)
+    node_table = pd.DataFrame([{'node_count': n, **s.summary()} for n, s in node_sketches.items()])
+    node_table.to_csv(os.path.join(output_path, 'latency_quantiles.csv'), index=False)
+    print(node_table.to_string(index=False))
+
+    if plot and node_sketches:
+        plot_and_save_boxplot(node_sketches, output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming latency analysis with quantile sketches")
+    parser.add_argument("input_path", help="Path to the input directory")
+    parser.add_argument("output_path", help="Path to the output directory")
+    parser.add_argument("--sensor", action="append", dest="sensors", help="Only analyze this sensor (repeatable)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--no-plot", action="store_true")
+    args = parser.parse_args(sys.argv[1:])
+    main(args.input_path, args.output_path, sensors=args.sensors, chunksize=args.chunksize, plot=not args.no_plot)
@@ -1,6 +1,148 @@
+import numpy as np
+
+# Histogram-based summary statistics. The latencies of every node count are
+# binned in one pass into a 2-D array (node_count x bin), then the statistics
+# of all node counts are computed at once along the bin axis.
+
+
 def default_mean(data):
     return data.mean()
 
 def pondered_mean(data):
     return (data * data.index).sum() / data.sum()
 
+
+def linear_bins(min_value, max_value, n_bins):
+    return np.linspace(min_value, max_value, n_bins + 1)
+
+def log_bins(min_value, max_value, n_bins):
+    # latencies below min_value fall in the first bin
+    return np.geomspace(min_value, max_value, n_bins + 1)
+
+
+class LatencyHistograms:
+    """
+    counts[i, j]: number of latencies of node_counts[i] in [edges[j], edges[j + 1])
+    Values outside of the edges are clamped into the first and last bins, the
+    exact count, sum, min and max of each node count are kept alongside.
+    """
+
+    def __init__(self, node_counts, edges, counts, sums, mins, maxs):
+        self.node_counts = np.asarray(node_counts)
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = counts
+        self.sums = sums
+        self.mins = mins
+        self.maxs = maxs
+
+    @classmethod
+    def build(cls, node_counts, values, edges):
+        """
+        node_counts: one node count per row
+        values: one array of latencies per node count
+        """
+        edges = np.asarray(edges, dtype=np.float64)
+        n_rows, n_bins = len(node_counts), len(edges) - 1
+        lengths = np.array([len(v) for v in values])
+        flat = np.concatenate([np.asarray(v, dtype=np.float64) for v in values]) if n_rows else np.empty(0)
+        rows = np.repeat(np.arange(n_rows), lengths)
+
+        # single pass: every value is mapped to a cell of the 2-D histogram
+        bins = np.clip(np.searchsorted(edges, flat, side="right") - 1, 0, n_bins - 1)
+        counts = np.bincount(rows * n_bins + bins, minlength=n_rows * n_bins).reshape(n_rows, n_bins)
+
+        sums = np.bincount(rows, weights=flat, minlength=n_rows)
+        mins = np.full(n_rows, np.nan)
+        maxs = np.full(n_rows, np.nan)
+        non_empty = lengths > 0
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])[non_empty]
+        if len(starts):
+            mins[non_empty] = np.minimum.reduceat(flat, starts)
+            maxs[non_empty] = np.maximum.reduceat(flat, starts)
+        return cls(node_counts, edges, counts, sums, mins, maxs)
+
+    @classmethod
+    def from_dataframes(cls, node_counts, dataframes, edges, column='inference_latency'):
+        # node_counts are given, an empty frame gives an empty row rather than no node count
+        return cls.build(node_counts, [df[column].to_numpy() for df in dataframes], edges)
+
+    # --- statistics, one value per node count ---
+    def centers(self):
+        return (self.edges[:-1] + self.edges[1:]) / 2
+
+    def totals(self):
+        return self.counts.sum(axis=1)
+
+    def default_means(self):
+        # mean count per bin, same as default_mean over each histogram
+        return self.counts.mean(axis=1)
+
+    def means(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sums / self.totals()
+
+    def pondered_means(self, weights=None):
+        # bin values weighted by their counts, same as pondered_mean over each histogram
+        values = self.centers() if weights is None else np.asarray(weights, dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (self.counts * values).sum(axis=1) / self.totals()
+
+    def cdfs(self):
+        """
+        Cumulative distribution at the upper edge of every bin (node_count x bin).
+        """
+        cumulative = np.cumsum(self.counts, axis=1, dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return cumulative / cumulative[:, -1:]
+
+    def quantiles(self, qs):
+        """
+        Quantiles (node_count x q), linearly interpolated inside the bins.
+        """
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        n_bins = self.counts.shape[1]
+
+        # cdf over the edges, 0 at the lower edge of the first bin (node_count x edge)
+        cdfs = np.concatenate([np.zeros((len(self.counts), 1)), self.cdfs()], axis=1)
+
+        # first edge whose cdf reaches q, same as searchsorted(side="left") on every row
+        upper = np.clip((cdfs[:, :, None] < qs[None, None, :]).sum(axis=1), 1, n_bins)
+        lower = upper - 1
+        cdf_upper = np.take_along_axis(cdfs, upper, axis=1)
+        cdf_lower = np.take_along_axis(cdfs, lower, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = np.where(cdf_upper > cdf_lower, (qs - cdf_lower) / (cdf_upper - cdf_lower), 0.0)
+        result = self.edges[lower] + fraction * (self.edges[upper] - self.edges[lower])
+        result[self.totals() == 0] = np.nan
+        # the exact extremes are known, keep estimates within them
+        return np.clip(result, self.mins[:, None], self.maxs[:, None])
+
+    def boxplot_stats(self, labels=None, whis=1.5):
+        """
+        Statistics of every node count in the format expected by Axes.bxp.
+        """
+        labels = [str(n) for n in self.node_counts] if labels is None else labels
+        q1, med, q3 = self.quantiles([0.25, 0.5, 0.75]).T
+        iqr = q3 - q1
+        lo_bound, hi_bound = q1 - whis * iqr, q3 + whis * iqr
+        centers = self.centers()
+        means = self.means()
+
+        stats = []
+        for i, label in enumerate(labels):
+            occupied = centers[self.counts[i] > 0]
+            values = np.clip(occupied, self.mins[i], self.maxs[i])
+            inside = values[(values >= lo_bound[i]) & (values <= hi_bound[i])]
+            whislo = max(inside.min(), self.mins[i]) if len(inside) else q1[i]
+            whishi = min(inside.max(), self.maxs[i]) if len(inside) else q3[i]
+            stats.append({
+                "label": label,
+                "mean": means[i],
+                "med": med[i],
+                "q1": q1[i],
+                "q3": q3[i],
+                "whislo": whislo,
+                "whishi": whishi,
+                "fliers": values[(values < whislo) | (values > whishi)],
+            })
+        return stats